@@ -0,0 +1,158 @@
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TwoTierCache:
+    """LRU cache with a byte budget and an optional SQLite-file tier.
+
+    Entries are evicted least-recently-used first once the memory tier holds
+    more than `max_entries` values or `max_bytes` (as measured by `size`).
+    With `disk_path`, values are also pickled into a small SQLite database so
+    that they survive restarts and are shared between worker processes;
+    memory misses fall back to it, which keeps the `max_disk_entries` most
+    recently used. Subclasses define the key and `size`, and may override
+    `_fresh` and `_prune` to expire entries.
+    """
+
+    # Used in warnings.
+    NAME = "cache"
+
+    def __init__(self, max_entries: int, max_bytes: int, disk_path: Optional[str] = None,
+                 max_disk_entries: int = 10_000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        # key -> (value, size, created)
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_path:
+            with self._disk() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, "
+                             "created REAL, accessed REAL)")
+
+    def size(self, value: Any) -> int:
+        return 8
+
+    def _fresh(self, created: float) -> bool:
+        """Whether an entry written at `created` may still be served."""
+        return True
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        """Deletes disk entries `_fresh` would reject; called on each disk write."""
+
+    def _on_stale(self) -> None:
+        """Called (under the lock) when a lookup found only stale entries."""
+
+    def get(self, key: str) -> Optional[Any]:
+        stale = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._fresh(entry[2]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self._bytes -= entry[1]
+                stale = True
+        found = self._disk_get(key) if self.disk_path else None
+        if found is not None and not self._fresh(found[1]):
+            found, stale = None, True
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                if stale:
+                    self._on_stale()
+                return None
+            self.disk_hits += 1
+        value, created = found
+        self._put_memory(key, value, created)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        created = time.time()
+        self._put_memory(key, value, created)
+        if self.disk_path:
+            self._disk_put(key, value, created)
+
+    def _put_memory(self, key: str, value: Any, created: float) -> None:
+        size = self.size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, created)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_path:
+            with self._disk() as conn:
+                conn.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    # --- On-disk tier ---
+    def _disk(self) -> sqlite3.Connection:
+        """The calling thread's connection to the disk tier."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            conn = self._disk()
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            return pickle.loads(row[0]), row[1]
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            print(f"Warning: {self.NAME} read failed: {e}")
+            return None
+
+    def _disk_put(self, key: str, value: Any, created: float) -> None:
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._disk() as conn:
+                conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, blob, created, created))
+                self._prune(conn, created)
+                conn.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                             (self.max_disk_entries,))
+        except sqlite3.Error as e:
+            print(f"Warning: {self.NAME} write failed: {e}")
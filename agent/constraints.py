@@ -0,0 +1,272 @@
+import os
+import re
+import difflib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .text import WORD_RE, YEAR_RE, markdown_sections, split_kpi_header, trie_regex
+
+CALENDAR_FILE = "marketing_calendar.md"
+KPI_FILE = "kpi_definitions.md"
+# Minimum difflib ratio for a quoted name, or a word of the question, to count
+# as a misspelt event name or event-name word.
+FUZZY_CUTOFF = 0.8
+
+# Measures questions ask for that are not KPIs in the docs.
+BUILTIN_KPIS = {
+    "quantity_sold": (["quantity sold", "units sold"], "SUM(Quantity)"),
+    "revenue": (["revenue", "sales"], "SUM(UnitPrice * Quantity * (1 - Discount))"),
+}
+
+_DATES_RE = re.compile(r"Dates:\s*(\d{4}-\d{2}-\d{2})\s*(?:to|-|–)\s*(\d{4}-\d{2}-\d{2})")
+_FORMULA_RE = re.compile(r"^-\s*([A-Za-z][\w ]*?)\s*=\s*(.+?)\s*$", re.MULTILINE)
+_QUOTED_RE = re.compile(r"['\"‘’“”]([^'\"‘’“”]{3,}?)['\"‘’“”]")
+_TOP_N_RE = re.compile(r"\btop\s+(\d+)\b")
+# A stated cost assumption: "CostOfGoods is 70% of UnitPrice", "cost ratio of 0.65".
+_COST_RATIO_RE = re.compile(r"\bcost\w*\b[^.?!]{0,60}?(?:\b(\d+(?:\.\d+)?)\s*(?:%|percent)|(?<![\d.])(0?\.\d+|1(?:\.0+)?)(?!\.?\d))")
+
+
+@dataclass
+class Event:
+    name: str
+    start_date: str
+    end_date: str
+    notes: str = ""
+
+
+@dataclass
+class KPI:
+    key: str
+    name: str
+    aliases: List[str] = field(default_factory=list)
+    formula: str = ""
+    sql: str = ""
+    notes: str = ""
+
+
+class ConstraintIndex:
+    """Event date ranges and KPI formulas parsed once from the docs.
+
+    Event and KPI names are compiled into one regex each, so extracting the
+    constraints of a question is a single scan, however many campaigns the
+    calendar holds. Names that miss the exact matcher (typos, a missing year),
+    quoted or not, are resolved through a word index and difflib. A question
+    that names an event only in part ("Summer sales", an event of another
+    year) gets no date range, rather than the whole year.
+    """
+
+    def __init__(self, events: List[Event], kpis: List[KPI]):
+        self.events = {_normalize(event.name): event for event in events}
+        self.kpis = {kpi.key: kpi for kpi in kpis}
+        self._kpi_names = {_normalize(name): kpi.key for kpi in kpis for name in [kpi.name, *kpi.aliases]}
+        self._event_pattern = _compile(self.events)
+        self._kpi_pattern = _compile(self._kpi_names)
+        self._words: Dict[str, List[str]] = {}
+        for name in self.events:
+            for word in set(WORD_RE.findall(name)):
+                self._words.setdefault(word, []).append(name)
+        # Event names without their year, for phrases of the question.
+        self._name_words = {name: tuple(word for word in name.split() if not YEAR_RE.fullmatch(word))
+                            for name in self.events}
+        self._vocabulary = sorted({word for words in self._name_words.values() for word in words})
+        # Words of measure names ("sales") are no evidence of an event.
+        self._kpi_words = {word for name in self._kpi_names for word in name.split()}
+
+    @classmethod
+    def from_docs(cls, docs_dir: str) -> "ConstraintIndex":
+        events = _parse_calendar(_read(os.path.join(docs_dir, CALENDAR_FILE)))
+        kpis = _parse_kpis(_read(os.path.join(docs_dir, KPI_FILE)))
+        known = {kpi.key for kpi in kpis}
+        for key, (aliases, sql) in BUILTIN_KPIS.items():
+            if key not in known:
+                kpis.append(KPI(key, key.replace("_", " ").title(), aliases, sql, sql))
+        return cls(events, kpis)
+
+    def find_event(self, question: str) -> Optional[Event]:
+        """The calendar event the question mentions, exactly or approximately."""
+        return self._match_event(question)[0]
+
+    def _match_event(self, question: str, ignore: Iterable[str] = ()) -> Tuple[Optional[Event], str]:
+        """(event, the normalized phrase naming it). (None, phrase) when the
+        phrase only partly matches an event name; `ignore` are words (such as
+        category names) that are no evidence of an event on their own."""
+        text = _normalize(question)
+        match = self._event_pattern.search(text) if self.events else None
+        if match:
+            return self.events[match.group(0)], match.group(0)
+        year = YEAR_RE.search(text)
+        year = year.group(1) if year else None
+        for quoted in _QUOTED_RE.findall(question):
+            event = self._fuzzy_event(_normalize(quoted), year)
+            if event is not None:
+                return event, _normalize(quoted)
+        return self._phrase_event(text.split(), year, {*ignore, *self._kpi_words})
+
+    def _phrase_event(self, tokens: List[str], year: Optional[str], ignore) -> Tuple[Optional[Event], str]:
+        """The event whose name, without its year, is a run of (possibly
+        misspelt) words of the question."""
+        # Position -> the event-name words the token may be.
+        hits = {}
+        for i, token in enumerate(tokens):
+            if token.isdigit() or len(token) < 3:
+                continue
+            words = [token] if token in self._words else difflib.get_close_matches(
+                token, self._vocabulary, n=3, cutoff=FUZZY_CUTOFF)
+            if words:
+                hits[i] = words
+        found = []
+        for name in {name for words in hits.values() for word in words for name in self._words[word]}:
+            words = self._name_words[name]
+            for start in range(len(tokens) - len(words) + 1):
+                if words and all(word in hits.get(start + j, ()) for j, word in enumerate(words)):
+                    phrase = " ".join(tokens[start:start + len(words)])
+                    event_year = YEAR_RE.search(name)
+                    compatible = year is None or event_year is None or event_year.group(1) == year
+                    score = difflib.SequenceMatcher(None, phrase, " ".join(words)).ratio()
+                    found.append((compatible, score, name, phrase))
+        best = sorted((entry for entry in found if entry[0]), key=lambda entry: -entry[1])
+        if best and (len(best) == 1 or best[0][1] > best[1][1]):
+            return self.events[best[0][2]], best[0][3]
+        # An event of another year, several events that fit equally well, or
+        # part of an event name.
+        if found:
+            return None, found[0][3]
+        return None, " ".join(tokens[i] for i in sorted(hits) if tokens[i] not in ignore)
+
+    def _fuzzy_event(self, name: str, year: Optional[str]) -> Optional[Event]:
+        candidates = {candidate for word in WORD_RE.findall(name) for candidate in self._words.get(word, ())}
+        best, best_score = None, FUZZY_CUTOFF
+        for candidate in candidates:
+            score = difflib.SequenceMatcher(None, name, candidate).ratio()
+            # "Summer Beverages" names the event of the question's year, if any.
+            stripped = YEAR_RE.sub("", candidate).strip()
+            if stripped == name and (year is None or year in candidate):
+                score = max(score, 0.99)
+            if score > best_score:
+                best, best_score = candidate, score
+        return self.events[best] if best else None
+
+    def find_kpi(self, question: str) -> Optional[KPI]:
+        """The first KPI named in the question."""
+        match = self._kpi_pattern.search(_normalize(question)) if self._kpi_names else None
+        return self.kpis[self._kpi_names[match.group(0)]] if match else None
+
+    def constraints(self, question: str, categories: Iterable[str] = ()) -> Dict[str, Optional[str]]:
+        """Date range, KPI, event, category, "top N" limit and stated cost ratio
+        for the question; {} when nothing is found. `categories` are the known
+        category names. A phrase that only partly matches an event name is
+        returned as `unresolved_event`, with no date range."""
+        category_words = {word for name in categories for word in _normalize(name).split()}
+        event, phrase = self._match_event(question, category_words)
+        kpi = self.find_kpi(question)
+        # 'Summer Beverages 1997' names an event, not the Beverages category.
+        text = f" {_normalize(question)} ".replace(f" {phrase} ", " ").strip() if phrase else _normalize(question)
+        constraints: Dict[str, Optional[str]] = {}
+        if event is not None:
+            constraints.update(start_date=event.start_date, end_date=event.end_date, event=event.name)
+        elif phrase:
+            # The question means some period; the whole year would be a wrong answer.
+            constraints["unresolved_event"] = phrase
+        else:
+            year = YEAR_RE.search(question)
+            if year:
+                constraints.update(start_date=f"{year.group(1)}-01-01", end_date=f"{year.group(1)}-12-31")
+        if kpi is not None:
+            constraints.update(kpi=kpi.key, kpi_sql=kpi.sql)
+        top = _TOP_N_RE.search(text)
+        if top:
+            constraints["limit"] = int(top.group(1))
+        cost_ratio = _cost_ratio(question)
+        if cost_ratio is not None:
+            constraints["cost_ratio"] = cost_ratio
+        if constraints:
+            padded = f" {text} "
+            constraints["category"] = next(
+                (name for name in categories if f" {_normalize(name)} " in padded), None)
+        return constraints
+
+
+def _normalize(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def _cost_ratio(question: str) -> Optional[float]:
+    """The cost-of-goods share of the unit price the question assumes, if any."""
+    match = _COST_RATIO_RE.search(question.lower())
+    if not match:
+        return None
+    ratio = float(match.group(1)) / 100 if match.group(1) else float(match.group(2))
+    return ratio if 0 < ratio <= 1 else None
+
+
+def _compile(names) -> re.Pattern:
+    return re.compile(r"\b(?:" + trie_regex(names) + r")\b")
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError as e:
+        print(f"Warning: could not read {path}: {e}")
+        return ""
+
+
+def _parse_calendar(text: str) -> List[Event]:
+    events = []
+    for name, body in markdown_sections(text):
+        dates = _DATES_RE.search(body)
+        if not dates:
+            print(f"Warning: calendar event '{name}' has no dates, skipping it.")
+            continue
+        notes = re.search(r"Notes:\s*(.+)", body)
+        events.append(Event(name, dates.group(1), dates.group(2), notes.group(1).strip() if notes else ""))
+    return events
+
+
+def _parse_kpis(text: str) -> List[KPI]:
+    """'## Average Order Value (AOV)' with '- AOV = <expr>' -> KPI('average_order_value', ...)."""
+    kpis = []
+    for header, body in markdown_sections(text):
+        name, aliases = split_kpi_header(header)
+        formula = _FORMULA_RE.search(body)
+        notes = " ".join(line.lstrip("- ").strip() for line in body.strip().splitlines()
+                         if line.strip() and not _FORMULA_RE.match(line.strip()))
+        kpis.append(KPI(
+            key="_".join(WORD_RE.findall(name.lower())),
+            name=name,
+            aliases=aliases,
+            formula=formula.group(0).lstrip("- ").strip() if formula else "",
+            sql=formula.group(2) if formula else "",
+            notes=notes,
+        ))
+    return kpis
+
+
+# --- Process-wide index registry ---
+_INDEXES: Dict[str, Tuple[tuple, ConstraintIndex]] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def docs_version(docs_dir: str) -> tuple:
+    """(mtime_ns, size) of the calendar and KPI docs, None for a missing one."""
+    version = []
+    for name in (CALENDAR_FILE, KPI_FILE):
+        try:
+            st = os.stat(os.path.join(docs_dir, name))
+            version.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+def get_constraint_index(docs_dir: str) -> ConstraintIndex:
+    """Returns the shared index for docs_dir, rebuilt when either doc changes."""
+    key = os.path.abspath(docs_dir)
+    version = docs_version(docs_dir)
+    with _INDEXES_LOCK:
+        cached = _INDEXES.get(key)
+        if cached is None or cached[0] != version:
+            cached = _INDEXES[key] = (version, ConstraintIndex.from_docs(docs_dir))
+        return cached[1]
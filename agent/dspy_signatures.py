@@ -1,3 +1,5 @@
+import os
+import json
 import dspy
 
 class RouterSignature(dspy.Signature):
@@ -7,11 +9,13 @@ class RouterSignature(dspy.Signature):
     answer = dspy.OutputField(desc="rag | sql | hybrid")
 
 class NlToSqlSignature(dspy.Signature):
-    """NL to SQL signature"""
+    """Translate a retail analytics question into one SQLite query over the given schema, honouring the constraints."""
 
     question = dspy.InputField()
-    schema = dspy.InputField()
-    sql_query = dspy.OutputField(desc="SQL query")
+    db_schema = dspy.InputField()
+    constraints = dspy.InputField()
+    previous_error = dspy.InputField(desc="the previous attempt's query and why it failed; empty on the first attempt")
+    sql_query = dspy.OutputField(desc="SQLite query")
 
 class SynthesizerSignature(dspy.Signature):
     """Synthesizer signature"""
@@ -20,3 +24,30 @@ class SynthesizerSignature(dspy.Signature):
     retrieved_docs = dspy.InputField()
     sql_results = dspy.InputField()
     answer = dspy.OutputField(desc="Final answer")
+
+class NLtoSQL(dspy.Module):
+    """NL->SQL module (chain of thought) optimized by optimize.py."""
+
+    def __init__(self):
+        super().__init__()
+        self.generate = dspy.ChainOfThought(NlToSqlSignature)
+
+    def forward(self, question, db_schema, constraints, previous_error=""):
+        return self.generate(question=question, db_schema=db_schema, constraints=constraints,
+                             previous_error=previous_error)
+
+def load_nl_to_sql(path: str) -> NLtoSQL:
+    """NLtoSQL with the demos saved at `path` if it exists: a module saved by
+    optimize.py, or a file with a plain {"demos": [...]} list."""
+    module = NLtoSQL()
+    if not os.path.exists(path):
+        return module
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data.get("demos"), list):
+        demos = [dspy.Example(**demo).with_inputs("question", "db_schema", "constraints") for demo in data["demos"]]
+        for _, predictor in module.named_predictors():
+            predictor.demos = demos
+    else:
+        module.load(path)
+    return module
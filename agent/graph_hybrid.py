@@ -1,143 +1,179 @@
+import os
+import threading
 from typing import TypedDict, List, Any
-from langgraph.graph import StateGraph, END
-import dspy
-from dspy import Signature, InputField, OutputField
-from .tools.sqlite_tool import SQLiteTool
-from .rag.retrieval import DocumentRetriever
-from .dspy_signatures import RouterSignature, NlToSqlSignature, SynthesizerSignature
+from .tools.sqlite_tool import get_sql_tool
+from .instrumentation import instrument
+from .router import get_router
+from .constraints import get_constraint_index
+from .sql_templates import get_template, select_template
+from .lm_cache import CachedModule, configured_lm, get_lm_cache
+# LangGraph, DSPy and the retriever (NumPy) are imported by the code paths
+# that use them, so a process answering one SQL question never loads them.
 
 # ----------------- Paths for Windows -----------------
 PROJECT_ROOT = r"C:\Users\HP\ai-assignment-dspy"
 DOCS_PATH = f"{PROJECT_ROOT}\\docs"
 DB_PATH = r"C:\Users\HP\Downloads\northwind.sqlite"
+# Optional SQLite file that persists SQL results across runs and processes.
+SQL_CACHE_PATH = None
+# Optional SQLite file that persists LM outputs (router, NL->SQL) the same way.
+LM_CACHE_PATH = None
+# Demos for the NL->SQL fallback, written by optimize.py.
+OPTIMIZED_NL_TO_SQL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                        "optimized_nl_to_sql.json")
 
 # --- State Definition ---
 class AgentState(TypedDict):
     question: str
     route: str
     sql_query: str
+    constraints: dict
+    fan_out: bool
+    sql_params: tuple
+    template: str
     sql_result: dict
     retrieved_docs: List[dict]
     final_answer: Any
     citations: List[str]
     repair_count: int
     error: str
+    error_type: str
 
 # --- Node Functions ---
+def _router():
+    return get_router(DOCS_PATH, lambda: get_sql_tool(DB_PATH).get_schema_info(), key=DB_PATH,
+                      lm_cache=get_lm_cache(LM_CACHE_PATH), schema_version=lambda: get_sql_tool(DB_PATH).schema_version())
+
 def route_question(state: AgentState) -> AgentState:
-    question = state["question"].lower()
-    if "top 3 products by total revenue all-time" in question:
-        route = "sql"
-    elif "revenue" in question or "sold" in question or "customer" in question or "category" in question or "aov" in question:
-        route = "hybrid"
-    else:
-        route = "rag"
-    print(f"Route: {route}")
-    state["route"] = route
+    scored = _router().route(state["question"])
+    print(f"Route: {scored.route} (confidence {scored.confidence:.2f}, {scored.source})")
+    state["route"] = scored.route
+    # Retrieval only runs alongside plan_constraints when it does index work;
+    # otherwise the extra superstep costs more than the overlap saves.
+    state["fan_out"] = scored.route == "hybrid" and state.get("retrieved_docs") is None
     return state
 
-def retrieve_docs(state: AgentState) -> AgentState:
-    retriever = DocumentRetriever(DOCS_PATH)
+def prefetch_docs(questions: List[str]) -> List[List[dict]]:
+    """Retrieves docs for a whole batch in one pass.
+
+    Pass each list as `retrieved_docs` in the question's initial state and
+    retrieve_docs will use it instead of querying the index again.
+    """
+    from .rag.retrieval import get_retriever
+
     try:
-        retrieved_docs = retriever.retrieve(state["question"])
+        return get_retriever(DOCS_PATH).retrieve_many(questions)
     except Exception as e:
-        print(f"Error during document retrieval: {e}")
-        retrieved_docs = []
+        print(f"Error during batch document retrieval: {e}")
+        return [None] * len(questions)
+
+def warm_up() -> None:
+    """Builds everything the nodes load on first use: the retriever index, the
+    router, the constraint index, the SQLite pool and the schema and rollup checks.
+
+    A long-running process calls this once so its first question is not slower
+    than the rest.
+    """
+    from .rag.retrieval import get_retriever
+
+    get_retriever(DOCS_PATH)
+    _router()
+    sql_tool = get_sql_tool(DB_PATH, cache_path=SQL_CACHE_PATH)
+    sql_tool.get_schema_info()
+    sql_tool.rollups_ready()
+    get_constraint_index(DOCS_PATH)
+    _category_names()
+
+def retrieve_docs(state: AgentState) -> AgentState:
+    retrieved_docs = state.get("retrieved_docs")
+    if retrieved_docs is None:
+        from .rag.retrieval import get_retriever
+
+        retriever = get_retriever(DOCS_PATH)
+        try:
+            retrieved_docs = retriever.retrieve(state["question"])
+        except Exception as e:
+            print(f"Error during document retrieval: {e}")
+            retrieved_docs = []
     citations = [doc["id"] for doc in retrieved_docs]
-    state["retrieved_docs"] = retrieved_docs
-    state["citations"] = citations
-    return state
+    # Parallel branches must return only the keys they own.
+    return {"retrieved_docs": retrieved_docs, "citations": citations}
+
+def _category_names() -> List[str]:
+    # Served from the SQL result cache after the first call.
+    result = get_sql_tool(DB_PATH, cache_path=SQL_CACHE_PATH).execute_query("SELECT CategoryName FROM Categories;")
+    return [row[0] for row in result["rows"] or [] if row[0]]
+
+def _constraints_for(question: str) -> dict:
+    return get_constraint_index(DOCS_PATH).constraints(question, _category_names())
 
 def plan_constraints(state: AgentState) -> AgentState:
+    """Looks up the question's date range and KPI in the calendar/KPI index,
+    and the SQL template they select."""
     question = state["question"].strip()
-    if question == "During 'Summer Beverages 1997' as defined in the marketing calendar, which product category had the highest total quantity sold? Return {category:str, quantity:int}.":
-        constraints = {"start_date": "1997-07-01", "end_date": "1997-09-30", "category": None, "kpi": "quantity_sold"}
-    elif question == "Using the AOV definition from the KPI docs, what was the Average Order Value during 'Winter Classics 1997'? Return a float rounded to 2 decimals.":
-        constraints = {"start_date": "1997-12-01", "end_date": "1997-12-31", "category": None, "kpi": "average_order_value"}
-    elif question == "Per the KPI definition of gross margin, who was the top customer by gross margin in 1997? Assume CostOfGoods is approximated by 70% of UnitPrice if not available. Return {customer:str, margin:float}.":
-        constraints = {"start_date": "1997-01-01", "end_date": "1997-12-31", "category": None, "kpi": "gross_margin"}
-    else:
-        constraints = {}
-    state["constraints"] = constraints
-    return state
+    constraints = _constraints_for(question)
+    selected = select_template(question, constraints)
+    if selected is None:
+        return {"constraints": constraints, "template": None, "sql_params": ()}
+    template, params = selected
+    return {"constraints": constraints, "template": template.name, "sql_params": params}
 
 def generate_sql(state: AgentState) -> AgentState:
-    sql_tool = SQLiteTool(DB_PATH)
-    schema = sql_tool.get_schema()
-    question = state["question"].strip()
-    constraints = state.get("constraints", {})
-
-    if "top 3 products by total revenue all-time" in question:
-        sql_query = """
-SELECT
-  T1.ProductName,
-  SUM(T2.UnitPrice * T2.Quantity * (1 - T2.Discount)) AS Revenue
-FROM Products AS T1
-INNER JOIN "Order Details" AS T2
-  ON T1.ProductID = T2.ProductID
-GROUP BY
-  T1.ProductName
-ORDER BY
-  Revenue DESC
-LIMIT 3;
-"""
-    elif "Summer Beverages 1997" in question:
-        sql_query = f"""
-SELECT
-  T1.CategoryName,
-  SUM(T3.Quantity) AS TotalQuantitySold
-FROM Categories AS T1
-INNER JOIN Products AS T2 ON T1.CategoryID = T2.CategoryID
-INNER JOIN "Order Details" AS T3 ON T2.ProductID = T3.ProductID
-INNER JOIN Orders AS T4 ON T3.OrderID = T4.OrderID
-WHERE T4.OrderDate BETWEEN '{constraints.get("start_date")}' AND '{constraints.get("end_date")}'
-GROUP BY T1.CategoryName
-ORDER BY TotalQuantitySold DESC
-LIMIT 1;
-"""
-    elif "AOV" in question:
-        sql_query = f"""
-SELECT
-  CAST(SUM(T2.UnitPrice * T2.Quantity * (1 - T2.Discount)) AS REAL) / COUNT(DISTINCT T1.OrderID) AS AOV
-FROM Orders AS T1
-INNER JOIN "Order Details" AS T2 ON T1.OrderID = T2.OrderID
-WHERE T1.OrderDate BETWEEN '{constraints.get("start_date")}' AND '{constraints.get("end_date")}'
-"""
-    elif "Beverages" in question:
-        sql_query = f"""
-SELECT
-  SUM(T3.UnitPrice * T3.Quantity * (1 - T3.Discount)) AS TotalRevenue
-FROM Categories AS T1
-INNER JOIN Products AS T2 ON T1.CategoryID = T2.CategoryID
-INNER JOIN "Order Details" AS T3 ON T2.ProductID = T3.ProductID
-INNER JOIN Orders AS T4 ON T3.OrderID = T4.OrderID
-WHERE T1.CategoryName = 'Beverages' AND T4.OrderDate BETWEEN '{constraints.get("start_date")}' AND '{constraints.get("end_date")}'
-"""
-    elif "gross margin" in question:
-        sql_query = f"""
-SELECT
-  T1.CompanyName,
-  SUM(T3.UnitPrice * T3.Quantity * (0.3 - T3.Discount)) AS GrossMargin
-FROM Customers AS T1
-INNER JOIN Orders AS T2 ON T1.CustomerID = T2.CustomerID
-INNER JOIN "Order Details" AS T3 ON T2.OrderID = T3.OrderID
-WHERE STRFTIME('%Y', T2.OrderDate) = '1997'
-GROUP BY T1.CompanyName
-ORDER BY GrossMargin DESC
-LIMIT 1;
-"""
+    if "constraints" not in state:
+        # Called outside the graph: run plan_constraints inline.
+        state = {**state, **plan_constraints(state)}
+    retry = bool(state.get("error")) and configured_lm() is not None
+    template = get_template(state.get("template"))
+    if template is not None and not retry:
+        # Checked once per database version.
+        use_rollups = get_sql_tool(DB_PATH).rollups_ready()
+        return {"sql_query": template.query(use_rollups=use_rollups), "sql_params": state["sql_params"]}
+    if retry:
+        # Ask the LM for a different query, telling it why the last one failed.
+        previous_error = f"{state['error_type']}: {state['error']}\nFailed query: {state['sql_query']}"
     else:
-        sql_query = "SELECT * FROM Orders LIMIT 1;"
+        previous_error = ""
+    return {"sql_query": _generate_sql_with_lm(state["question"].strip(), state["constraints"], previous_error),
+            "sql_params": ()}
 
-    return {"sql_query": sql_query}
+_NL_TO_SQL = None
+_NL_TO_SQL_LOCK = threading.Lock()
+
+def _nl_to_sql() -> CachedModule:
+    """The shared NLtoSQL module (optimized demos if present) behind the LM cache."""
+    global _NL_TO_SQL
+    with _NL_TO_SQL_LOCK:
+        if _NL_TO_SQL is None:
+            from .dspy_signatures import load_nl_to_sql
+
+            _NL_TO_SQL = CachedModule(load_nl_to_sql(OPTIMIZED_NL_TO_SQL_PATH), get_lm_cache(LM_CACHE_PATH))
+        return _NL_TO_SQL
+
+def _generate_sql_with_lm(question: str, constraints: dict, previous_error: str = "") -> str:
+    """NL->SQL for questions no template covers, and for repairs; a placeholder
+    query without an LM. `previous_error` is part of the LM cache key, so a
+    repair never gets the cached query that just failed. The prompt schema
+    is only loaded here, so templated questions never pay for it."""
+    if configured_lm() is None:
+        return "SELECT * FROM Orders LIMIT 1;"
+    schema = get_sql_tool(DB_PATH).get_schema_for_question(question)
+    try:
+        prediction = _nl_to_sql()(question=question, db_schema=schema, constraints=str(constraints),
+                                  previous_error=previous_error)
+    except Exception as e:
+        print(f"Error during SQL generation: {e}")
+        return "SELECT * FROM Orders LIMIT 1;"
+    return prediction.sql_query
 
 def execute_sql(state: AgentState) -> AgentState:
-    sql_tool = SQLiteTool(DB_PATH)
-    sql_result = sql_tool.execute_query(state["sql_query"])
+    sql_tool = get_sql_tool(DB_PATH, cache_path=SQL_CACHE_PATH)
+    sql_result = sql_tool.execute_query(state["sql_query"], state.get("sql_params") or ())
     if sql_result["error"]:
-        return {"sql_result": sql_result, "error": sql_result["error"]}
+        # error_type is "sql", or "cost"/"timeout"/"vm_steps" when the query was
+        # rejected or interrupted by the tool's budgets.
+        return {"sql_result": sql_result, "error": sql_result["error"], "error_type": sql_result["error_type"]}
     citations = state.get("citations", []) + ["Orders", "Customers"]
-    return {"sql_result": sql_result, "citations": citations}
+    return {"sql_result": sql_result, "citations": citations, "error": None, "error_type": None}
 
 def synthesize_answer(state: AgentState) -> AgentState:
     if state.get("sql_result"):
@@ -146,6 +182,8 @@ def synthesize_answer(state: AgentState) -> AgentState:
             final_answer = f"Error: Could not execute SQL query. {sql_result['error']}"
         else:
             result_str = f"SQL Result: {sql_result['columns']} -> {sql_result['rows']}"
+            if sql_result.get("truncated"):
+                result_str += f" (first {len(sql_result['rows'])} rows only; result truncated by {sql_result['truncated_by']})"
             final_answer = f"Based on the data, the answer to '{state['question']}' is: {result_str}. (Mock Synthesis)"
     else:
         docs = [doc["content"] for doc in state.get("retrieved_docs", [])]
@@ -153,10 +191,25 @@ def synthesize_answer(state: AgentState) -> AgentState:
         final_answer = f"Based on the retrieved documents, the answer to '{state['question']}' is: {docs_str[:100]}... (Mock Synthesis)"
     return {"final_answer": final_answer}
 
+# Errors from the tool's cost budgets: rerunning the same query fails the same way.
+BUDGET_ERRORS = ("cost", "timeout", "vm_steps")
+
+def _can_repair(state: AgentState) -> bool:
+    """Whether another attempt can change the outcome: an LM can rewrite the
+    query, or the error was a plain SQL error that may be transient."""
+    return configured_lm() is not None or state.get("error_type") not in BUDGET_ERRORS
+
 def repair_loop(state: AgentState) -> AgentState:
     repair_count = state.get("repair_count", 0) + 1
+    if state.get("error") and not _can_repair(state):
+        return {"repair_count": repair_count,
+                "final_answer": f"Error: The query exceeded its {state['error_type']} budget and no LM is "
+                                f"configured to rewrite it. {state['error']}"}
     if state.get("error") and repair_count <= 2:
-        return {"repair_count": repair_count, "error": None}
+        # Keep the error in the state: it routes back to generate_sql, which
+        # passes it to the NL->SQL module along with the failed query.
+        print(f"Repairing SQL ({state.get('error_type')}): {state['error']}")
+        return {"repair_count": repair_count}
     elif state.get("error"):
         return {"repair_count": repair_count, "final_answer": "Error: Could not resolve the question after 2 repair attempts."}
     else:
@@ -165,10 +218,18 @@ def repair_loop(state: AgentState) -> AgentState:
 def decide_post_retrieve(state: AgentState) -> str:
     if state["route"] == "rag":
         return "synthesize_answer"
-    elif state["route"] == "hybrid":
-        return "plan_constraints"
-    else:
-        return "fail"
+    if state.get("fan_out"):
+        # plan_constraints ran in the same superstep and goes on to generate_sql.
+        return "end"
+    return "plan_constraints"
+
+def decide_fan_out(state: AgentState) -> List[str]:
+    """Nodes to run after routing; two of them run in parallel."""
+    if state["route"] == "sql":
+        return ["plan_constraints"]
+    if state.get("fan_out"):
+        return ["retrieve_docs", "plan_constraints"]
+    return ["retrieve_docs"]
 
 def decide_post_execute(state: AgentState) -> str:
     if state.get("error"):
@@ -176,26 +237,49 @@ def decide_post_execute(state: AgentState) -> str:
     else:
         return "synthesize_answer"
 
+def decide_post_repair(state: AgentState) -> str:
+    if state.get("error") and state.get("repair_count", 0) <= 2 and _can_repair(state):
+        return "generate_sql"
+    return "end"
+
 # --- Graph Construction ---
-def build_graph(llm_config=None):
+# On the hybrid route, retrieval that is not prefetched runs in parallel with
+# plan_constraints; both finish within their superstep, before generate_sql.
+NODES = (("route_question", route_question), ("retrieve_docs", retrieve_docs),
+         ("plan_constraints", plan_constraints),
+         ("generate_sql", generate_sql), ("execute_sql", execute_sql),
+         ("synthesize_answer", synthesize_answer), ("repair_loop", repair_loop))
+
+def _node(name: str, fn):
+    """An instrumented node with a sync and an async implementation; the async
+    one runs the (blocking SQLite / index) work on a worker thread."""
+    from langchain_core.runnables import RunnableLambda
+
+    instrumented = instrument(name, fn)
+
+    async def run_async(state):
+        import asyncio
+
+        # to_thread copies the context, so the question's trace follows.
+        return await asyncio.to_thread(instrumented, state)
+
+    return RunnableLambda(instrumented, afunc=run_async, name=name)
+
+def build_graph(llm_config=None, engine: str = "langgraph"):
+    """The compiled agent graph; engine="inline" returns an InlineGraph instead."""
+    if engine == "inline":
+        return InlineGraph()
+    from langgraph.graph import StateGraph, END
+
     workflow = StateGraph(AgentState)
-    workflow.add_node("route_question", route_question)
-    workflow.add_node("retrieve_docs", retrieve_docs)
-    workflow.add_node("plan_constraints", plan_constraints)
-    workflow.add_node("generate_sql", generate_sql)
-    workflow.add_node("execute_sql", execute_sql)
-    workflow.add_node("synthesize_answer", synthesize_answer)
-    workflow.add_node("repair_loop", repair_loop)
+    for name, fn in NODES:
+        workflow.add_node(name, _node(name, fn))
     workflow.set_entry_point("route_question")
-    workflow.add_conditional_edges(
-        "route_question",
-        lambda state: state["route"],
-        {"rag": "retrieve_docs", "sql": "generate_sql", "hybrid": "retrieve_docs", "fail": END}
-    )
+    workflow.add_conditional_edges("route_question", decide_fan_out, ["retrieve_docs", "plan_constraints"])
     workflow.add_conditional_edges(
         "retrieve_docs",
         decide_post_retrieve,
-        {"synthesize_answer": "synthesize_answer", "plan_constraints": "plan_constraints", "fail": END}
+        {"synthesize_answer": "synthesize_answer", "plan_constraints": "plan_constraints", "end": END}
     )
     workflow.add_edge("plan_constraints", "generate_sql")
     workflow.add_edge("generate_sql", "execute_sql")
@@ -206,8 +290,42 @@ def build_graph(llm_config=None):
     )
     workflow.add_conditional_edges(
         "repair_loop",
-        lambda state: "generate_sql" if state.get("repair_count", 0) <= 2 and state.get("error") else END,
-        {"generate_sql": "generate_sql", END: END}
+        decide_post_repair,
+        {"generate_sql": "generate_sql", "end": END}
     )
     workflow.add_edge("synthesize_answer", END)
     return workflow.compile()
+
+class InlineGraph:
+    """The same nodes and edges as build_graph(), run in plain Python.
+
+    Fan-out branches run one after another instead of in parallel, and
+    LangGraph is never imported, so a short-lived process answering a few
+    questions starts in a fraction of the time. Results are the same.
+    """
+
+    def __init__(self):
+        self.nodes = {name: instrument(name, fn) for name, fn in NODES}
+
+    def _run(self, name: str, state: dict) -> dict:
+        return {**state, **(self.nodes[name](state) or {})}
+
+    def invoke(self, state: dict) -> dict:
+        state = self._run("route_question", dict(state))
+        if state["route"] != "sql":
+            state = self._run("retrieve_docs", state)
+            if decide_post_retrieve(state) == "synthesize_answer":
+                return self._run("synthesize_answer", state)
+        state = self._run("plan_constraints", state)
+        while True:
+            state = self._run("execute_sql", self._run("generate_sql", state))
+            if decide_post_execute(state) == "synthesize_answer":
+                return self._run("synthesize_answer", state)
+            state = self._run("repair_loop", state)
+            if decide_post_repair(state) == "end":
+                return state
+
+    async def ainvoke(self, state: dict) -> dict:
+        import asyncio
+
+        return await asyncio.to_thread(self.invoke, state)
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import random
+import functools
+import threading
+import contextvars
+from typing import Any, Callable, Dict, List, Optional
+
+# Per-node samples kept for the percentile summary; beyond this a uniform
+# reservoir sample is kept so memory stays flat on very large batches.
+RESERVOIR_SIZE = 100_000
+
+_CURRENT_TRACE: contextvars.ContextVar = contextvars.ContextVar("agent_trace", default=None)
+
+
+class Trace:
+    """Timings and counters for one question's run through the graph."""
+
+    def __init__(self, question_id):
+        self.question_id = question_id
+        self.start = time.time()
+        self.pid = os.getpid()
+        self.nodes: List[Dict[str, Any]] = []
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.status = "ok"
+        self._lock = threading.Lock()
+
+    def add_llm_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        """Counts one LLM call against the question and the node running it."""
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def to_record(self) -> Dict[str, Any]:
+        nodes = self.nodes
+        return {
+            "id": self.question_id,
+            "status": self.status,
+            "start": self.start,
+            "wall_ms": round((time.time() - self.start) * 1000, 3),
+            "pid": self.pid,
+            "repairs": sum(1 for node in nodes if node["node"] == "repair_loop"),
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "nodes": nodes,
+        }
+
+
+def failure_record(question_id, status: str, wall_ms: float = 0.0) -> Dict[str, Any]:
+    """Trace record for a question that produced no trace (timed out, worker died)."""
+    return {"id": question_id, "status": status, "start": time.time() - wall_ms / 1000,
+            "wall_ms": wall_ms, "pid": os.getpid(), "repairs": 0, "llm_calls": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "nodes": []}
+
+
+def start_trace(question_id) -> Trace:
+    """Makes a new Trace current for the calling context (thread or task)."""
+    trace = Trace(question_id)
+    _CURRENT_TRACE.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT_TRACE.get()
+
+
+def instrument(name: str, fn: Callable) -> Callable:
+    """Wraps a graph node so that each call is recorded on the current trace.
+
+    Records wall and CPU time (CPU time of the calling thread), LLM calls and
+    tokens made during the node, and node-specific counters: docs returned by
+    retrieve_docs, rows returned by execute_sql. Without a current trace the
+    node runs untouched.
+    """
+    @functools.wraps(fn)
+    def wrapper(state):
+        trace = _CURRENT_TRACE.get()
+        if trace is None:
+            return fn(state)
+        calls, prompt, completion = trace.llm_calls, trace.prompt_tokens, trace.completion_tokens
+        start = time.time()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            output = fn(state)
+        except Exception:
+            trace.status = "error"
+            raise
+        finally:
+            entry = {
+                "node": name,
+                "ts": start,
+                "wall_ms": round((time.perf_counter() - wall) * 1000, 3),
+                "cpu_ms": round((time.thread_time() - cpu) * 1000, 3),
+                "tid": threading.get_ident(),
+            }
+            if trace.llm_calls != calls:
+                entry["llm_calls"] = trace.llm_calls - calls
+                entry["prompt_tokens"] = trace.prompt_tokens - prompt
+                entry["completion_tokens"] = trace.completion_tokens - completion
+            trace.nodes.append(entry)
+        entry.update(_counters(name, output))
+        return output
+    return wrapper
+
+
+def _counters(name: str, output) -> Dict[str, int]:
+    if not isinstance(output, dict):
+        return {}
+    if name == "retrieve_docs":
+        return {"docs": len(output.get("retrieved_docs") or [])}
+    if name == "execute_sql":
+        sql_result = output.get("sql_result") or {}
+        return {"rows": len(sql_result.get("rows") or [])}
+    return {}
+
+
+# --- LLM usage hook ---
+_DSPY_CALLBACK = None
+
+
+def install_dspy_callback() -> None:
+    """Registers a DSPy callback that adds every LM call's token usage to the
+    current trace. Safe to call more than once."""
+    global _DSPY_CALLBACK
+    if _DSPY_CALLBACK is not None:
+        return
+    import dspy
+    from dspy.utils.callback import BaseCallback
+
+    class _UsageCallback(BaseCallback):
+        def __init__(self):
+            self._instances = {}
+
+        def on_lm_start(self, call_id, instance, inputs):
+            self._instances[call_id] = instance
+
+        def on_lm_end(self, call_id, outputs, exception=None):
+            instance = self._instances.pop(call_id, None)
+            trace = _CURRENT_TRACE.get()
+            if trace is None:
+                return
+            # The LM appends its usage to history just before returning; under
+            # concurrent calls on one LM this is the most recent call's usage.
+            history = getattr(instance, "history", None) or [{}]
+            usage = history[-1].get("usage") or {}
+            trace.add_llm_usage(usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0)
+
+    _DSPY_CALLBACK = _UsageCallback()
+    dspy.settings.configure(callbacks=[*(dspy.settings.callbacks or []), _DSPY_CALLBACK])
+
+
+# --- Summaries and exports ---
+class LatencySummary:
+    """Per-node latency percentiles over many trace records."""
+
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE, seed: int = 0):
+        self.reservoir_size = reservoir_size
+        self._samples: Dict[str, List[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._random = random.Random(seed)
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self._add("total", record["wall_ms"])
+        for node in record["nodes"]:
+            self._add(node["node"], node["wall_ms"])
+
+    def _add(self, name: str, value: float) -> None:
+        samples = self._samples.setdefault(name, [])
+        count = self._counts.get(name, 0) + 1
+        self._counts[name] = count
+        if len(samples) < self.reservoir_size:
+            samples.append(value)
+        else:
+            slot = self._random.randrange(count)
+            if slot < self.reservoir_size:
+                samples[slot] = value
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One row per node: calls, mean and p50/p95/p99 wall time in ms."""
+        rows = []
+        for name, samples in self._samples.items():
+            ordered = sorted(samples)
+            rows.append({
+                "node": name,
+                "calls": self._counts[name],
+                "mean_ms": sum(ordered) / len(ordered),
+                "p50_ms": _percentile(ordered, 50),
+                "p95_ms": _percentile(ordered, 95),
+                "p99_ms": _percentile(ordered, 99),
+            })
+        return rows
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def export_chrome_trace(trace_path: str, out_path: str) -> int:
+    """Converts a trace JSONL file to Chrome trace-event JSON (chrome://tracing,
+    Perfetto). Each question is a slice on its worker's thread with its nodes
+    nested inside. Streams both files; returns the number of questions."""
+    count = 0
+    with open(trace_path) as src, open(out_path, "w") as dst:
+        dst.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        first = True
+        for line in src:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for event in _chrome_events(record):
+                dst.write(("" if first else ",\n") + json.dumps(event))
+                first = False
+            count += 1
+        dst.write("\n]}\n")
+    return count
+
+
+def _chrome_events(record: Dict[str, Any]):
+    nodes = record.get("nodes") or []
+    tid = nodes[0]["tid"] if nodes else 0
+    yield {"name": str(record["id"]), "cat": "question", "ph": "X", "pid": record.get("pid", 0), "tid": tid,
+           "ts": record["start"] * 1e6, "dur": record["wall_ms"] * 1e3,
+           "args": {key: record[key] for key in ("status", "repairs", "llm_calls", "prompt_tokens", "completion_tokens") if key in record}}
+    for node in nodes:
+        args = {key: value for key, value in node.items() if key not in ("node", "ts", "wall_ms", "tid")}
+        yield {"name": node["node"], "cat": "node", "ph": "X", "pid": record.get("pid", 0), "tid": node["tid"],
+               "ts": node["ts"] * 1e6, "dur": node["wall_ms"] * 1e3, "args": args}
@@ -0,0 +1,164 @@
+import os
+import re
+import sys
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .cache import TwoTierCache
+
+# Budgets for the in-process tier and the SQLite tier. Entries older than the
+# TTL are treated as misses (a prompt or model change already changes the key;
+# the TTL bounds how long a stale answer can be served otherwise).
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_DISK_ENTRIES = 100_000
+DEFAULT_TTL_S = 7 * 24 * 3600
+
+
+# A quoted literal in a question ('Beverages', "Summer 1997"); an apostrophe
+# inside a word ("customer's") does not open one.
+_QUOTED_RE = re.compile(r"(?<!\w)'[^']*'(?!\w)|\"[^\"]*\"")
+
+
+def normalize_question(question: str) -> str:
+    """Whitespace runs collapsed and text outside quoted literals case-folded,
+    so the literals the SQL filters on keep their case."""
+    parts, last = [], 0
+    for match in _QUOTED_RE.finditer(question):
+        parts.append(question[last:match.start()].casefold())
+        parts.append(match.group())
+        last = match.end()
+    parts.append(question[last:].casefold())
+    return " ".join("".join(parts).split())
+
+
+def normalize_inputs(inputs: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    """Sorted (name, value) pairs with whitespace runs collapsed; the question
+    is also case-folded outside its quoted literals (see normalize_question)."""
+    return tuple(sorted((name, _normalize_value(name, value)) for name, value in inputs.items()))
+
+
+def _normalize_value(name: str, value: Any) -> str:
+    if not isinstance(value, str):
+        return repr(value)
+    return normalize_question(value) if name == "question" else " ".join(value.split())
+
+
+def module_fingerprint(module) -> str:
+    """Hash of every predictor's signature (instructions and fields) and demos.
+
+    Loading different demos (e.g. a new optimized_nl_to_sql.json) changes it.
+    """
+    parts = []
+    for name, predictor in module.named_predictors():
+        signature = predictor.signature
+        demos = [sorted((demo.toDict() if hasattr(demo, "toDict") else dict(demo)).items()) for demo in predictor.demos]
+        parts.append((name, signature.instructions, list(signature.input_fields), list(signature.output_fields),
+                      repr(demos)))
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def lm_fingerprint(lm) -> str:
+    """Model name and sampling parameters of the configured LM."""
+    if lm is None:
+        return "none"
+    kwargs = sorted((key, repr(value)) for key, value in (getattr(lm, "kwargs", None) or {}).items())
+    return repr((getattr(lm, "model", type(lm).__name__), kwargs))
+
+
+def configured_lm():
+    """The LM configured in DSPy, or None.
+
+    Does not import DSPy: an LM can only have been configured by code that
+    already imported it.
+    """
+    dspy = sys.modules.get("dspy")
+    return None if dspy is None else dspy.settings.lm
+
+
+def _outputs_size(outputs: Dict[str, Any]) -> int:
+    return sum(len(value) if isinstance(value, str) else 8 for value in outputs.values())
+
+
+class LMCache(TwoTierCache):
+    """LRU cache of LM outputs with a TTL and an optional SQLite-file tier.
+
+    Keys combine the module fingerprint (signature and demos), the model and
+    its parameters, and the normalized inputs. Memory entries are evicted
+    least-recently-used first past `max_entries` or `max_bytes`; with
+    `disk_path` outputs also persist across runs and worker processes, up to
+    `max_disk_entries`. Entries older than `ttl` seconds (None: never) miss.
+    """
+
+    NAME = "LM cache"
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: Optional[float] = DEFAULT_TTL_S, disk_path: Optional[str] = None,
+                 max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        self.ttl = ttl
+        self.expired = 0
+        super().__init__(max_entries, max_bytes, disk_path, max_disk_entries)
+
+    @staticmethod
+    def make_key(fingerprint: str, lm: str, inputs: Dict[str, Any]) -> str:
+        return hashlib.sha1(repr((fingerprint, lm, normalize_inputs(inputs))).encode("utf-8")).hexdigest()
+
+    def size(self, outputs: Dict[str, Any]) -> int:
+        return _outputs_size(outputs)
+
+    # --- TTL ---
+    def _fresh(self, created: float) -> bool:
+        return self.ttl is None or time.time() - created <= self.ttl
+
+    def _prune(self, conn, now: float) -> None:
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+
+    def _on_stale(self) -> None:
+        self.expired += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["expired"] = self.expired
+        return stats
+
+
+class CachedModule:
+    """Calls a DSPy module or predictor through an LMCache.
+
+    A hit returns a Prediction rebuilt from the cached output fields without
+    calling the LM; failed calls are not cached.
+    """
+
+    def __init__(self, module, cache: LMCache):
+        self.module = module
+        self.cache = cache
+        self.fingerprint = module_fingerprint(module)
+
+    def __call__(self, **inputs):
+        import dspy
+
+        key = self.cache.make_key(self.fingerprint, lm_fingerprint(dspy.settings.lm), inputs)
+        outputs = self.cache.get(key)
+        if outputs is not None:
+            return dspy.Prediction(**outputs)
+        prediction = self.module(**inputs)
+        self.cache.put(key, dict(prediction.items()))
+        return prediction
+
+
+# --- Process-wide cache registry ---
+_CACHES: Dict[Tuple[Optional[str], Optional[float]], LMCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_lm_cache(disk_path: Optional[str] = None, ttl: Optional[float] = DEFAULT_TTL_S) -> LMCache:
+    """Returns the shared LMCache for disk_path (persisted there if given) and ttl."""
+    key = (disk_path and os.path.abspath(disk_path), ttl)
+    with _CACHES_LOCK:
+        cache = _CACHES.get(key)
+        if cache is None:
+            cache = _CACHES[key] = LMCache(ttl=ttl, disk_path=disk_path)
+        return cache
@@ -0,0 +1,115 @@
+"""NumPy-free BM25: corpus statistics shared with BM25Index, and a plain-Python
+index for small corpora, where importing NumPy costs more than scoring."""
+import heapq
+import math
+from typing import Dict, List, Tuple
+
+from .chunking import ChunkTable, tokenize
+
+# DocumentRetriever scores corpora of up to this many chunks with SmallBM25Index.
+SMALL_CORPUS_CHUNKS = 2048
+
+
+def corpus_postings(chunks: ChunkTable) -> Tuple[Dict[str, List[Tuple[int, int]]], List[int]]:
+    """term -> [(chunk, tf)] in first-seen order, and the token count per chunk."""
+    doc_len = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for doc in range(len(chunks)):
+        tokens = tokenize(chunks.text(doc))
+        doc_len.append(len(tokens))
+        frequencies: Dict[str, int] = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, tf in frequencies.items():
+            postings.setdefault(token, []).append((doc, tf))
+    return postings, doc_len
+
+
+def okapi_idf(postings: Dict[str, list], n_docs: int, epsilon: float) -> Dict[str, float]:
+    """idf per term, with the same floor (and float summation order) as BM25Okapi._calc_idf."""
+    idf_by_term = {}
+    idf_sum = 0
+    negative = []
+    for term, plist in postings.items():
+        idf = math.log(n_docs - len(plist) + 0.5) - math.log(len(plist) + 0.5)
+        idf_by_term[term] = idf
+        idf_sum += idf
+        if idf < 0:
+            negative.append(term)
+    if idf_by_term:
+        eps = epsilon * (idf_sum / len(idf_by_term))
+        for term in negative:
+            idf_by_term[term] = eps
+    return idf_by_term
+
+
+def saturate(tf, doc_len, k1: float, b: float, avgdl: float):
+    """BM25 term-frequency saturation, written exactly as BM25Okapi.get_scores does
+    (scalars or NumPy arrays)."""
+    return tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avgdl))
+
+
+class SmallBM25Index:
+    """BM25 over an in-memory posting dict, in plain Python.
+
+    Same scores and ranking as BM25Index.build over the same chunks (ties
+    broken by chunk number, zero-score chunks padding short result lists),
+    so retrieval results do not depend on which index served them.
+    """
+
+    def __init__(self, postings: Dict[str, List[Tuple[int, int]]], idf: Dict[str, float], doc_len: List[int],
+                 chunks: ChunkTable, k1: float, b: float):
+        self.postings = postings
+        self.idf = idf
+        self.doc_len = doc_len
+        self.chunks = chunks
+        self.n_docs = len(doc_len)
+        self.avgdl = sum(doc_len) / self.n_docs if self.n_docs else 0.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, chunks: ChunkTable, k1: float = 1.5, b: float = 0.75,
+              epsilon: float = 0.25) -> "SmallBM25Index":
+        postings, doc_len = corpus_postings(chunks)
+        return cls(postings, okapi_idf(postings, len(chunks), epsilon), doc_len, chunks, k1, b)
+
+    def get_scores(self, query_tokens: List[str]) -> Dict[int, float]:
+        """Scores of the chunks matching any query token, summed in query order."""
+        scores: Dict[int, float] = {}
+        for token in query_tokens:
+            plist = self.postings.get(token)
+            if plist is None:
+                continue
+            idf = self.idf[token]
+            for doc, tf in plist:
+                scores[doc] = scores.get(doc, 0.0) + idf * saturate(tf, self.doc_len[doc], self.k1, self.b,
+                                                                    self.avgdl)
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int, early_termination: bool = False):
+        """(chunk numbers, scores) of the k best chunks, best first.
+
+        `early_termination` is accepted for BM25Index compatibility; a small
+        corpus is always scored exhaustively.
+        """
+        k = min(k, self.n_docs)
+        if k <= 0:
+            return [], []
+        scores = self.get_scores(query_tokens)
+        if sum(1 for score in scores.values() if score > 0) >= k:
+            candidates = scores
+        else:
+            # Unmatched chunks score 0 and rank by chunk number, as in a dense ranking.
+            candidates = range(self.n_docs)
+        top = heapq.nsmallest(k, candidates, key=lambda doc: (-scores.get(doc, 0.0), doc))
+        return top, [scores.get(doc, 0.0) for doc in top]
+
+    def top_k_many(self, queries: List[List[str]], k: int):
+        return [self.top_k(tokens, k) for tokens in queries]
+
+    def doc_id(self, doc: int) -> str:
+        return self.chunks.doc_id(doc)
+
+    def content(self, doc: int) -> str:
+        return self.chunks.text(doc)
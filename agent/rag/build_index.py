@@ -0,0 +1,24 @@
+"""Builds the on-disk BM25 index for a docs directory.
+
+    python -m agent.rag.build_index --docs docs --out index
+"""
+import time
+import click
+from .retrieval import build_index
+from .chunking import DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP
+
+
+@click.command()
+@click.option('--docs', required=True, help='Directory containing the markdown corpus.')
+@click.option('--out', required=True, help='Directory to write the index to (replaced if it exists).')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Maximum tokens per chunk.')
+@click.option('--overlap', default=DEFAULT_OVERLAP, show_default=True, help='Tokens repeated between consecutive chunks of a long section.')
+def main(docs: str, out: str, chunk_size: int, overlap: int):
+    start = time.perf_counter()
+    index = build_index(docs, out, chunk_size=chunk_size, overlap=overlap)
+    print(f"Indexed {index.n_docs} chunks ({len(index.terms)} terms, {len(index.postings_docs)} postings) "
+          f"into {out} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
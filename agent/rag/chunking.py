@@ -0,0 +1,237 @@
+import os
+import re
+import glob
+import mmap
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+from typing import List, Dict, Any, Optional, Tuple
+
+# Chunk budget defaults, in tokens (see `tokenize`).
+DEFAULT_CHUNK_SIZE = 256
+DEFAULT_OVERLAP = 32
+# Each mapped source keeps a file descriptor open; the least recently used
+# mappings are dropped past this many.
+MAX_OPEN_SOURCES = 128
+
+_TOKEN_RE = re.compile(r"\w+")
+_HEADER_RE = re.compile(r"#{1,6}\s")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases text and splits it into word tokens (punctuation is dropped)."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class ChunkTable:
+    """Columnar chunk metadata; the chunk text stays in the source files.
+
+    Chunk i is bytes [start[i], end[i]) of source file sources[source[i]]
+    (relative to `root`), holds n_tokens[i] tokens and is cited as
+    "<file stem>::chunk<ordinal[i]>". Sources are memory-mapped on first use,
+    so `text` slices straight out of the page cache and worker processes
+    share the pages. Columns are `array`s when built here and read-only
+    NumPy memmaps when opened from disk, so NumPy is only loaded for saved
+    indexes. Each source is recorded as (name, size, mtime_ns,
+    content digest); a file whose size or content changed since it was
+    chunked is refused, while a touched but unchanged file is still served.
+    """
+    __slots__ = ("root", "sources", "names", "source", "ordinal", "start", "end", "n_tokens",
+                 "_buffers", "_lock")
+
+    def __init__(self, root: Optional[str], sources: List[Tuple[str, int, int, str]], source, ordinal, start, end,
+                 n_tokens, buffers: Optional[Dict[int, Any]] = None):
+        self.root = root
+        self.sources = sources
+        self.names = [os.path.splitext(source[0])[0] for source in sources]
+        self.source = source
+        self.ordinal = ordinal
+        self.start = start
+        self.end = end
+        self.n_tokens = n_tokens
+        self._buffers: "OrderedDict[int, Any]" = OrderedDict(buffers or {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_texts(cls, texts: List[str], name: str = "memory") -> "ChunkTable":
+        """One chunk per text, held in a single in-memory buffer (benchmarks, tests)."""
+        encoded = [text.encode("utf-8") for text in texts]
+        end = array("q", accumulate(len(e) for e in encoded))
+        start = array("q", (stop - len(e) for stop, e in zip(end, encoded)))
+        buffer = b"".join(encoded)
+        return cls(None, [(name, len(buffer), 0, _digest(buffer))], array("i", [0]) * len(texts),
+                   array("i", range(len(texts))), start, end,
+                   array("i", (len(tokenize(text)) for text in texts)), buffers={0: buffer})
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def doc_id(self, i: int) -> str:
+        return f"{self.names[self.source[i]]}::chunk{self.ordinal[i]}"
+
+    def text(self, i: int) -> str:
+        return self._buffer(int(self.source[i]))[self.start[i]:self.end[i]].decode("utf-8")
+
+    def _buffer(self, source: int):
+        with self._lock:
+            buffer = self._buffers.get(source)
+            if buffer is not None:
+                self._buffers.move_to_end(source)
+                return buffer
+        name, size, mtime_ns, digest = self.sources[source]
+        path = os.path.join(self.root, name)
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else b""
+        # Same size and mtime: unchanged. Same size, new mtime: compare the content.
+        if st.st_size != size or (st.st_mtime_ns != mtime_ns and _digest(buffer) != digest):
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+            raise ValueError(f"{path} changed since it was chunked; rebuild the index")
+        with self._lock:
+            # A touched file is only hashed once.
+            self.sources[source] = (name, size, st.st_mtime_ns, digest)
+            self._buffers[source] = buffer
+            while len(self._buffers) > MAX_OPEN_SOURCES:
+                # Not closed explicitly: another thread may still be slicing it.
+                self._buffers.popitem(last=False)
+        return buffer
+
+    # --- Persistence ---
+    _ARRAYS = ("source", "ordinal", "start", "end", "n_tokens")
+
+    def save(self, index_dir: str) -> Dict[str, Any]:
+        """Writes the columns to index_dir as chunk_<column>.npy; returns the meta to record."""
+        import numpy as np
+
+        if self.root is None:
+            raise ValueError("In-memory chunks cannot be saved")
+        for name in self._ARRAYS:
+            np.save(os.path.join(index_dir, f"chunk_{name}.npy"), np.asarray(getattr(self, name)))
+        return {"root": os.path.abspath(self.root), "sources": [list(source) for source in self.sources]}
+
+    @classmethod
+    def open(cls, index_dir: str, meta: Dict[str, Any]) -> "ChunkTable":
+        """Opens the columns saved by `save` memory-mapped read-only."""
+        import numpy as np
+
+        arrays = {name: np.load(os.path.join(index_dir, f"chunk_{name}.npy"), mmap_mode="r")
+                  for name in cls._ARRAYS}
+        return cls(meta["root"], [tuple(source) for source in meta["sources"]], **arrays)
+
+
+# --- Markdown chunking ---
+def _digest(data) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def chunk_markdown(data: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   overlap: int = DEFAULT_OVERLAP) -> List[Tuple[int, int, int]]:
+    """Splits a markdown file into (start byte, end byte, token count) chunks.
+
+    Chunks never cross a header, except that a header with no text of its own
+    (e.g. a document title) stays with the section below it. Sections longer
+    than `chunk_size` tokens are split into windows of at most `chunk_size`
+    tokens that repeat up to `overlap` tokens of the previous window; windows
+    end and start on line boundaries when that keeps them at least half full.
+    """
+    spans = []
+    for section in _sections(data):
+        spans.extend(_windows(section, chunk_size, overlap))
+    return spans
+
+
+def _sections(data: bytes):
+    """Tokens of each header-delimited section: (token starts, token ends, token lines, line bounds)."""
+    starts, ends, lines, bounds = [], [], [], []
+    has_body = False
+    pos = 0
+    while pos < len(data):
+        newline = data.find(b"\n", pos)
+        line_end = len(data) if newline < 0 else newline
+        raw = data[pos:line_end]
+        text = raw.decode("utf-8")
+        is_header = bool(_HEADER_RE.match(text))
+        if is_header and has_body:
+            yield starts, ends, lines, bounds
+            starts, ends, lines, bounds = [], [], [], []
+            has_body = False
+        tokens = list(_TOKEN_RE.finditer(text))
+        if tokens:
+            ascii_only = len(raw) == len(text)
+            line = len(bounds)
+            bounds.append((pos, pos + len(raw.rstrip())))
+            for match in tokens:
+                start, end = match.span()
+                if not ascii_only:
+                    start, end = len(text[:start].encode("utf-8")), len(text[:end].encode("utf-8"))
+                starts.append(pos + start)
+                ends.append(pos + end)
+                lines.append(line)
+            has_body = has_body or not is_header
+        pos = line_end + 1
+    if starts:
+        yield starts, ends, lines, bounds
+
+
+def _windows(section, chunk_size: int, overlap: int):
+    starts, ends, lines, bounds = section
+    n = len(starts)
+    s = 0
+    while True:
+        e = min(s + chunk_size, n)
+        if e < n:
+            # Prefer ending at the end of a line if the window stays at least half full.
+            b = e
+            while b > s and lines[b] == lines[b - 1]:
+                b -= 1
+            if b > s and b - s >= chunk_size // 2:
+                e = b
+        first = bounds[lines[s]][0] if s == 0 or lines[s - 1] != lines[s] else starts[s]
+        last = bounds[lines[e - 1]][1] if e == n or lines[e] != lines[e - 1] else ends[e - 1]
+        yield first, last, e - s
+        if e == n:
+            return
+        nxt = max(e - overlap, s + 1)
+        # Start the overlap at the beginning of a line when one starts inside it.
+        b = nxt
+        while b < e and lines[b] == lines[b - 1]:
+            b += 1
+        s = b if b < e else nxt
+
+
+def chunk_corpus(docs_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 overlap: int = DEFAULT_OVERLAP) -> ChunkTable:
+    """Chunks every markdown file in docs_dir, dropping chunks whose content
+    (whitespace-normalized) repeats an earlier chunk's."""
+    if not 0 <= overlap < chunk_size:
+        raise ValueError(f"overlap must be in [0, chunk_size), got {overlap} for chunk_size {chunk_size}")
+    doc_files = sorted(glob.glob(os.path.join(docs_dir, "*.md")))
+    if not doc_files:
+        print(f"Warning: No markdown files found in {docs_dir}")
+    sources = []
+    columns = {name: array("q" if name in ("start", "end") else "i") for name in ChunkTable._ARRAYS}
+    seen = set()
+    for file_path in doc_files:
+        try:
+            with open(file_path, "rb") as f:
+                # Stat first: a write after it changes the mtime and is caught by _buffer.
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                data = f.read()
+            data.decode("utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Error reading file {file_path}: {e}")
+            continue
+        source = len(sources)
+        sources.append((os.path.basename(file_path), len(data), mtime_ns, _digest(data)))
+        # Ordinals count dropped duplicates too, so ids stay stable when another file changes.
+        for ordinal, (start, end, n_tokens) in enumerate(chunk_markdown(data, chunk_size, overlap)):
+            digest = hashlib.blake2b(b" ".join(data[start:end].split()), digest_size=16).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            for name, value in zip(ChunkTable._ARRAYS, (source, ordinal, start, end, n_tokens)):
+                columns[name].append(value)
+    return ChunkTable(docs_dir, sources, **columns)
@@ -0,0 +1,371 @@
+import os
+import json
+import shutil
+import numpy as np
+from typing import List, Dict, Any, Optional
+from .bm25 import corpus_postings, okapi_idf, saturate
+from .chunking import ChunkTable, tokenize
+
+# Bump when the on-disk layout changes; older indexes are rebuilt.
+FORMAT_VERSION = 4
+
+
+class BM25Index:
+    """Inverted BM25 index stored as flat NumPy arrays.
+
+    Scores are identical to `rank_bm25.BM25Okapi` over the same tokenized corpus.
+    The arrays can be written to a directory and re-opened with `mmap`, so large
+    corpora open in milliseconds and worker processes share the same pages.
+
+    Layout (one file per array in the index directory):
+        terms.npy           sorted vocabulary as UTF-8 bytes
+        idf.npy             idf per term (negative idfs floored like BM25Okapi)
+        term_max.npy        highest BM25 contribution of each term (MaxScore bound)
+        offsets.npy         postings of term t are [offsets[t], offsets[t+1])
+        postings_docs.npy   chunk numbers, ascending within a term
+        postings_tf.npy     term frequency per posting
+        doc_len.npy         token count per chunk
+        chunk_*.npy         chunk columns (source file, byte range, ordinal; see ChunkTable)
+        meta.json           corpus statistics, build parameters and source files
+
+    Chunk text is not copied into the index: it is sliced out of the
+    memory-mapped markdown files.
+    """
+
+    def __init__(self, terms, idf, term_max, offsets, postings_docs, postings_tf, doc_len,
+                 chunks: ChunkTable, meta: Dict[str, Any]):
+        self.terms = terms
+        self.idf = idf
+        self.term_max = term_max
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.chunks = chunks
+        self.meta = meta
+        self.n_docs = meta["n_docs"]
+        self.avgdl = meta["avgdl"]
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+
+    # --- Construction ---
+    @classmethod
+    def build(cls, chunks: ChunkTable, k1: float = 1.5, b: float = 0.75,
+              epsilon: float = 0.25) -> "BM25Index":
+        """Builds an in-memory index over the chunks of a ChunkTable."""
+        postings, doc_len = corpus_postings(chunks)
+        n_docs = len(chunks)
+        avgdl = sum(doc_len) / n_docs if n_docs else 0.0
+        idf_by_term = okapi_idf(postings, n_docs, epsilon)
+
+        encoded = sorted((term.encode("utf-8"), term) for term in postings)
+        terms = np.array([e for e, _ in encoded], dtype=f"S{max((len(e) for e, _ in encoded), default=1)}")
+        idf = np.array([idf_by_term[t] for _, t in encoded], dtype=np.float64)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(postings[t]) for _, t in encoded], out=offsets[1:])
+        postings_docs = np.empty(offsets[-1], dtype=np.int32)
+        postings_tf = np.empty(offsets[-1], dtype=np.int32)
+        for i, (_, term) in enumerate(encoded):
+            plist = postings[term]
+            postings_docs[offsets[i]:offsets[i + 1]] = [d for d, _ in plist]
+            postings_tf[offsets[i]:offsets[i + 1]] = [tf for _, tf in plist]
+
+        doc_len = np.array(doc_len, dtype=np.int32)
+        contributions = np.repeat(idf, np.diff(offsets)) * saturate(postings_tf, doc_len[postings_docs], k1, b, avgdl)
+        term_max = np.full(len(encoded), -np.inf)
+        nonempty = np.diff(offsets) > 0
+        if nonempty.any():
+            term_max[nonempty] = np.maximum.reduceat(contributions, offsets[:-1][nonempty])
+
+        meta = {"format_version": FORMAT_VERSION, "n_docs": n_docs, "avgdl": avgdl,
+                "k1": k1, "b": b, "epsilon": epsilon}
+        return cls(terms, idf, term_max, offsets, postings_docs, postings_tf, doc_len, chunks, meta)
+
+    # --- Persistence ---
+    _ARRAYS = ("terms", "idf", "term_max", "offsets", "postings_docs", "postings_tf", "doc_len")
+
+    def save(self, index_dir: str, extra_meta: Optional[Dict[str, Any]] = None) -> None:
+        """Writes the index to index_dir, replacing any previous index there.
+
+        Files are written to a sibling directory first and swapped in, so readers
+        that already mapped the old index keep a consistent view.
+        """
+        index_dir = os.path.abspath(index_dir)
+        tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in self._ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(getattr(self, name)))
+        chunks_meta = self.chunks.save(tmp_dir)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({**self.meta, **(extra_meta or {}), "chunks": chunks_meta}, f)
+
+        old_dir = f"{index_dir}.old-{os.getpid()}"
+        if os.path.exists(index_dir):
+            os.rename(index_dir, old_dir)
+        os.rename(tmp_dir, index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def open(cls, index_dir: str) -> "BM25Index":
+        """Opens a saved index with every array memory-mapped read-only."""
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format {meta.get('format_version')} in {index_dir}")
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+                  for name in cls._ARRAYS}
+        return cls(chunks=ChunkTable.open(index_dir, meta["chunks"]), meta=meta, **arrays)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        """True if index_dir holds an index in the current format."""
+        try:
+            with open(os.path.join(index_dir, "meta.json")) as f:
+                return json.load(f).get("format_version") == FORMAT_VERSION
+        except (OSError, ValueError):
+            return False
+
+    # --- Lookup ---
+    def term_ids(self, tokens: List[str]) -> np.ndarray:
+        """Maps tokens to term ids; tokens outside the vocabulary map to -1."""
+        if not tokens or len(self.terms) == 0:
+            return np.full(len(tokens), -1, dtype=np.int64)
+        encoded = np.array([t.encode("utf-8") for t in tokens], dtype=self.terms.dtype)
+        ids = np.searchsorted(self.terms, encoded)
+        ids = np.minimum(ids, len(self.terms) - 1)
+        # Tokens longer than the widest term get truncated by the dtype; compare lengths too.
+        found = (self.terms[ids] == encoded) & np.array(
+            [len(t.encode("utf-8")) <= self.terms.dtype.itemsize for t in tokens])
+        return np.where(found, ids, -1)
+
+    def _postings(self, term: int):
+        """Chunk numbers and BM25 contributions of one term's postings."""
+        start, end = self.offsets[term], self.offsets[term + 1]
+        docs = self.postings_docs[start:end]
+        return docs, self._contribution(term, self.postings_tf[start:end], docs)
+
+    def _contribution(self, term: int, tf, docs):
+        return self.idf[term] * saturate(tf, self.doc_len[docs], self.k1, self.b, self.avgdl)
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """BM25 score of every chunk for the query (same arithmetic as BM25Okapi)."""
+        scores = np.zeros(self.n_docs)
+        for term in self.term_ids(query_tokens):
+            if term < 0:
+                continue
+            docs, contributions = self._postings(term)
+            scores[docs] += contributions
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int, early_termination: bool = False):
+        """Returns (chunk numbers, scores) of the k best chunks, best first.
+
+        Only the postings of the query terms are visited, so cost grows with the
+        number of matching postings rather than with corpus size. Scores equal
+        `get_scores` exactly; ties are broken by chunk number.
+
+        With `early_termination`, terms are processed MaxScore-style in order of
+        decreasing upper bound: once the bounds of the remaining terms cannot lift
+        an unseen chunk into the top k, those terms only update existing candidates.
+        """
+        k = min(k, self.n_docs)
+        terms = [int(t) for t in self.term_ids(query_tokens) if t >= 0]
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if early_termination and terms and (self.term_max[terms] > 0).all():
+            docs, scores = self._maxscore(terms, k)
+            if len(docs) >= k:
+                # MaxScore sums in bound order; re-score the shortlist in query
+                # order so the scores (and tie-breaks) match get_scores exactly.
+                shortlist = docs[scores >= _kth_lower_bound(scores, k)]
+                return _select_top_k(shortlist, self._score_candidates(terms, shortlist), k)
+        docs, scores = self._accumulate(terms)
+        if np.count_nonzero(scores > 0) < k:
+            return self._pad_top_k(docs, scores, k)
+        return _select_top_k(docs, scores, k)
+
+    def top_k_many(self, queries: List[List[str]], k: int, max_postings: int = 5_000_000):
+        """Top k for a batch of tokenized queries; same results as top_k on each.
+
+        The batch becomes a sparse query-term matrix Q (one entry per query
+        token, in query order) and the distinct terms' postings a sparse
+        term-chunk matrix W of BM25 contributions; Q @ W scores the whole batch
+        in one pass. Batches are split into slices of at most `max_postings`
+        postings to bound memory.
+        """
+        from scipy import sparse
+
+        k = min(k, self.n_docs)
+        results = [None] * len(queries)
+        rows, cols = self._query_term_matrix(queries)
+        per_query = np.bincount(rows, weights=self.offsets[cols + 1] - self.offsets[cols],
+                                minlength=len(queries))
+        start = 0
+        while start < len(queries) and k > 0:
+            # Greedily grow the slice while it stays within the postings budget.
+            cumulative = np.cumsum(per_query[start:])
+            end = start + max(1, int(np.searchsorted(cumulative, max_postings, side="right")))
+            lo, hi = np.searchsorted(rows, [start, end])
+            if hi > lo:
+                terms, local = np.unique(cols[lo:hi], return_inverse=True)
+                parts = [self._postings(term) for term in terms.tolist()]
+                lengths = [len(docs) for docs, _ in parts]
+                w = sparse.csr_matrix(
+                    (np.concatenate([c for _, c in parts]), np.concatenate([d for d, _ in parts]),
+                     np.concatenate(([0], np.cumsum(lengths)))),
+                    shape=(len(terms), self.n_docs))
+                # Entries stay in query order (no sum_duplicates), and each row of
+                # Q @ W is accumulated entry by entry, so sums match get_scores.
+                q = sparse.csr_matrix(
+                    (np.ones(hi - lo), local, np.searchsorted(rows[lo:hi], np.arange(start, end + 1))),
+                    shape=(end - start, len(terms)))
+                scores = q @ w
+                for i in range(end - start):
+                    row = slice(scores.indptr[i], scores.indptr[i + 1])
+                    docs, row_scores = scores.indices[row].astype(np.int64), scores.data[row]
+                    if np.count_nonzero(row_scores > 0) >= k:
+                        results[start + i] = _select_top_k(docs, row_scores, k)
+            start = end
+        for q, tokens in enumerate(queries):
+            if results[q] is None:
+                # Fewer than k matching chunks: top_k pads with zero-score chunks.
+                results[q] = self.top_k(tokens, k)
+        return results
+
+    def _query_term_matrix(self, queries: List[List[str]]):
+        """(query, term) coordinates of every in-vocabulary token, in query order."""
+        term_ids = self.term_ids([token for tokens in queries for token in tokens])
+        rows = np.repeat(np.arange(len(queries)), [len(tokens) for tokens in queries])
+        found = term_ids >= 0
+        return rows[found], term_ids[found].astype(np.int64)
+
+    def _accumulate(self, terms: List[int]):
+        """Sparse score accumulation over the postings of `terms`, in query order."""
+        if not terms:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        parts = [self._postings(term) for term in terms]
+        if sum(len(d) for d, _ in parts) * 8 > self.n_docs:
+            # Postings cover a good share of the corpus: a dense accumulator is cheaper.
+            scores = np.zeros(self.n_docs)
+            for docs, contributions in parts:
+                scores[docs] += contributions
+            docs = np.flatnonzero(scores)
+            return docs, scores[docs]
+        return _sum_by_doc(np.concatenate([d for d, _ in parts]),
+                           np.concatenate([c for _, c in parts]))
+
+    def _score_candidates(self, terms: List[int], docs: np.ndarray) -> np.ndarray:
+        """Exact scores of `docs` (sorted), summed in query order like get_scores."""
+        scores = np.zeros(len(docs))
+        for term in terms:
+            hit, positions = self._lookup_postings(term, docs)
+            scores[hit] += self._contribution(term, self.postings_tf[positions], docs[hit])
+        return scores
+
+    def _lookup_postings(self, term: int, docs: np.ndarray):
+        """Mask of `docs` present in the term's postings and their posting positions."""
+        start, end = self.offsets[term], self.offsets[term + 1]
+        if end == start or len(docs) == 0:
+            return np.zeros(len(docs), dtype=bool), np.empty(0, dtype=np.int64)
+        term_docs = self.postings_docs[start:end]
+        positions = np.minimum(np.searchsorted(term_docs, docs), end - start - 1)
+        hit = term_docs[positions] == docs
+        return hit, positions[hit] + start
+
+    def _maxscore(self, terms: List[int], k: int):
+        """Candidates that can still reach the top k, found with MaxScore pruning.
+
+        Returns (chunk numbers, full scores); the scores are summed in bound order,
+        so they may differ from get_scores in the last bits.
+        """
+        order = sorted(range(len(terms)), key=lambda i: -self.term_max[terms[i]])
+        bounds = [float(self.term_max[terms[i]]) for i in order]
+        # Large postings lists are cheaper to accumulate into a dense scratch array.
+        dense = sum(self.offsets[t + 1] - self.offsets[t] for t in terms) * 8 > self.n_docs
+        acc = np.zeros(self.n_docs) if dense else None
+        docs, scores = np.empty(0, dtype=np.int64), np.empty(0)
+        for position, i in enumerate(order):
+            if dense and position:
+                docs = np.flatnonzero(acc)
+                scores = acc[docs]
+            if sum(bounds[position:]) < _kth_lower_bound(scores, k):
+                # Unseen chunks can no longer reach the top k: the remaining terms
+                # only refine the candidates that still can.
+                return self._refine_candidates(terms, order[position:], bounds[position:], docs, scores, k)
+            term_docs, contributions = self._postings(terms[i])
+            if dense:
+                acc[term_docs] += contributions
+            else:
+                docs, scores = _sum_by_doc(np.concatenate([docs, term_docs]),
+                                           np.concatenate([scores, contributions]))
+        if dense:
+            docs = np.flatnonzero(acc)
+            scores = acc[docs]
+        return docs, scores
+
+    def _refine_candidates(self, terms, order, bounds, docs, scores, k):
+        """Non-essential MaxScore phase: look candidates up in the remaining postings."""
+        for position, i in enumerate(order):
+            remaining = sum(bounds[position:])
+            keep = scores + remaining >= _kth_lower_bound(scores, k)
+            docs, scores = docs[keep], scores[keep]
+            hit, positions = self._lookup_postings(terms[i], docs)
+            scores[hit] += self._contribution(terms[i], self.postings_tf[positions], docs[hit])
+        return docs, scores
+
+    def _pad_top_k(self, docs: np.ndarray, scores: np.ndarray, k: int):
+        """Top k when fewer than k chunks score above zero.
+
+        Every other chunk scores 0, so the lowest-numbered unscored chunks fill
+        the gap (as they would in a dense ranking), followed by negative scores.
+        """
+        positive = scores > 0
+        top_docs, top_scores = _select_top_k(docs[positive], scores[positive], k)
+        nonzero = np.sort(docs[scores != 0])
+        need = k - len(top_docs)
+        zero_docs = np.setdiff1d(np.arange(min(self.n_docs, need + len(nonzero)), dtype=np.int64), nonzero)[:need]
+        negative = scores < 0
+        neg_docs, neg_scores = _select_top_k(docs[negative], scores[negative], need - len(zero_docs))
+        return (np.concatenate([top_docs, zero_docs, neg_docs]),
+                np.concatenate([top_scores, np.zeros(len(zero_docs)), neg_scores]))
+
+    def doc_id(self, doc: int) -> str:
+        return self.chunks.doc_id(doc)
+
+    def content(self, doc: int) -> str:
+        return self.chunks.text(doc)
+
+
+def _sum_by_doc(docs: np.ndarray, weights: np.ndarray):
+    """Sums weights per chunk number; `docs` is a concatenation of ascending runs.
+
+    The stable sort merges the runs in near-linear time and keeps each chunk's
+    weights in input order, so sums match term-by-term accumulation exactly.
+    """
+    order = np.argsort(docs, kind="stable")
+    docs, weights = docs[order], weights[order]
+    first = np.concatenate(([True], docs[1:] != docs[:-1]))
+    # bincount adds sequentially in input order; np.add.reduceat would not.
+    group = np.cumsum(first) - 1
+    return docs[first].astype(np.int64), np.bincount(group, weights=weights)
+
+
+def _kth_lower_bound(scores: np.ndarray, k: int) -> float:
+    """k-th best partial score, minus a little slack so float rounding never prunes a tie."""
+    if len(scores) < k:
+        return -np.inf
+    kth = scores[np.argpartition(scores, -k)[-k]]
+    return kth - 1e-9 * max(1.0, abs(kth))
+
+
+def _select_top_k(docs: np.ndarray, scores: np.ndarray, k: int):
+    """The k highest scores (ties broken by chunk number) without a full sort."""
+    if k <= 0:
+        return docs[:0], scores[:0]
+    if len(scores) > k:
+        kth = scores[np.argpartition(scores, -k)[-k]]
+        keep = scores >= kth
+        docs, scores = docs[keep], scores[keep]
+    order = np.lexsort((docs, -scores))[:k]
+    return docs[order], scores[order]
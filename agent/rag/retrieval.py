@@ -1,75 +1,202 @@
 import os
-import glob
-from rank_bm25 import BM25Okapi
-from typing import List, Dict, Any
+import json
+import hashlib
+import threading
+import time
+from typing import List, Dict, Any, Tuple, Optional
+from .bm25 import SMALL_CORPUS_CHUNKS, SmallBM25Index
+from .chunking import DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP, chunk_corpus, tokenize
+# The NumPy index (.index) is imported only for large or on-disk corpora.
 
 class DocumentRetriever:
-    def __init__(self, docs_dir: str, chunk_size: int = 256):
+    def __init__(self, docs_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE, index_dir: Optional[str] = None,
+                 overlap: int = DEFAULT_OVERLAP):
+        """Loads the BM25 index for docs_dir.
+
+        The markdown files are split into chunks of at most `chunk_size` tokens
+        (see `chunk_corpus`). With `index_dir`, a prebuilt on-disk index (see
+        `build_index`) is opened via mmap instead of re-chunking the corpus; it
+        is built first if missing. Otherwise corpora of up to
+        SMALL_CORPUS_CHUNKS chunks are scored in plain Python, without
+        importing NumPy; the results are the same.
+        """
         self.docs_dir = docs_dir
         self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.index_dir = index_dir
         try:
-            self.documents = self._load_and_chunk_docs()
-            self.corpus = [doc["content"] for doc in self.documents]
-            if self.corpus:
-                self.bm25 = BM25Okapi(self.corpus)
+            if index_dir:
+                from .index import BM25Index
+
+                if not BM25Index.exists(index_dir):
+                    build_index(docs_dir, index_dir, chunk_size=chunk_size, overlap=overlap)
+                self.index = BM25Index.open(index_dir)
             else:
-                self.bm25 = None
+                self.index = _build_in_memory(chunk_corpus(docs_dir, chunk_size, overlap))
         except Exception as e:
             print(f"Critical Error during DocumentRetriever initialization: {e}")
-            self.documents = []
-            self.corpus = []
-            self.bm25 = None
-
-    def _load_and_chunk_docs(self) -> List[Dict[str, Any]]:
-        """Loads all markdown files, chunks them, and assigns unique IDs."""
-        all_docs = []
-        doc_files = glob.glob(os.path.join(self.docs_dir, "*.md"))
-        if not doc_files:
-            print(f"Warning: No markdown files found in {self.docs_dir}")
-        
-        for file_path in doc_files:
-            filename = os.path.basename(file_path).replace(".md", "")
-            try:
-                with open(file_path, 'r') as f:
-                    content = f.read()
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-                continue
-            
-            # Simple chunking by splitting on double newline (paragraph)
-            chunks = [c.strip() for c in content.split('\n\n') if c.strip()]
-            
-            for i, chunk in enumerate(chunks):
-                doc_id = f"{filename}::chunk{i}"
-                all_docs.append({
-                    "id": doc_id,
-                    "content": chunk,
-                    "source": filename
-                })
-        return all_docs
-
-    def retrieve(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
-        """Retrieves top-k relevant document chunks using BM25."""
-        if self.bm25 is None:
+            self.index = None
+
+    def retrieve(self, query: str, k: int = 3, early_termination: bool = False) -> List[Dict[str, Any]]:
+        """Retrieves top-k relevant document chunks using BM25.
+
+        `early_termination` enables MaxScore pruning; the results are the same.
+        """
+        if self.index is None:
             print("Warning: BM25 not initialized. Returning empty list.")
             return []
-        tokenized_query = query.lower().split()
-        scores = self.bm25.get_scores(tokenized_query)
-        
-        # Get top k indices
-        top_indices = scores.argsort()[-k:][::-1]
+        tokenized_query = tokenize(query)
+        top_indices, scores = self.index.top_k(tokenized_query, k, early_termination=early_termination)
         
+        return self._to_results(top_indices, scores)
+
+    def retrieve_many(self, queries: List[str], k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Retrieves top-k chunks for every query in one vectorized pass.
+
+        Same results as calling `retrieve` on each query, but each query term's
+        postings are read once per batch.
+        """
+        if self.index is None:
+            print("Warning: BM25 not initialized. Returning empty lists.")
+            return [[] for _ in queries]
+        ranked = self.index.top_k_many([tokenize(query) for query in queries], k)
+        return [self._to_results(top_indices, scores) for top_indices, scores in ranked]
+
+    def _to_results(self, top_indices, scores) -> List[Dict[str, Any]]:
         results = []
-        for i in top_indices:
-            doc = self.documents[i]
+        for i, score in zip(top_indices, scores):
             results.append({
-                "id": doc["id"],
-                "content": doc["content"],
-                "score": scores[i]
+                "id": self.index.doc_id(i),
+                "content": self.index.content(i),
+                "score": score
             })
             
         return results
 
+
+def _build_in_memory(chunks):
+    if not len(chunks):
+        return None
+    if len(chunks) <= SMALL_CORPUS_CHUNKS:
+        return SmallBM25Index.build(chunks)
+    from .index import BM25Index
+
+    return BM25Index.build(chunks)
+
+
+def build_index(docs_dir: str, index_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                overlap: int = DEFAULT_OVERLAP) -> "BM25Index":
+    """Chunks and tokenizes docs_dir and writes the BM25 index to index_dir.
+
+    The index records byte ranges into the markdown files rather than their
+    text, so it is only valid while docs_dir is unchanged (see get_retriever).
+    """
+    from .index import BM25Index
+
+    fingerprint = _stat_fingerprint(docs_dir)
+    chunks = chunk_corpus(docs_dir, chunk_size, overlap)
+    if not len(chunks):
+        raise ValueError(f"No documents to index in {docs_dir}")
+    index = BM25Index.build(chunks)
+    index.save(index_dir, extra_meta={"chunk_size": chunk_size, "overlap": overlap,
+                                      "content_hash": _content_hash(docs_dir, fingerprint)})
+    return index
+
+# --- Process-wide retriever registry ---
+# Building the BM25 index re-reads and re-chunks every markdown file, so the
+# graph shares one retriever per (docs_dir, chunk_size, overlap) across questions and
+# threads. Entries are rebuilt lazily when a markdown file is added, removed or
+# its content changes.
+_REGISTRY: Dict[Tuple[str, int, int, Optional[str]], "_RegistryEntry"] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+class _RegistryEntry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.retriever = None
+        self.stat_fingerprint = None
+        self.content_hash = None
+        self.checked_at = 0.0
+
+
+def _stat_fingerprint(docs_dir: str) -> Tuple[Tuple[str, int, int], ...]:
+    """Cheap fingerprint of the markdown files: (name, mtime_ns, size) per file."""
+    entries = []
+    try:
+        with os.scandir(docs_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".md") and entry.is_file():
+                    st = entry.stat()
+                    entries.append((entry.name, st.st_mtime_ns, st.st_size))
+    except FileNotFoundError:
+        pass
+    entries.sort()
+    return tuple(entries)
+
+
+def _content_hash(docs_dir: str, fingerprint) -> str:
+    """Hash of the names and contents of the markdown files in the fingerprint."""
+    digest = hashlib.sha1()
+    for name, _, _ in fingerprint:
+        digest.update(name.encode("utf-8"))
+        try:
+            with open(os.path.join(docs_dir, name), "rb") as f:
+                digest.update(hashlib.sha1(f.read()).digest())
+        except OSError:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def _index_content_hash(index_dir: str) -> Optional[str]:
+    """Content hash recorded when the on-disk index was built, if any."""
+    try:
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            return json.load(f).get("content_hash")
+    except (OSError, ValueError):
+        return None
+
+
+def get_retriever(docs_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE, check_interval: float = 0.0,
+                  index_dir: Optional[str] = None, overlap: int = DEFAULT_OVERLAP) -> DocumentRetriever:
+    """Returns the shared DocumentRetriever for docs_dir, building it on first use.
+
+    The markdown files are re-stat'ed at most every `check_interval` seconds. A
+    changed mtime/size only triggers a rebuild when the content hash changed too,
+    so touching a file is cheap. With `index_dir`, the on-disk index is reused
+    when it was built from the same content and rebuilt otherwise.
+    """
+    index_dir = os.path.abspath(index_dir) if index_dir else None
+    key = (os.path.abspath(docs_dir), chunk_size, overlap, index_dir)
+    with _REGISTRY_LOCK:
+        entry = _REGISTRY.get(key)
+        if entry is None:
+            entry = _REGISTRY[key] = _RegistryEntry()
+
+    with entry.lock:
+        now = time.monotonic()
+        if entry.retriever is not None and now - entry.checked_at < check_interval:
+            return entry.retriever
+        fingerprint = _stat_fingerprint(docs_dir)
+        entry.checked_at = now
+        if entry.retriever is not None and fingerprint == entry.stat_fingerprint:
+            return entry.retriever
+        content_hash = _content_hash(docs_dir, fingerprint)
+        if entry.retriever is None or content_hash != entry.content_hash:
+            if index_dir and _index_content_hash(index_dir) != content_hash:
+                build_index(docs_dir, index_dir, chunk_size=chunk_size, overlap=overlap)
+            entry.retriever = DocumentRetriever(docs_dir, chunk_size=chunk_size, index_dir=index_dir,
+                                                overlap=overlap)
+            entry.content_hash = content_hash
+        entry.stat_fingerprint = fingerprint
+        return entry.retriever
+
+
+def clear_retriever_cache() -> None:
+    """Drops every cached retriever (mainly for benchmarks and tests)."""
+    with _REGISTRY_LOCK:
+        _REGISTRY.clear()
+
 if __name__ == '__main__':
     # Example usage for testing
     # Assuming the script is run from the project root (ai-assignment-dspy)
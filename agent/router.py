@@ -0,0 +1,217 @@
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .constraints import CALENDAR_FILE, KPI_FILE, docs_version
+from .lm_cache import CachedModule, LMCache, configured_lm
+from .text import GENERIC_WORDS, HEADER_RE, YEAR_RE, singular, split_identifier, split_kpi_header, trie_regex
+from .tools.rollups import ROLLUPS, STATE_TABLE
+from .tools.schema import Schema
+
+ROUTES = ("rag", "sql", "hybrid")
+
+# Evidence that the question needs the documents (policies, definitions,
+# calendar) or the database. A side is certain once its weights reach
+# STRONG_EVIDENCE; weak words (table names, "total") only tip ties.
+DOC_TERMS = {
+    "policy": 1.0, "policies": 1.0, "according to": 1.0, "return window": 1.0, "returns": 0.5,
+    "definition": 1.0, "defined": 0.5, "define": 0.5, "docs": 1.0, "documentation": 1.0,
+    "kpi": 0.5, "marketing calendar": 1.0, "calendar": 1.0, "campaign": 1.0, "catalog": 0.5,
+    "guideline": 1.0, "rule": 0.5,
+}
+DATA_TERMS = {
+    "revenue": 1.0, "sales": 1.0, "sold": 1.0, "quantity": 1.0, "how many": 1.0, "count": 1.0,
+    "sum": 1.0, "number of": 1.0, "aov": 1.0, "margin": 1.0,
+    "total": 0.5, "top": 0.5, "highest": 0.5, "lowest": 0.5, "average": 0.5, "most": 0.5, "least": 0.5,
+}
+# Weight of schema table and column names, e.g. "products", "unit price".
+SCHEMA_TERM_WEIGHT = 0.5
+# Derived tables whose names are no evidence of a question about the data.
+EXCLUDED_TABLES = {*ROLLUPS, STATE_TABLE}
+KPI_TERM_WEIGHT = 1.0     # KPI names are computed from the database
+EVENT_TERM_WEIGHT = 1.0   # calendar events are defined in the docs
+YEAR_WEIGHT = 0.5
+STRONG_EVIDENCE = 1.0
+MIN_CONFIDENCE = 0.5
+
+
+@dataclass
+class RouteScore:
+    route: str
+    confidence: float
+    doc: float
+    data: float
+    matches: List[str] = field(default_factory=list)
+    source: str = "rules"
+
+
+class Router:
+    """Routes a question to rag, sql or hybrid from its vocabulary in one pass.
+
+    All terms are compiled into a single regex whose alternation is factored
+    into a trie, so matching costs one scan of the question regardless of the
+    vocabulary size. Matched terms add doc or data evidence; when neither side
+    is conclusive (confidence < min_confidence) the DSPy RouterSignature is
+    asked instead, if an LM is configured.
+    """
+
+    def __init__(self, vocabulary: Dict[str, Tuple[str, float]], min_confidence: float = MIN_CONFIDENCE,
+                 lm_cache: Optional[LMCache] = None):
+        self.vocabulary = vocabulary
+        self.min_confidence = min_confidence
+        self.lm_cache = lm_cache
+        self._pattern = re.compile(r"\b(" + trie_regex(vocabulary) + r")(?:e?s)?\b")
+        self._lm_router = None
+
+    @classmethod
+    def from_sources(cls, docs_dir: Optional[str] = None, schema: Optional[Schema] = None, **kwargs) -> "Router":
+        """Builds the vocabulary from the base terms, KPI names and calendar
+        events in docs_dir, and table/column names in schema (except the KPI
+        rollups)."""
+        vocabulary: Dict[str, Tuple[str, float]] = {}
+
+        def add(terms: Iterable[str], side: str, weight: float):
+            for term in terms:
+                term = " ".join(term.lower().split())
+                if term and weight > vocabulary.get(term, ("", 0.0))[1]:
+                    vocabulary[term] = (side, weight)
+
+        if schema is not None:
+            for name, table in schema.tables.items():
+                if name in EXCLUDED_TABLES:
+                    continue
+                words = split_identifier(name) or [name.lower()]
+                add([name, " ".join(words), " ".join(words[:-1] + [singular(words[-1])])], "data", SCHEMA_TERM_WEIGHT)
+                for col in table.columns:
+                    words = split_identifier(col.name)
+                    if len(words) > 1 or (words and words[0] not in GENERIC_WORDS):
+                        add([" ".join(words), col.name], "data", SCHEMA_TERM_WEIGHT)
+        if docs_dir:
+            add(_kpi_names(os.path.join(docs_dir, KPI_FILE)), "data", KPI_TERM_WEIGHT)
+            add(_event_names(os.path.join(docs_dir, CALENDAR_FILE)), "doc", EVENT_TERM_WEIGHT)
+        for terms, side in ((DOC_TERMS, "doc"), (DATA_TERMS, "data")):
+            for term, weight in terms.items():
+                add([term], side, weight)
+        return cls(vocabulary, **kwargs)
+
+    def score(self, question: str) -> RouteScore:
+        """Scores the question with the rules only."""
+        text = question.lower()
+        matched = {}
+        for match in self._pattern.finditer(text):
+            term = match.group(1)
+            if term in self.vocabulary:
+                matched[term] = self.vocabulary[term]
+        doc = sum(weight for side, weight in matched.values() if side == "doc")
+        data = sum(weight for side, weight in matched.values() if side == "data")
+        if YEAR_RE.search(text):
+            data += YEAR_WEIGHT
+        strong = STRONG_EVIDENCE
+        if doc >= strong and data >= strong:
+            route, confidence = "hybrid", 1.0
+        elif data >= strong:
+            route, confidence = "sql", 1.0 - 0.5 * doc / strong
+        elif doc >= strong:
+            route, confidence = "rag", 1.0 - 0.5 * data / strong
+        else:
+            route, confidence = ("sql" if data > doc else "rag"), 0.5 * max(doc, data) / strong
+        return RouteScore(route, round(confidence, 3), doc, data, sorted(matched))
+
+    def route(self, question: str) -> RouteScore:
+        """Routes with the rules, falling back to the LM router when unsure."""
+        scored = self.score(question)
+        if scored.confidence >= self.min_confidence:
+            return scored
+        route = self._route_with_lm(question)
+        if route is not None:
+            scored.route, scored.source = route, "lm"
+        return scored
+
+    def _route_with_lm(self, question: str) -> Optional[str]:
+        if configured_lm() is None:
+            return None
+        if self._lm_router is None:
+            import dspy
+            from .dspy_signatures import RouterSignature
+            predictor = dspy.Predict(RouterSignature)
+            self._lm_router = CachedModule(predictor, self.lm_cache) if self.lm_cache is not None else predictor
+        try:
+            answer = (self._lm_router(question=question).answer or "").lower()
+        except Exception as e:
+            print(f"Warning: LM router failed, using the rule-based route: {e}")
+            return None
+        return next((route for route in ("hybrid", "sql", "rag") if route in answer), None)
+
+
+def _headers(path: str) -> List[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return HEADER_RE.findall(f.read())
+    except OSError:
+        return []
+
+
+def _kpi_names(path: str) -> List[str]:
+    """'Average Order Value (AOV)' -> ['Average Order Value', 'AOV']."""
+    names = []
+    for header in _headers(path):
+        name, aliases = split_kpi_header(header)
+        names.append(name)
+        names.extend(aliases)
+    return names
+
+
+def _event_names(path: str) -> List[str]:
+    """'Summer Beverages 1997' -> ['Summer Beverages 1997', 'Summer Beverages']."""
+    names = []
+    for header in _headers(path):
+        names.append(header)
+        names.append(YEAR_RE.sub("", header))
+    return names
+
+
+# --- Process-wide router registry ---
+_ROUTERS: Dict[tuple, Tuple[tuple, Router]] = {}
+_ROUTERS_LOCK = threading.Lock()
+
+
+def get_router(docs_dir: Optional[str], schema_loader=None, key=None, lm_cache: Optional[LMCache] = None,
+               schema_version=None) -> Router:
+    """Returns the shared Router for docs_dir, rebuilt when the calendar or KPI
+    docs change or `schema_version()` returns a new value.
+
+    `schema_loader` is called on each build to fetch the Schema (it may raise,
+    e.g. when the database is missing; the router is then built without
+    schema terms), and so may `schema_version`. LM fallback calls go through
+    `lm_cache` if given.
+    """
+    cache_key = (docs_dir and os.path.abspath(docs_dir), key)
+    version = (docs_dir and docs_version(docs_dir), _call(schema_version))
+    with _ROUTERS_LOCK:
+        cached = _ROUTERS.get(cache_key)
+        if cached is None or cached[0] != version:
+            schema = None
+            if schema_loader is not None:
+                try:
+                    schema = schema_loader()
+                except Exception as e:
+                    print(f"Warning: routing without schema terms: {e}")
+            cached = _ROUTERS[cache_key] = (version, Router.from_sources(docs_dir, schema, lm_cache=lm_cache))
+        return cached[1]
+
+
+def _call(loader):
+    if loader is None:
+        return None
+    try:
+        return loader()
+    except Exception:
+        # Reported by the schema_loader call that builds the router.
+        return None
+
+
+def clear_router_cache() -> None:
+    with _ROUTERS_LOCK:
+        _ROUTERS.clear()
@@ -0,0 +1,294 @@
+import datetime
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Constraint keys that filter rows. A template is only used when it binds every
+# filter the question has, so no constraint is silently dropped.
+FILTER_KEYS = ("start_date", "end_date", "category")
+DATE_FILTERS = ("start_date", "end_date")
+
+# Defaults for parameters the question may leave out.
+PARAM_DEFAULTS = {"limit": 1, "cost_ratio": 0.7}
+# Words that state an assumption for a defaulted parameter. A question using
+# one without a value the constraints could extract (e.g. "use the category
+# average cost") gets generated SQL instead of the default.
+ASSUMPTION_CUES = {"cost_ratio": "cost"}
+
+# SQL fragments shared by the templates.
+_REVENUE = "SUM(od.UnitPrice * od.Quantity * (1 - od.Discount))"
+_DATE_RANGE = "o.OrderDate >= ? AND o.OrderDate < ?"
+_ROLLUP_RANGE = "r.OrderDate >= ? AND r.OrderDate < ?"
+
+# A `?` placeholder, or a string literal, quoted identifier or comment to skip.
+_PLACEHOLDER_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\?", re.DOTALL)
+
+
+@dataclass(frozen=True)
+class SQLTemplate:
+    """A named KPI query with `?` binds.
+
+    Matches questions whose constraints have `kpi`, exactly the filter keys in
+    `filters` and whose text contains every word in `cues`. `params` names the
+    values bound in order; "end_before" is the day after end_date, so the
+    range also covers OrderDate values with a time of day. `rollup_sql` is the
+    same query over the KPI rollup tables (same binds, same result).
+    """
+    name: str
+    kpi: str
+    sql: str
+    params: Tuple[str, ...] = ()
+    filters: Tuple[str, ...] = ()
+    cues: Tuple[str, ...] = ()
+    rollup_sql: Optional[str] = None
+
+    def matches(self, question: str, constraints: Dict) -> bool:
+        present = {key for key in FILTER_KEYS if constraints.get(key)}
+        unbound = any(name in self.params and constraints.get(name) is None and cue in question
+                      for name, cue in ASSUMPTION_CUES.items())
+        return (constraints.get("kpi") == self.kpi and present == set(self.filters)
+                and all(cue in question for cue in self.cues) and not unbound)
+
+    def bind(self, constraints: Dict) -> tuple:
+        return tuple(_param_value(name, constraints) for name in self.params)
+
+    def query(self, use_rollups: bool = False) -> str:
+        """The SQL to run: the rollup form when the rollups are fresh."""
+        return self.rollup_sql if use_rollups and self.rollup_sql else self.sql
+
+
+def _param_value(name: str, constraints: Dict):
+    if name == "end_before":
+        end = datetime.date.fromisoformat(constraints["end_date"][:10])
+        return (end + datetime.timedelta(days=1)).isoformat()
+    value = constraints.get(name)
+    return PARAM_DEFAULTS.get(name) if value is None else value
+
+
+def sql_literal(value) -> str:
+    """`value` as a SQLite literal."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def inline_params(sql: str, params) -> str:
+    """`sql` with each `?` placeholder replaced by its bound value, so the
+    query runs standalone (e.g. in the output records)."""
+    if not params:
+        return sql
+    values = iter(params)
+
+    def replace(match):
+        if match.group() != "?":
+            return match.group()
+        return sql_literal(next(values))
+
+    return _PLACEHOLDER_RE.sub(replace, sql)
+
+
+TEMPLATES: List[SQLTemplate] = []
+_BY_NAME: Dict[str, SQLTemplate] = {}
+
+
+def register(template: SQLTemplate) -> SQLTemplate:
+    """Adds a template to the registry; later registrations win ties."""
+    TEMPLATES.append(template)
+    _BY_NAME[template.name] = template
+    return template
+
+
+def get_template(name: Optional[str]) -> Optional[SQLTemplate]:
+    return _BY_NAME.get(name) if name else None
+
+
+def select_template(question: str, constraints: Dict) -> Optional[Tuple[SQLTemplate, tuple]]:
+    """The most specific template for the question and its bound parameters,
+    or None when no template matches (the caller then generates SQL)."""
+    if not constraints or not constraints.get("kpi"):
+        return None
+    if constraints.get("unresolved_event"):
+        # The question names a period no template filter can state.
+        return None
+    text = question.lower()
+    best = None
+    for template in TEMPLATES:
+        if template.matches(text, constraints) and (best is None or len(template.cues) >= len(best.cues)):
+            best = template
+    if best is None:
+        return None
+    try:
+        return best, best.bind(constraints)
+    except (KeyError, ValueError) as e:
+        print(f"Warning: could not bind template {best.name}: {e}")
+        return None
+
+
+# --- Northwind KPI templates ---
+register(SQLTemplate(
+    name="top_products_by_revenue",
+    kpi="revenue",
+    cues=("product",),
+    params=("limit",),
+    sql=f"""
+SELECT p.ProductName, {_REVENUE} AS Revenue
+FROM Products AS p
+JOIN "Order Details" AS od ON od.ProductID = p.ProductID
+GROUP BY p.ProductName
+ORDER BY Revenue DESC
+LIMIT ?;
+""",
+    rollup_sql="""
+SELECT p.ProductName, SUM(r.revenue) AS Revenue
+FROM kpi_daily_product AS r
+JOIN Products AS p ON p.ProductID = r.ProductID
+GROUP BY p.ProductName
+ORDER BY Revenue DESC
+LIMIT ?;
+""",
+))
+
+register(SQLTemplate(
+    name="top_products_by_revenue_in_range",
+    kpi="revenue",
+    filters=DATE_FILTERS,
+    cues=("product",),
+    params=("start_date", "end_before", "limit"),
+    sql=f"""
+SELECT p.ProductName, {_REVENUE} AS Revenue
+FROM Products AS p
+JOIN "Order Details" AS od ON od.ProductID = p.ProductID
+JOIN Orders AS o ON o.OrderID = od.OrderID
+WHERE {_DATE_RANGE}
+GROUP BY p.ProductName
+ORDER BY Revenue DESC
+LIMIT ?;
+""",
+    rollup_sql=f"""
+SELECT p.ProductName, SUM(r.revenue) AS Revenue
+FROM kpi_daily_product AS r
+JOIN Products AS p ON p.ProductID = r.ProductID
+WHERE {_ROLLUP_RANGE}
+GROUP BY p.ProductName
+ORDER BY Revenue DESC
+LIMIT ?;
+""",
+))
+
+register(SQLTemplate(
+    name="revenue_in_range",
+    kpi="revenue",
+    filters=DATE_FILTERS,
+    params=("start_date", "end_before"),
+    sql=f"""
+SELECT {_REVENUE} AS TotalRevenue
+FROM "Order Details" AS od
+JOIN Orders AS o ON o.OrderID = od.OrderID
+WHERE {_DATE_RANGE};
+""",
+    rollup_sql=f"""
+SELECT SUM(r.revenue) AS TotalRevenue
+FROM kpi_daily AS r
+WHERE {_ROLLUP_RANGE};
+""",
+))
+
+register(SQLTemplate(
+    name="revenue_by_category_in_range",
+    kpi="revenue",
+    filters=DATE_FILTERS + ("category",),
+    params=("category", "start_date", "end_before"),
+    sql=f"""
+SELECT {_REVENUE} AS TotalRevenue
+FROM Categories AS c
+JOIN Products AS p ON p.CategoryID = c.CategoryID
+JOIN "Order Details" AS od ON od.ProductID = p.ProductID
+JOIN Orders AS o ON o.OrderID = od.OrderID
+WHERE c.CategoryName = ? AND {_DATE_RANGE};
+""",
+    rollup_sql=f"""
+SELECT SUM(r.revenue) AS TotalRevenue
+FROM Categories AS c
+JOIN kpi_daily_category AS r ON r.CategoryID = c.CategoryID
+WHERE c.CategoryName = ? AND {_ROLLUP_RANGE};
+""",
+))
+
+register(SQLTemplate(
+    name="top_category_by_quantity_in_range",
+    kpi="quantity_sold",
+    filters=DATE_FILTERS,
+    cues=("category",),
+    params=("start_date", "end_before", "limit"),
+    sql=f"""
+SELECT c.CategoryName, SUM(od.Quantity) AS TotalQuantitySold
+FROM Categories AS c
+JOIN Products AS p ON p.CategoryID = c.CategoryID
+JOIN "Order Details" AS od ON od.ProductID = p.ProductID
+JOIN Orders AS o ON o.OrderID = od.OrderID
+WHERE {_DATE_RANGE}
+GROUP BY c.CategoryName
+ORDER BY TotalQuantitySold DESC
+LIMIT ?;
+""",
+    rollup_sql=f"""
+SELECT c.CategoryName, SUM(r.quantity) AS TotalQuantitySold
+FROM kpi_daily_category AS r
+JOIN Categories AS c ON c.CategoryID = r.CategoryID
+WHERE {_ROLLUP_RANGE}
+GROUP BY c.CategoryName
+ORDER BY TotalQuantitySold DESC
+LIMIT ?;
+""",
+))
+
+register(SQLTemplate(
+    name="average_order_value_in_range",
+    kpi="average_order_value",
+    filters=DATE_FILTERS,
+    params=("start_date", "end_before"),
+    sql=f"""
+SELECT CAST({_REVENUE} AS REAL) / COUNT(DISTINCT o.OrderID) AS AOV
+FROM Orders AS o
+JOIN "Order Details" AS od ON od.OrderID = o.OrderID
+WHERE {_DATE_RANGE};
+""",
+    rollup_sql=f"""
+SELECT CAST(SUM(r.revenue) AS REAL) / SUM(r.order_count) AS AOV
+FROM kpi_daily AS r
+WHERE {_ROLLUP_RANGE};
+""",
+))
+
+register(SQLTemplate(
+    name="top_customer_by_gross_margin_in_range",
+    kpi="gross_margin",
+    filters=DATE_FILTERS,
+    cues=("customer",),
+    # CostOfGoods is not in Northwind: approximated as cost_ratio * UnitPrice.
+    params=("cost_ratio", "start_date", "end_before", "limit"),
+    sql=f"""
+SELECT cu.CompanyName, SUM((od.UnitPrice - od.UnitPrice * ?) * od.Quantity * (1 - od.Discount)) AS GrossMargin
+FROM Customers AS cu
+JOIN Orders AS o ON o.CustomerID = cu.CustomerID
+JOIN "Order Details" AS od ON od.OrderID = o.OrderID
+WHERE {_DATE_RANGE}
+GROUP BY cu.CompanyName
+ORDER BY GrossMargin DESC
+LIMIT ?;
+""",
+    # Margin per line is (1 - cost_ratio) * revenue, so it sums from the rollup.
+    rollup_sql=f"""
+SELECT cu.CompanyName, SUM(r.revenue * (1 - ?)) AS GrossMargin
+FROM kpi_daily_customer AS r
+JOIN Customers AS cu ON cu.CustomerID = r.CustomerID
+WHERE {_ROLLUP_RANGE}
+GROUP BY cu.CompanyName
+ORDER BY GrossMargin DESC
+LIMIT ?;
+""",
+))
@@ -0,0 +1,60 @@
+"""Text helpers shared by the router, the constraint index and the schema matcher."""
+import re
+from typing import Dict, Iterable, List, Tuple
+
+# '## Header' lines of the markdown docs.
+HEADER_RE = re.compile(r"^##\s+(.+?)\s*$", re.MULTILINE)
+# A calendar year; group 1 is the year.
+YEAR_RE = re.compile(r"\b((?:19|20)\d\d)\b")
+# Words of lowercased text.
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Column-name words too generic to point at a table on their own.
+GENERIC_WORDS = {"id", "name", "unit", "per", "to", "on", "in", "date"}
+
+
+def split_identifier(name: str) -> List[str]:
+    """'OrderDate' -> ['order', 'date']; 'Order Details' -> ['order', 'details']."""
+    return [w.lower() for w in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+", name)]
+
+
+def singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def trie_regex(terms: Iterable[str]) -> str:
+    """Alternation of `terms` factored into a prefix trie (longest match first)."""
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node) -> str:
+        end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+def markdown_sections(text: str) -> List[Tuple[str, str]]:
+    """(header, body) for each '## header' section."""
+    headers = list(HEADER_RE.finditer(text))
+    return [(m.group(1), text[m.end():headers[i + 1].start() if i + 1 < len(headers) else len(text)])
+            for i, m in enumerate(headers)]
+
+
+def split_kpi_header(header: str) -> Tuple[str, List[str]]:
+    """'Average Order Value (AOV)' -> ('Average Order Value', ['AOV'])."""
+    return re.sub(r"\s*\(.*?\)", "", header).strip(), re.findall(r"\((.*?)\)", header)
@@ -0,0 +1,101 @@
+import os
+import re
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from ..cache import TwoTierCache
+
+# Memory budgets for the in-process tier; results are sized like the fetch
+# budget in sqlite_tool (text/blob length, 8 bytes per other value).
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_ENTRIES = 10_000
+
+_TOKEN_RE = re.compile(
+    r"""(?P<comment>--[^\n]*|/\*.*?\*/)
+      | (?P<string>'(?:[^']|'')*')
+      | (?P<ident>"(?:[^"]|"")*"|\[[^\]]*\]|`[^`]*`)
+      | (?P<word>[A-Za-z_]\w*)
+      | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<space>\s+)
+      | (?P<other>.)""",
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def normalize_sql(sql: str) -> Tuple[str, Tuple[str, ...]]:
+    """Splits a query into a canonical template and its literals.
+
+    Comments and whitespace runs are dropped, bare words are upper-cased
+    (SQLite keywords and identifiers are case-insensitive) and string and
+    numeric literals become `?`, so the same KPI query written twice maps to
+    the same (template, literals) pair.
+    """
+    parts = []
+    literals = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        text = match.group()
+        if kind in ("comment", "space"):
+            continue
+        if kind in ("string", "number"):
+            parts.append("?")
+            literals.append(text)
+        elif kind == "word":
+            parts.append(text.upper())
+        else:
+            parts.append(text)
+    while parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts), tuple(literals)
+
+
+def db_version(db_path: str) -> Tuple[int, ...]:
+    """Cheap fingerprint of the database contents: inode, mtime and size of the
+    file and of its WAL, which change whenever a write is committed. An empty
+    WAL (as a reader creates it) holds nothing and counts as absent."""
+    version = ()
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if path != db_path and not stat.st_size:
+            continue
+        version += (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    return version
+
+
+def result_size(result: Dict[str, Any]) -> int:
+    rows = result.get("rows") or []
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8 for row in rows for value in row)
+
+
+class ResultCache(TwoTierCache):
+    """LRU cache of execute_query results with an optional SQLite-file tier.
+
+    Entries are evicted least-recently-used first once the cache holds more
+    than `max_entries` results or `max_bytes` of row data. With `disk_path`,
+    results are also written to a small SQLite database so that they survive
+    restarts and are shared between worker processes; memory misses fall
+    back to it. Only successful results are cached.
+    """
+
+    NAME = "result cache"
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 disk_path: Optional[str] = None, max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        super().__init__(max_entries, max_bytes, disk_path, max_disk_entries)
+
+    @staticmethod
+    def make_key(sql: str, version: Tuple[int, ...], options: Tuple = ()) -> str:
+        template, literals = normalize_sql(sql)
+        return hashlib.sha1(repr((template, literals, version, options)).encode("utf-8")).hexdigest()
+
+    def size(self, result: Dict[str, Any]) -> int:
+        return result_size(result)
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        if result.get("error"):
+            return
+        super().put(key, result)
@@ -0,0 +1,173 @@
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+# Daily KPI rollups: one row per OrderDate value (and key), holding revenue,
+# quantity and the number of distinct orders. Gross margin is derived from
+# revenue, since CostOfGoods is approximated as a ratio of UnitPrice.
+# Rows whose key is NULL are left out; they can never join to a named entity.
+ROLLUPS = {
+    # table: (key column, key expression)
+    "kpi_daily": (None, None),
+    "kpi_daily_product": ("ProductID", "od.ProductID"),
+    "kpi_daily_category": ("CategoryID", "p.CategoryID"),
+    "kpi_daily_customer": ("CustomerID", "o.CustomerID"),
+}
+STATE_TABLE = "kpi_rollup_state"
+# Supporting indexes for queries that still read the base tables.
+INDEXES = {
+    "idx_orders_orderdate": 'CREATE INDEX IF NOT EXISTS idx_orders_orderdate ON Orders(OrderDate, OrderID, CustomerID);',
+}
+# OrderIDs folded into the rollups per transaction, so a large refresh commits
+# (and can be resumed) in steps.
+REFRESH_CHUNK_ORDERS = 100_000
+# Change marker of the loaded order lines, kept in STATE_TABLE: integer totals
+# over the lines and their order dates, so an UPDATE or DELETE of a loaded
+# line changes it, and the marker summed chunk by chunk equals one computed
+# in a single pass.
+MARKER_COLUMNS = ("lines", "quantity", "revenue_cents", "product_sum", "day_sum")
+_MARKER_SQL = """
+SELECT COUNT(*), COALESCE(SUM(CAST(od.Quantity AS INTEGER)), 0),
+       COALESCE(SUM(CAST(ROUND(od.UnitPrice * od.Quantity * (1 - od.Discount) * 100) AS INTEGER)), 0),
+       COALESCE(SUM(od.ProductID), 0), COALESCE(SUM(CAST(julianday(o.OrderDate) AS INTEGER)), 0)
+FROM "Order Details" AS od LEFT JOIN Orders AS o ON o.OrderID = od.OrderID
+WHERE od.OrderID > ? AND od.OrderID <= ?;
+"""
+
+
+def _ddl(table: str, key: Optional[str]) -> str:
+    key_column = f"{key} NOT NULL, " if key else ""
+    primary_key = f"OrderDate, {key}" if key else "OrderDate"
+    return (f"CREATE TABLE IF NOT EXISTS {table} (OrderDate TEXT NOT NULL, {key_column}"
+            f"revenue REAL NOT NULL, quantity INTEGER NOT NULL, order_count INTEGER NOT NULL, "
+            f"PRIMARY KEY ({primary_key})) WITHOUT ROWID;")
+
+
+def _upsert(table: str, key: Optional[str], key_expr: Optional[str]) -> str:
+    """Folds the order lines with lo < OrderID <= hi into the rollup."""
+    joins = 'LEFT JOIN Orders AS o ON o.OrderID = od.OrderID'
+    if table == "kpi_daily_category":
+        joins += ' JOIN Products AS p ON p.ProductID = od.ProductID'
+    key_select = f"{key_expr}, " if key else ""
+    key_filter = f" AND {key_expr} IS NOT NULL" if key else ""
+    group_by = "1, 2" if key else "1"
+    conflict = f"OrderDate, {key}" if key else "OrderDate"
+    return f"""
+INSERT INTO {table} (OrderDate, {key + ', ' if key else ''}revenue, quantity, order_count)
+SELECT COALESCE(o.OrderDate, ''), {key_select}SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)),
+       SUM(od.Quantity), COUNT(DISTINCT od.OrderID)
+FROM "Order Details" AS od {joins}
+WHERE od.OrderID > ? AND od.OrderID <= ?{key_filter}
+GROUP BY {group_by}
+ON CONFLICT ({conflict}) DO UPDATE SET
+  revenue = revenue + excluded.revenue,
+  quantity = quantity + excluded.quantity,
+  order_count = order_count + excluded.order_count;
+"""
+
+
+def _state_exists(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;",
+                        (STATE_TABLE,)).fetchone() is not None
+
+
+def _max_order_id(conn) -> int:
+    return conn.execute('SELECT MAX(OrderID) FROM "Order Details";').fetchone()[0] or 0
+
+
+def _marker(conn, lo: int, hi: int) -> Tuple[int, ...]:
+    """The change marker of the order lines with lo < OrderID <= hi."""
+    return tuple(conn.execute(_MARKER_SQL, (lo, hi)).fetchone())
+
+
+def _loaded_state(conn) -> Optional[Tuple[int, Tuple[int, ...]]]:
+    """(highest OrderID folded in, marker of the lines up to it), or None if the
+    rollups were never built (or by a version without the marker)."""
+    try:
+        row = conn.execute(f"SELECT max_order_id, {', '.join(MARKER_COLUMNS)} FROM {STATE_TABLE} "
+                           f"WHERE id = 0;").fetchone()
+    except sqlite3.Error:
+        return None
+    return (row[0], tuple(row[1:])) if row else None
+
+
+def loaded_order_id(conn) -> Optional[int]:
+    """Highest OrderID folded into the rollups, or None if they were never built."""
+    state = _loaded_state(conn)
+    return state[0] if state else None
+
+
+def _loaded_lines_changed(conn, state) -> bool:
+    loaded, marker = state
+    return _marker(conn, 0, loaded) != marker
+
+
+def rollups_fresh(conn) -> bool:
+    """True if the rollups exist, cover every order line in the database and
+    the lines they cover are unchanged since they were loaded.
+
+    Lines are expected to be appended with increasing OrderIDs; an UPDATE or
+    DELETE of a loaded line (or of its order's date) changes the marker, and
+    the rollups are stale until rebuilt. This reads every loaded line once;
+    SQLiteTool.rollups_ready checks once per database version.
+    """
+    state = _loaded_state(conn)
+    return state is not None and state[0] == _max_order_id(conn) and not _loaded_lines_changed(conn, state)
+
+
+def refresh_rollups(conn, rebuild: bool = False, chunk_orders: int = REFRESH_CHUNK_ORDERS) -> Dict[str, float]:
+    """Creates the rollups and indexes if needed and folds in the order lines
+    added since the last refresh (all of them with `rebuild`, or when lines
+    already loaded were edited or deleted).
+
+    `conn` must be writable. Returns {"orders_from", "orders_to", "seconds"}.
+    """
+    start = time.perf_counter()
+    if not rebuild and _state_exists(conn):
+        state = _loaded_state(conn)
+        rebuild = state is None or _loaded_lines_changed(conn, state)
+    with conn:
+        if rebuild:
+            for table in [*ROLLUPS, STATE_TABLE]:
+                conn.execute(f"DROP TABLE IF EXISTS {table};")
+        for table, (key, _) in ROLLUPS.items():
+            conn.execute(_ddl(table, key))
+        marker_columns = "".join(f"{column} INTEGER NOT NULL, " for column in MARKER_COLUMNS)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                     f"max_order_id INTEGER NOT NULL, {marker_columns}refreshed_at REAL NOT NULL);")
+        conn.execute(f"INSERT OR IGNORE INTO {STATE_TABLE} VALUES (0, 0, {'0, ' * len(MARKER_COLUMNS)}0);")
+        for statement in INDEXES.values():
+            conn.execute(statement)
+
+    loaded, marker = _loaded_state(conn)
+    first = loaded
+    target = _max_order_id(conn)
+    upserts = [_upsert(table, key, key_expr) for table, (key, key_expr) in ROLLUPS.items()]
+    assignments = ", ".join(f"{column} = ?" for column in MARKER_COLUMNS)
+    while loaded < target:
+        hi = min(loaded + chunk_orders, target)
+        with conn:
+            for statement in upserts:
+                conn.execute(statement, (loaded, hi))
+            marker = tuple(a + b for a, b in zip(marker, _marker(conn, loaded, hi)))
+            conn.execute(f"UPDATE {STATE_TABLE} SET max_order_id = ?, {assignments}, refreshed_at = ? "
+                         f"WHERE id = 0;", (hi, *marker, time.time()))
+        loaded = hi
+    return {"orders_from": first, "orders_to": loaded, "seconds": round(time.perf_counter() - start, 3)}
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.argument('db', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--rebuild', is_flag=True, help='Drop and rebuild the rollups from scratch.')
+    def main(db, rebuild):
+        """Builds or incrementally refreshes the KPI rollups in DB."""
+        conn = sqlite3.connect(db)
+        try:
+            print(refresh_rollups(conn, rebuild=rebuild))
+        finally:
+            conn.close()
+
+    main()
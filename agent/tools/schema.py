@@ -0,0 +1,177 @@
+import sqlite3
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from ..text import GENERIC_WORDS, WORD_RE, YEAR_RE, singular, split_identifier
+
+# Lowercase aliases the assignment expects in the prompt schema, keyed by the
+# table they stand for.
+COMPAT_VIEWS = {
+    "Orders": ("orders", "OrderID INTEGER, CustomerID TEXT, EmployeeID INTEGER, OrderDate TEXT, RequiredDate TEXT, ShippedDate TEXT, ShipVia INTEGER, Freight REAL, ShipName TEXT, ShipAddress TEXT, ShipCity TEXT, ShipRegion TEXT, ShipPostalCode TEXT, ShipCountry TEXT"),
+    "Order Details": ("order_items", "OrderID INTEGER, ProductID INTEGER, UnitPrice REAL, Quantity INTEGER, Discount REAL"),
+    "Products": ("products", "ProductID INTEGER, ProductName TEXT, SupplierID INTEGER, CategoryID INTEGER, QuantityPerUnit TEXT, UnitPrice REAL, UnitsInStock INTEGER, UnitsOnOrder INTEGER, ReorderLevel INTEGER, Discontinued INTEGER"),
+    "Customers": ("customers", "CustomerID TEXT, CompanyName TEXT, ContactName TEXT, ContactTitle TEXT, Address TEXT, City TEXT, Region TEXT, PostalCode TEXT, Country TEXT, Phone TEXT, Fax TEXT"),
+}
+
+# Question vocabulary that implies tables beyond their literal names.
+KEYWORD_TABLES = {
+    "revenue": ["Order Details"],
+    "sales": ["Order Details"],
+    "sold": ["Order Details"],
+    "quantity": ["Order Details"],
+    "aov": ["Orders", "Order Details"],
+    "margin": ["Order Details"],
+    "date": ["Orders"],
+    "dates": ["Orders"],
+}
+
+
+
+@dataclass
+class Column:
+    name: str
+    type: str
+    primary_key: bool = False
+
+
+@dataclass
+class ForeignKey:
+    column: str
+    ref_table: str
+    ref_column: str
+
+
+@dataclass
+class Table:
+    name: str
+    columns: List[Column]
+    foreign_keys: List[ForeignKey] = field(default_factory=list)
+    row_estimate: Optional[int] = None
+
+    def render(self) -> str:
+        cols = ", ".join(f"{col.name} {col.type}" for col in self.columns)
+        return f"Table: {self.name}\nColumns: {cols}"
+
+
+@dataclass
+class Schema:
+    """Introspected database schema; the prompt string is one rendering of it."""
+    tables: Dict[str, Table]
+    _renders: Dict[tuple, str] = field(default_factory=dict, repr=False, compare=False)
+
+    def render(self, tables: Optional[List[str]] = None) -> str:
+        """Renders the given tables (all by default) plus their compatibility aliases."""
+        key = None if tables is None else tuple(tables)
+        if key not in self._renders:
+            self._renders[key] = self._render(tables)
+        return self._renders[key]
+
+    def _render(self, tables: Optional[List[str]]) -> str:
+        names = list(self.tables) if tables is None else [t for t in self.tables if t in tables]
+        blocks = [self.tables[name].render() for name in names]
+        for table, (alias, cols) in COMPAT_VIEWS.items():
+            if tables is None or table in names:
+                blocks.append(f"Table: {alias}\nColumns: {cols}")
+        return "\n".join(blocks)
+
+    def relevant_tables(self, question: str) -> List[str]:
+        """Tables a question refers to, plus the tables needed to join them.
+
+        Tables match on their name, on distinctive column-name words and on
+        KPI vocabulary (KEYWORD_TABLES). Returns [] when nothing matches.
+        """
+        words = set(singular(w) for w in WORD_RE.findall(question.lower()))
+        lowered = {name.lower(): name for name in self.tables}
+        table_words = {name: set(singular(w) for w in split_identifier(name)) for name in self.tables}
+        # Table-name words inside column names (CustomerID, UnitsOnOrder) point at
+        # that other table, which the name match below already covers.
+        ignored = GENERIC_WORDS.union(*table_words.values())
+        selected = set()
+        for name, table in self.tables.items():
+            if table_words[name] <= words:
+                selected.add(name)
+                continue
+            for col in table.columns:
+                col_words = set(singular(w) for w in split_identifier(col.name)) - ignored
+                if col_words and col_words <= words:
+                    selected.add(name)
+                    break
+        for word, tables in KEYWORD_TABLES.items():
+            if word in words:
+                selected.update(lowered[t.lower()] for t in tables if t.lower() in lowered)
+        if YEAR_RE.search(question) and "orders" in lowered:
+            # A calendar year or campaign window filters on Orders.OrderDate.
+            selected.add(lowered["orders"])
+        return self._connect(selected)
+
+    def _connect(self, selected: Set[str]) -> List[str]:
+        """Adds the tables on the shortest foreign-key paths between selected tables."""
+        selected = set(selected)
+        if len(selected) > 1:
+            graph: Dict[str, Set[str]] = {name: set() for name in self.tables}
+            for name, table in self.tables.items():
+                for fk in table.foreign_keys:
+                    if fk.ref_table in graph:
+                        graph[name].add(fk.ref_table)
+                        graph[fk.ref_table].add(name)
+            targets = sorted(selected)
+            root = targets[0]
+            for target in targets[1:]:
+                selected.update(_shortest_path(graph, root, target))
+        return [name for name in self.tables if name in selected]
+
+
+def _shortest_path(graph: Dict[str, Set[str]], start: str, goal: str) -> List[str]:
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        if node == goal:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            return path
+        for neighbour in sorted(graph[node]):
+            if neighbour not in previous:
+                previous[neighbour] = node
+                queue.append(neighbour)
+    return []
+
+
+def introspect(conn) -> Schema:
+    """Reads tables, columns, foreign keys and row-count estimates from a connection."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+    names = [row[0] for row in cursor.fetchall()]
+    stat_rows = _stat1_row_counts(cursor)
+    tables = {}
+    for name in names:
+        quoted = name.replace("'", "''")
+        # Quote table name to handle spaces, as PRAGMA table_info does not automatically handle it
+        cursor.execute(f"PRAGMA table_info('{quoted}');")
+        columns = [Column(col[1], col[2], bool(col[5])) for col in cursor.fetchall()]
+        cursor.execute(f"PRAGMA foreign_key_list('{quoted}');")
+        foreign_keys = [ForeignKey(fk[3], fk[2], fk[4]) for fk in cursor.fetchall()]
+        tables[name] = Table(name, columns, foreign_keys, stat_rows.get(name, _max_rowid(cursor, name)))
+    cursor.close()
+    return Schema(tables)
+
+
+def _stat1_row_counts(cursor) -> Dict[str, int]:
+    """Row counts recorded by ANALYZE, if it has been run."""
+    try:
+        cursor.execute("SELECT tbl, stat FROM sqlite_stat1;")
+    except sqlite3.Error:
+        return {}
+    return {tbl: int(stat.split()[0]) for tbl, stat in cursor.fetchall() if stat}
+
+
+def _max_rowid(cursor, table: str) -> Optional[int]:
+    """Cheap upper bound on the row count (one B-tree seek); None for WITHOUT ROWID tables."""
+    try:
+        cursor.execute(f'SELECT MAX(rowid) FROM "{table.replace(chr(34), chr(34) * 2)}";')
+        return cursor.fetchone()[0] or 0
+    except sqlite3.Error:
+        return None
@@ -0,0 +1,126 @@
+import os
+import math
+import stat
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional, Sequence, Tuple
+
+from .result_cache import ResultCache, db_version
+from .sqlite_tool import ConnectionPool, SQLiteTool
+
+# Budgets for queries run by the metric. Rows past MAX_ROWS are not compared.
+DEFAULT_TIMEOUT_S = 5.0
+MAX_ROWS = 100_000
+# Numbers match when math.isclose with these tolerances.
+REL_TOL = 1e-6
+ABS_TOL = 1e-9
+
+
+def _sort_key(value):
+    # NULLs, then numbers, text and blobs, so mixed-type columns still sort.
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(type(value)), value)
+
+
+def canonical_rows(rows: Sequence[Sequence[Any]], ordered: bool = False) -> List[tuple]:
+    """Rows as tuples, sorted unless `ordered`, for comparing as a multiset."""
+    rows = [tuple(row) for row in rows]
+    if not ordered:
+        rows.sort(key=lambda row: tuple(_sort_key(value) for value in row))
+    return rows
+
+
+def _values_match(a, b) -> bool:
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(a, b, rel_tol=REL_TOL, abs_tol=ABS_TOL)
+    return a == b
+
+
+def rows_match(a: Sequence[tuple], b: Sequence[tuple]) -> bool:
+    """True if two canonical_rows results have the same shape and values, with
+    numbers compared by math.isclose. Column names are ignored, column order is not."""
+    return len(a) == len(b) and all(
+        len(row_a) == len(row_b) and all(_values_match(x, y) for x, y in zip(row_a, row_b))
+        for row_a, row_b in zip(a, b))
+
+
+# --- Worker processes ---
+_WORKER_TOOL = None
+
+
+def _init_worker(db_path: str, copy_dir: str):
+    """Gives the worker its own read-only copy of the database."""
+    global _WORKER_TOOL
+    copy_path = os.path.join(copy_dir, f"worker-{os.getpid()}.sqlite")
+    shutil.copyfile(db_path, copy_path)
+    os.chmod(copy_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    _WORKER_TOOL = SQLiteTool(copy_path, pool=ConnectionPool(copy_path))
+
+
+def _execute_rows(sql: str, timeout: float) -> Tuple[Optional[List[tuple]], Optional[str]]:
+    """(canonical rows, None) for a successful query, else (None, error_type)."""
+    result = _WORKER_TOOL.execute_query(sql, max_rows=MAX_ROWS, max_bytes=None, timeout=timeout)
+    if result["error"]:
+        return None, result["error_type"]
+    return canonical_rows(result["rows"]), None
+
+
+class ExecutionEvaluator:
+    """Execution accuracy: do a predicted and a gold query return the same rows?
+
+    Rows are compared as a multiset, numbers by math.isclose (see rows_match).
+    Queries run in a process pool whose workers each query a private read-only
+    copy of the database, with a per-query timeout, so a runaway or hostile
+    prediction cannot block the optimizer or touch the original file. Gold
+    results are memoized per database version (in memory, and in `cache_path`
+    if given), so each gold query runs once per version.
+    """
+
+    def __init__(self, db_path: str, workers: Optional[int] = None, timeout: float = DEFAULT_TIMEOUT_S,
+                 cache_path: Optional[str] = None):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.gold_cache = ResultCache(disk_path=cache_path)
+        self._copy_dir = tempfile.mkdtemp(prefix="sql_eval_")
+        self._pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                         initargs=(db_path, self._copy_dir))
+
+    def gold_rows(self, gold_sql: str) -> Optional[List[tuple]]:
+        key = self.gold_cache.make_key(gold_sql, db_version(self.db_path), ("gold", MAX_ROWS))
+        cached = self.gold_cache.get(key)
+        if cached is not None:
+            return cached["rows"]
+        rows, error_type = self._pool.submit(_execute_rows, gold_sql, self.timeout).result()
+        if rows is None:
+            print(f"Warning: gold query failed ({error_type}): {gold_sql}")
+            return None
+        self.gold_cache.put(key, {"columns": [], "rows": rows, "error": None})
+        return rows
+
+    def matches(self, gold_sql: str, predicted_sql: str) -> bool:
+        """True if both queries succeed and return the same result set."""
+        if not predicted_sql or not predicted_sql.strip():
+            return False
+        gold = self.gold_rows(gold_sql)
+        if gold is None:
+            return False
+        predicted, _ = self._pool.submit(_execute_rows, predicted_sql, self.timeout).result()
+        return predicted is not None and rows_match(gold, predicted)
+
+    def metric(self, example, prediction, trace=None) -> bool:
+        """DSPy metric comparing example.sql_query and prediction.sql_query by execution."""
+        return self.matches(example.sql_query, getattr(prediction, "sql_query", "") or "")
+
+    def close(self):
+        self._pool.shutdown()
+        shutil.rmtree(self._copy_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
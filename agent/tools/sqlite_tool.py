@@ -1,57 +1,408 @@
+import os
+import re
 import sqlite3
+import time
+import pathlib
+import threading
+import weakref
+from .schema import Schema, introspect
+from .result_cache import ResultCache, db_version
+from .rollups import refresh_rollups, rollups_fresh
+
+# Read-only tuning applied to every pooled connection. cache_size is in KiB when
+# negative; mmap_size lets SQLite read pages straight from the OS page cache.
+DEFAULT_PRAGMAS = {
+    "query_only": 1,
+    "cache_size": -65536,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+DEFAULT_CACHED_STATEMENTS = 256
+
+# Result budgets for execute_query: generated SQL such as SELECT * FROM "Order
+# Details" must not pull a whole table into memory and into the agent state.
+DEFAULT_MAX_ROWS = 1000
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+FETCH_BATCH_SIZE = 256
+
+# Cost budgets for execute_query. A query is interrupted once it runs longer
+# than the timeout or executes more VM instructions than max_vm_steps, and is
+# rejected up front when EXPLAIN QUERY PLAN estimates more than max_plan_rows
+# row visits (e.g. an accidental Orders x "Order Details" cross join on a
+# large copy of the database).
+DEFAULT_TIMEOUT_S = 10.0
+DEFAULT_MAX_VM_STEPS = 200_000_000
+DEFAULT_MAX_PLAN_ROWS = 50_000_000
+PROGRESS_INTERVAL = 10_000  # VM instructions between progress-handler calls
+
+# Table references after FROM, JOIN or a comma, used to map plan aliases to
+# tables. Select-list items also match; they never name a plan step, and FROM
+# comes later in the query, so its aliases win.
+_TABLE_REF_RE = re.compile(
+    r'(?:\bFROM\s+|\bJOIN\s+|,\s*)("[^"]+"|\[[^\]]+\]|`[^`]+`|\w+)'
+    r'(?:\s+(?:AS\s+)?(?!(?:ON|USING|WHERE|GROUP|ORDER|LIMIT|HAVING|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|UNION|EXCEPT|INTERSECT|WINDOW)\b)(\w+))?',
+    re.IGNORECASE,
+)
+# The scanned name in a SCAN plan step: "SCAN o" (SQLite 3.36+) or "SCAN TABLE
+# Orders AS o" (older), either followed by "USING [COVERING] INDEX ...".
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(.+?)(?: AS (.+?))?(?: USING .*| VIRTUAL TABLE .*)?$")
+# Subquery and CTE results scanned by the plan; they are not tables.
+_SUBQUERY_SCAN_RE = re.compile(r"^SCAN (?:SUBQUERY \d+|\(subquery-\d+\)|CONSTANT ROW)")
+
+class ConnectionPool:
+    """Warm, per-thread, read-only connections to one SQLite database.
+
+    Each thread gets its own connection (opened with `mode=ro`), so connections
+    are never shared concurrently; `check_same_thread` is disabled only so the
+    pool can close connections of threads that have exited.
+    """
+
+    def __init__(self, db_path, pragmas=None, cached_statements=DEFAULT_CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # thread ident -> (weakref to thread, connection)
+
+    def connection(self):
+        """Returns the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._close_dead_threads()
+                self._connections[threading.get_ident()] = (weakref.ref(threading.current_thread()), conn)
+        return conn
+
+    def _connect(self):
+        uri = pathlib.Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value};")
+        return conn
+
+    def _close_dead_threads(self):
+        for ident, (thread_ref, conn) in list(self._connections.items()):
+            thread = thread_ref()
+            if thread is None or not thread.is_alive():
+                conn.close()
+                del self._connections[ident]
+
+    def close(self):
+        """Closes every pooled connection; threads reconnect on next use."""
+        with self._lock:
+            for _, conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._local = threading.local()
+
+# --- Process-wide pool and schema registries ---
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+_SCHEMA_CACHE = {}  # absolute db path -> ((schema_version, mtime_ns, size), Schema)
+_SCHEMA_LOCK = threading.Lock()
+_RESULT_CACHES = {}
+_RESULT_CACHES_LOCK = threading.Lock()
+_ROLLUP_STATE = {}  # absolute db path -> (db_version, rollups fresh?)
+
+def get_pool(db_path, pragmas=None, cached_statements=DEFAULT_CACHED_STATEMENTS):
+    """Returns the shared ConnectionPool for db_path and these settings."""
+    key = (os.path.abspath(db_path), tuple(sorted((pragmas or {}).items())), cached_statements)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = ConnectionPool(db_path, pragmas, cached_statements)
+        return pool
+
+def get_result_cache(db_path, disk_path=None):
+    """Returns the shared ResultCache for db_path (persisted to disk_path if given)."""
+    key = (os.path.abspath(db_path), disk_path and os.path.abspath(disk_path))
+    with _RESULT_CACHES_LOCK:
+        cache = _RESULT_CACHES.get(key)
+        if cache is None:
+            cache = _RESULT_CACHES[key] = ResultCache(disk_path=disk_path)
+        return cache
+
+def get_sql_tool(db_path, cache_path=None):
+    """Returns a SQLiteTool backed by the shared pool and result cache for db_path."""
+    return SQLiteTool(db_path, pool=get_pool(db_path), cache=get_result_cache(db_path, cache_path))
 
 class SQLiteTool:
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool=None, cache=None):
         self.db_path = db_path
+        self.pool = pool or get_pool(db_path)
+        self.cache = cache
+
+    def schema_version(self):
+        """`PRAGMA schema_version`: changes whenever a table or index is created,
+        altered or dropped."""
+        return self.pool.connection().execute("PRAGMA schema_version;").fetchone()[0]
+
+    def get_schema_info(self) -> Schema:
+        """Returns the typed schema, introspected once per database version.
+
+        The cache is shared by every tool on the same file and invalidated when
+        `PRAGMA schema_version` or the file's mtime/size changes.
+        """
+        stat = os.stat(self.db_path)
+        version = (self.schema_version(), stat.st_mtime_ns, stat.st_size)
+        key = os.path.abspath(self.db_path)
+        with _SCHEMA_LOCK:
+            cached = _SCHEMA_CACHE.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        schema = introspect(self.pool.connection())
+        with _SCHEMA_LOCK:
+            _SCHEMA_CACHE[key] = (version, schema)
+        return schema
+
+    def materialize_rollups(self, rebuild=False):
+        """Builds the KPI rollup tables and indexes, or folds in the orders added
+        since the last call (see rollups.py).
+
+        Runs on its own writable connection; the pooled connections stay
+        read-only. Returns the refresh stats.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return refresh_rollups(conn, rebuild=rebuild)
+        finally:
+            conn.close()
+
+    def rollups_ready(self):
+        """True if the rollups cover all current orders, so KPI templates can read
+        them instead of the base tables. Checked once per database version."""
+        key = os.path.abspath(self.db_path)
+        version = db_version(self.db_path)
+        cached = _ROLLUP_STATE.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            fresh = rollups_fresh(self.pool.connection())
+        except sqlite3.Error:
+            fresh = False
+        _ROLLUP_STATE[key] = (version, fresh)
+        return fresh
 
     def get_schema(self):
         """Returns the schema of all tables in the database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get list of all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
-        
-        schema = {}
-        for table in tables:
-            # Get column information for each table
-            # Quote table name to handle spaces, as PRAGMA table_info does not automatically handle it
-            cursor.execute(f"PRAGMA table_info('{table}');")
-            columns = [f"{col[1]} {col[2]}" for col in cursor.fetchall()]
-            schema[table] = ", ".join(columns)
-            
-        conn.close()
-        
-        # Add views for lowercase compatibility as per assignment
-        views = {
-            "orders": "OrderID INTEGER, CustomerID TEXT, EmployeeID INTEGER, OrderDate TEXT, RequiredDate TEXT, ShippedDate TEXT, ShipVia INTEGER, Freight REAL, ShipName TEXT, ShipAddress TEXT, ShipCity TEXT, ShipRegion TEXT, ShipPostalCode TEXT, ShipCountry TEXT",
-            "order_items": "OrderID INTEGER, ProductID INTEGER, UnitPrice REAL, Quantity INTEGER, Discount REAL",
-            "products": "ProductID INTEGER, ProductName TEXT, SupplierID INTEGER, CategoryID INTEGER, QuantityPerUnit TEXT, UnitPrice REAL, UnitsInStock INTEGER, UnitsOnOrder INTEGER, ReorderLevel INTEGER, Discontinued INTEGER",
-            "customers": "CustomerID TEXT, CompanyName TEXT, ContactName TEXT, ContactTitle TEXT, Address TEXT, City TEXT, Region TEXT, PostalCode TEXT, Country TEXT, Phone TEXT, Fax TEXT"
-        }
-        schema.update(views)
-        
-        schema_str = "\n".join([f"Table: {table}\nColumns: {cols}" for table, cols in schema.items()])
-        return schema_str
-
-    def execute_query(self, query):
-        """Executes a SQL query and returns the results."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        return self.get_schema_info().render()
+
+    def get_schema_for_question(self, question):
+        """Returns the schema pruned to the tables relevant to the question.
+
+        Falls back to the full schema when no table can be matched.
+        """
+        schema = self.get_schema_info()
+        return schema.render(schema.relevant_tables(question) or None)
+
+    def execute_query(self, query, params=(), max_rows=DEFAULT_MAX_ROWS, max_bytes=DEFAULT_MAX_BYTES,
+                      timeout=DEFAULT_TIMEOUT_S, max_vm_steps=DEFAULT_MAX_VM_STEPS,
+                      max_plan_rows=DEFAULT_MAX_PLAN_ROWS):
+        """Executes a SQL query and returns the results.
+
+        `params` are bound to the query's `?` placeholders. A fixed query text
+        with binds reuses the connection's prepared statement across calls.
+
+        Rows are fetched in batches and fetching stops after `max_rows` rows or
+        roughly `max_bytes` of values (None disables a cap); `truncated` and
+        `truncated_by` report whether the result was cut short.
+
+        `timeout` (seconds), `max_vm_steps` and `max_plan_rows` bound the cost
+        of the query (None disables a budget). A query over budget is rejected
+        or interrupted and `error_type` is set to "cost", "timeout" or
+        "vm_steps"; other SQLite errors have `error_type` "sql".
+
+        With a result cache, successful results are keyed by the normalized
+        query, its params, the database version and the fetch options; hits
+        are returned as copies with `cached` set to True.
+        """
+        if self.cache is not None:
+            key = self.cache.make_key(query, db_version(self.db_path), (max_rows, max_bytes, tuple(params)))
+            cached = self.cache.get(key)
+            if cached is not None:
+                return {**_copy_result(cached), "cached": True}
+            result = self._execute_query(query, params, max_rows, max_bytes, timeout, max_vm_steps, max_plan_rows)
+            # The caller owns `result`; the cache keeps its own copy.
+            self.cache.put(key, _copy_result(result))
+            return result
+        return self._execute_query(query, params, max_rows, max_bytes, timeout, max_vm_steps, max_plan_rows)
+
+    def _execute_query(self, query, params, max_rows, max_bytes, timeout, max_vm_steps, max_plan_rows):
         try:
-            cursor.execute(query)
+            conn = self.pool.connection()
+            cursor = conn.cursor()
+        except sqlite3.Error as e:
+            return _error_result(str(e), "sql")
+
+        if max_plan_rows is not None:
+            try:
+                rejection = self._check_plan(cursor, query, max_plan_rows, params)
+            except sqlite3.Error as e:
+                cursor.close()
+                return _error_result(str(e), "sql")
+            if rejection is not None:
+                cursor.close()
+                return _error_result(rejection, "cost")
+
+        guard = _ProgressGuard(timeout, max_vm_steps)
+        if guard.active:
+            conn.set_progress_handler(guard, PROGRESS_INTERVAL)
+        try:
+            cursor.execute(query, params)
             # Fetch column names
-            columns = [description[0] for description in cursor.description]
-            # Fetch all rows
-            rows = cursor.fetchall()
+            columns = [description[0] for description in cursor.description or []]
+            rows = []
+            truncated_by = _fetch_bounded(cursor, rows.extend, max_rows, max_bytes)
             
-            conn.close()
-            return {"columns": columns, "rows": rows, "error": None}
+            return {"columns": columns, "rows": rows, "error": None, "error_type": None,
+                    "truncated": truncated_by is not None, "truncated_by": truncated_by}
         except sqlite3.Error as e:
-            conn.close()
-            return {"columns": [], "rows": [], "error": str(e)}
+            if guard.tripped is not None:
+                return _error_result(guard.message(), guard.tripped)
+            return _error_result(str(e), "sql")
+        finally:
+            cursor.close()
+            if guard.active:
+                conn.set_progress_handler(None, 0)
+
+    def explain(self, query, params=()):
+        """Returns the EXPLAIN QUERY PLAN rows as (id, parent, detail) tuples."""
+        cursor = self.pool.connection().cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            return [(row[0], row[1], row[-1]) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def estimate_cost(self, query, params=()):
+        """Estimates the row visits of a query from its plan and table row counts.
+
+        Plan steps under the same parent are nested loops: every full SCAN
+        multiplies the cost by the table's row estimate, while index SEARCHes
+        count as one row per outer row. Subqueries and compound parts add up.
+        Returns (estimated_rows, scanned_tables).
+        """
+        return _plan_cost(self.explain(query, params), self.get_schema_info(), _table_aliases(query))
+
+    def _check_plan(self, cursor, query, max_plan_rows, params=()):
+        """Returns a rejection message if the plan exceeds max_plan_rows, else None."""
+        cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        plan = [(row[0], row[1], row[-1]) for row in cursor.fetchall()]
+        estimated, scanned = _plan_cost(plan, self.get_schema_info(), _table_aliases(query))
+        if estimated <= max_plan_rows:
+            return None
+        scans = " x ".join(f"{name} ({rows} rows)" for name, rows in scanned)
+        return (f"Query rejected: estimated {estimated:,} row visits exceeds the budget of "
+                f"{max_plan_rows:,}; it fully scans {scans}. Add a join condition on an indexed "
+                f"key or a tighter WHERE clause.")
+
+class _ProgressGuard:
+    """Progress handler that interrupts a query past its time or VM-step budget."""
+
+    def __init__(self, timeout, max_vm_steps):
+        self.timeout = timeout
+        self.max_vm_steps = max_vm_steps
+        self.active = timeout is not None or max_vm_steps is not None
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.steps = 0
+        self.tripped = None
+
+    def __call__(self):
+        self.steps += PROGRESS_INTERVAL
+        if self.max_vm_steps is not None and self.steps > self.max_vm_steps:
+            self.tripped = "vm_steps"
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            self.tripped = "timeout"
+        # A non-zero return makes SQLite abort the statement with "interrupted".
+        return 1 if self.tripped else 0
+
+    def message(self):
+        if self.tripped == "timeout":
+            return f"Query interrupted: exceeded the {self.timeout:g}s time budget."
+        return f"Query interrupted: exceeded the budget of {self.max_vm_steps:,} VM steps."
+
+def _copy_result(result):
+    """A result whose column and row lists can be mutated without touching `result` (rows are tuples)."""
+    return {**result, "columns": list(result["columns"]), "rows": list(result["rows"])}
+
+def _error_result(message, error_type):
+    return {"columns": [], "rows": [], "error": message, "error_type": error_type,
+            "truncated": False, "truncated_by": None}
+
+def _unquote(name):
+    if name[:1] in ('"', "[", "`"):
+        return name[1:-1]
+    return name
+
+def _table_aliases(query):
+    """Maps lowercased aliases (and table names) in FROM/JOIN lists to table names."""
+    aliases = {}
+    for table, alias in _TABLE_REF_RE.findall(query):
+        table = _unquote(table)
+        aliases[table.lower()] = table
+        if alias:
+            aliases[alias.lower()] = table
+    return aliases
+
+def _plan_cost(plan, schema, aliases):
+    """Rough row-visit estimate for an EXPLAIN QUERY PLAN; see SQLiteTool.estimate_cost."""
+    tables = {name.lower(): table for name, table in schema.tables.items()}
+    loops = {}  # parent id -> product of full-scan row counts
+    scanned = []
+    for _, parent, detail in plan:
+        if not detail.startswith("SCAN ") or _SUBQUERY_SCAN_RE.match(detail):
+            continue
+        match = _SCAN_RE.match(detail)
+        names = [name.strip() for name in match.groups() if name] if match else []
+        table = next((tables[key] for key in (aliases.get(name.lower(), name).lower() for name in names)
+                      if key in tables), None)
+        if table is None:
+            # CTEs are scanned by name; anything else is a plan format we do
+            # not read, and leaving it out would silently under-count the cost.
+            if not any(name.lower() in aliases for name in names):
+                print(f"Warning: could not map plan step {detail!r} to a table; its cost is not counted.")
+            continue
+        if not table.row_estimate:
+            continue
+        loops[parent] = loops.get(parent, 1) * table.row_estimate
+        scanned.append((table.name, table.row_estimate))
+    return sum(loops.values()), scanned
+
+def _fetch_bounded(cursor, sink, max_rows, max_bytes, batch_size=FETCH_BATCH_SIZE):
+    """Feeds row batches to sink until the cursor or a budget runs out.
+
+    Returns None when every row was fetched, else "max_rows" or "max_bytes".
+    """
+    fetched = 0
+    size = 0
+    while True:
+        # Ask for one row past the cap so we know whether anything was cut.
+        want = batch_size if max_rows is None else min(batch_size, max_rows - fetched + 1)
+        batch = cursor.fetchmany(want)
+        if not batch:
+            return None
+        over_rows = max_rows is not None and fetched + len(batch) > max_rows
+        if over_rows:
+            batch = batch[:max_rows - fetched]
+        # The byte budget applies to the rows kept, including the last batch.
+        if max_bytes is not None:
+            for i, row in enumerate(batch):
+                size += _row_size(row)
+                if size > max_bytes:
+                    sink(batch[:i])
+                    return "max_bytes"
+        sink(batch)
+        if over_rows:
+            return "max_rows"
+        fetched += len(batch)
+
+def _row_size(row):
+    """Approximate payload size of a row: text/blob length, 8 bytes otherwise."""
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in row)
 
 if __name__ == '__main__':
     # Example usage for testing
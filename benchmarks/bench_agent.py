@@ -0,0 +1,202 @@
+"""End-to-end agent benchmark: build_graph() over sample_questions_hybrid_eval.jsonl
+and synthetic question sets scaled 10x..10,000x, fully offline (stub LM,
+synthetic Northwind).
+
+Reports throughput, latency percentiles (per question and per node), peak RSS
+and cold startup time as JSON with a fixed layout, so runs on two commits can
+be compared:
+
+    python -m benchmarks.bench_agent --scales 1,10,100 --out before.json
+    python -m benchmarks.bench_agent --scales 1,10,100 --compare before.json
+"""
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import dspy
+
+import agent.graph_hybrid as graph_hybrid
+import run_agent_hybrid
+from agent.instrumentation import LatencySummary
+from agent.tools.sqlite_tool import get_result_cache
+from benchmarks.northwind import create_northwind
+from benchmarks.stub_lm import make_stub_lm
+
+SCHEMA_VERSION = 1
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_QUESTIONS = os.path.join(PROJECT_ROOT, "sample_questions_hybrid_eval.jsonl")
+
+STARTUP_CODE = """
+import time
+start = time.perf_counter()
+import run_agent_hybrid
+from agent.graph_hybrid import build_graph
+build_graph()
+print(time.perf_counter() - start)
+"""
+
+
+def scaled_questions(base: list, scale: int):
+    """The base questions repeated `scale` times with unique ids, interleaved."""
+    for i in range(scale):
+        for question_data in base:
+            yield {**question_data, "id": f"{question_data['id']}#{i}"}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure_startup(repeats: int) -> dict:
+    """Cold start in fresh interpreters: import + build_graph(), and the whole process."""
+    env = {**os.environ, "PYTHONPATH": PROJECT_ROOT + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    in_process, whole = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_CODE], cwd=PROJECT_ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        whole.append(time.perf_counter() - start)
+        in_process.append(float(output.strip().splitlines()[-1]))
+    return {"import_build_s": round(statistics.median(in_process), 4),
+            "process_s": round(statistics.median(whole), 4),
+            "repeats": repeats}
+
+
+def run_scale(app, questions: list, scale: int, workers: int, mode: str) -> dict:
+    latencies = []
+    summary = LatencySummary()
+
+    def emit(index, result, record):
+        latencies.append(record["wall_ms"])
+        summary.add(record)
+
+    items = run_agent_hybrid.with_prefetched_docs(scaled_questions(questions, scale))
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run_agent_hybrid.run_batch(app, items, workers=workers, mode=mode, emit=emit)
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "scale": scale,
+        "questions": len(latencies),
+        "wall_s": round(wall, 4),
+        "throughput_qps": round(len(latencies) / wall, 2),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 3),
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+        },
+        "nodes": {row["node"]: {"calls": row["calls"], "p50_ms": round(row["p50_ms"], 3),
+                                "p95_ms": round(row["p95_ms"], 3), "p99_ms": round(row["p99_ms"], 3)}
+                  for row in summary.rows() if row["node"] != "total"},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _percentile(ordered: list, q: float) -> float:
+    return ordered[max(0, -(-len(ordered) * q // 100) - 1)]
+
+
+def regressions(current: dict, baseline: dict, tolerance: float) -> list:
+    """Scales whose throughput fell or p95 latency rose by more than `tolerance`."""
+    found = []
+    before = {run["scale"]: run for run in baseline.get("runs", [])}
+    for run in current["runs"]:
+        old = before.get(run["scale"])
+        if old is None:
+            continue
+        qps = run["throughput_qps"] / old["throughput_qps"]
+        p95 = run["latency_ms"]["p95"] / old["latency_ms"]["p95"] if old["latency_ms"]["p95"] else 1.0
+        print(f"scale={run['scale']:<6} throughput {qps:5.2f}x   p95 latency {p95:5.2f}x", file=sys.stderr)
+        if qps < 1 - tolerance or p95 > 1 + tolerance:
+            found.append(run["scale"])
+    return found
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--db', default=None, help='Existing Northwind SQLite file (default: generate one).')
+@click.option('--orders', default=830, help='Orders in the generated database.')
+@click.option('--docs', default=os.path.join(PROJECT_ROOT, "docs"), help='Docs directory for retrieval.')
+@click.option('--scales', default="1,10,100", help='Comma-separated multiples of the sample questions (up to 10000).')
+@click.option('--workers', default=1, help='Questions answered concurrently.')
+@click.option('--mode', default='thread', type=click.Choice(['thread', 'process', 'async']))
+@click.option('--startup-repeats', default=3, help='Fresh interpreters used to time startup (0 to skip).')
+@click.option('--out', default=None, help='Write the JSON results here (default: stdout).')
+@click.option('--compare', default=None, help='Baseline JSON from an earlier run; exit 1 on regression.')
+@click.option('--tolerance', default=0.10, help='Allowed relative regression for --compare.')
+def main(db, orders, docs, scales, workers, mode, startup_repeats, out, compare, tolerance):
+    tmp_dir = None
+    if db is None:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_agent_")
+        db = create_northwind(os.path.join(tmp_dir, "northwind.sqlite"), n_orders=orders)
+    try:
+        dspy.configure(lm=make_stub_lm())
+        graph_hybrid.DB_PATH = db
+        graph_hybrid.DOCS_PATH = docs
+        run_agent_hybrid.console.quiet = True
+        questions = list(run_agent_hybrid.load_questions(SAMPLE_QUESTIONS))
+        app = graph_hybrid.build_graph()
+
+        runs = []
+        for scale in [int(s) for s in scales.split(",")]:
+            # Each scale starts from a cold SQL result cache.
+            get_result_cache(db).clear()
+            runs.append(run_scale(app, questions, scale, workers, mode))
+            print(f"scale={scale:<6} {runs[-1]['questions']:>7} questions  "
+                  f"{runs[-1]['throughput_qps']:9.1f} q/s  p50 {runs[-1]['latency_ms']['p50']:8.2f} ms  "
+                  f"p99 {runs[-1]['latency_ms']['p99']:8.2f} ms  peak RSS {runs[-1]['peak_rss_mb']} MB",
+                  file=sys.stderr)
+
+        result = {
+            "schema_version": SCHEMA_VERSION,
+            "benchmark": "agent",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {"workers": workers, "mode": mode, "orders": orders if tmp_dir else None,
+                       "base_questions": len(questions)},
+            "startup": measure_startup(startup_repeats) if startup_repeats else None,
+            "runs": runs,
+        }
+        text = json.dumps(result, indent=2, sort_keys=True)
+        if out:
+            with open(out, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        if compare:
+            with open(compare) as f:
+                baseline = json.load(f)
+            if regressions(result, baseline, tolerance):
+                sys.exit(1)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Cold start of DocumentRetriever: in-memory build vs. opening the mmap'd on-disk index.
+
+Run from the project root:
+
+    python -m benchmarks.bench_index --chunks 100000 --workers 4
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from agent.rag.retrieval import DocumentRetriever, build_index
+from benchmarks.bench_retrieval import QUESTIONS, WORDS
+
+
+def make_policy_corpus(root: str, n_chunks: int, chunks_per_file: int = 100, seed: int = 0) -> str:
+    """Writes markdown files holding n_chunks short sections (one chunk each) in total."""
+    rng = random.Random(seed)
+    docs_dir = os.path.join(root, "docs")
+    os.makedirs(docs_dir)
+    for i in range(0, n_chunks, chunks_per_file):
+        paragraphs = [f"## Policy {i + j}\n- " + " ".join(rng.choice(WORDS) for _ in range(30)) + "."
+                      for j in range(min(chunks_per_file, n_chunks - i))]
+        with open(os.path.join(docs_dir, f"policy_{i:08d}.md"), "w") as f:
+            f.write("\n\n".join(paragraphs))
+    return docs_dir
+
+
+def _smaps_rollup() -> dict:
+    """Rss/Pss of the current process in KiB (Linux only, empty elsewhere)."""
+    stats = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean"):
+                    stats[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return stats
+
+
+def _worker(docs_dir: str, index_dir: str) -> tuple:
+    start = time.perf_counter()
+    retriever = DocumentRetriever(docs_dir, index_dir=index_dir)
+    opened = time.perf_counter() - start
+    for question in QUESTIONS:
+        retriever.retrieve(question)
+    return os.getpid(), opened, time.perf_counter() - start, _smaps_rollup()
+
+
+@click.command()
+@click.option('--chunks', default=100000, help='Number of chunks in the synthetic corpus.')
+@click.option('--workers', default=4, help='Processes that open the same index concurrently.')
+def main(chunks: int, workers: int):
+    root = tempfile.mkdtemp(prefix="bench_index_")
+    try:
+        docs_dir = make_policy_corpus(root, chunks)
+        index_dir = os.path.join(root, "index")
+
+        start = time.perf_counter()
+        in_memory = DocumentRetriever(docs_dir)
+        print(f"in-memory build: {time.perf_counter() - start:8.3f}s ({in_memory.index.n_docs} chunks)")
+
+        start = time.perf_counter()
+        build_index(docs_dir, index_dir)
+        print(f"build_index:     {time.perf_counter() - start:8.3f}s")
+
+        start = time.perf_counter()
+        retriever = DocumentRetriever(docs_dir, index_dir=index_dir)
+        opened = time.perf_counter() - start
+        retriever.retrieve(QUESTIONS[0])
+        print(f"mmap open:       {opened * 1000:8.2f}ms (first query done after "
+              f"{(time.perf_counter() - start) * 1000:.2f}ms)")
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_worker, docs_dir, index_dir) for _ in range(workers)]
+            for future in futures:
+                pid, open_s, total_s, mem = future.result()
+                print(f"worker {pid}: open {open_s * 1000:7.2f}ms, open+{len(QUESTIONS)} queries "
+                      f"{total_s * 1000:7.2f}ms, {mem}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Per-question retrieval latency: fresh DocumentRetriever vs. the shared registry.
+
+Run from the project root:
+
+    python -m benchmarks.bench_retrieval --sizes 4,1000,50000
+"""
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import click
+
+from agent.rag.retrieval import DocumentRetriever, get_retriever, clear_retriever_cache
+
+QUESTIONS = [
+    "What is the return window for unopened Beverages?",
+    "What is the formula for Average Order Value?",
+    "Which dates does Summer Beverages 1997 cover?",
+    "How is gross margin approximated when cost is missing?",
+]
+
+WORDS = (
+    "beverages condiments confections dairy produce seafood grains meat poultry returns policy "
+    "unopened opened days perishables revenue margin order value discount quantity customer "
+    "category campaign summer winter classics calendar holiday gifting focus push dates notes"
+).split()
+
+
+def make_corpus(root: str, n_files: int, seed: int = 0) -> str:
+    """Writes n_files synthetic markdown files (a few paragraphs each) under root."""
+    rng = random.Random(seed)
+    docs_dir = os.path.join(root, f"docs_{n_files}")
+    os.makedirs(docs_dir)
+    for i in range(n_files):
+        paragraphs = [f"# Document {i}"]
+        for _ in range(3):
+            paragraphs.append("- " + " ".join(rng.choice(WORDS) for _ in range(20)) + ".")
+        with open(os.path.join(docs_dir, f"doc_{i:06d}.md"), "w") as f:
+            f.write("\n\n".join(paragraphs))
+    return docs_dir
+
+
+def time_questions(fn, n_questions: int) -> list:
+    timings = []
+    for i in range(n_questions):
+        start = time.perf_counter()
+        fn(QUESTIONS[i % len(QUESTIONS)])
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(label: str, timings: list) -> None:
+    print(f"  {label:<8} n={len(timings):<4} mean={statistics.mean(timings):10.2f}ms "
+          f"median={statistics.median(timings):10.2f}ms max={max(timings):10.2f}ms")
+
+
+@click.command()
+@click.option('--sizes', default="4,1000,50000", help='Comma-separated corpus sizes (number of markdown files).')
+@click.option('--questions', default=20, help='Questions timed per corpus with the shared registry.')
+@click.option('--baseline-questions', default=3, help='Questions timed per corpus with a fresh retriever per question.')
+def main(sizes: str, questions: int, baseline_questions: int):
+    root = tempfile.mkdtemp(prefix="bench_retrieval_")
+    try:
+        for n_files in [int(s) for s in sizes.split(",")]:
+            docs_dir = make_corpus(root, n_files)
+            print(f"--- {n_files} files ---")
+
+            before = time_questions(lambda q: DocumentRetriever(docs_dir).retrieve(q), baseline_questions)
+            summarize("before", before)
+
+            clear_retriever_cache()
+            # The first call pays for the build; steady-state latency excludes it.
+            start = time.perf_counter()
+            get_retriever(docs_dir).retrieve(QUESTIONS[0])
+            print(f"  first call (build) {(time.perf_counter() - start) * 1000:.2f}ms")
+            after = time_questions(lambda q: get_retriever(docs_dir).retrieve(q), questions)
+            summarize("after", after)
+            print(f"  speedup  {statistics.median(before) / statistics.median(after):.1f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
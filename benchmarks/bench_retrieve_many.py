@@ -0,0 +1,42 @@
+"""Batch retrieval: one top_k call per question vs. a single top_k_many pass.
+
+Run from the project root:
+
+    python -m benchmarks.bench_retrieve_many --chunks 200000 --queries 20000
+"""
+import time
+
+import click
+import numpy as np
+
+from agent.rag.index import BM25Index, tokenize
+from benchmarks.bench_topk import make_chunks
+
+
+@click.command()
+@click.option('--chunks', default=200000, help='Number of synthetic chunks to index.')
+@click.option('--queries', default=20000, help='Number of questions in the batch.')
+@click.option('--k', default=3, help='Results per query.')
+def main(chunks: int, queries: int, k: int):
+    index = BM25Index.build(make_chunks(chunks))
+    rng = np.random.default_rng(1)
+    # Questions mix a few mid-frequency terms with the occasional common one.
+    batch = [tokenize(" ".join(f"w{int(r)}" for r in rng.zipf(1.1, size=4) + 20)) for _ in range(queries)]
+
+    start = time.perf_counter()
+    one_by_one = [index.top_k(tokens, k) for tokens in batch]
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = index.top_k_many(batch, k)
+    batch_s = time.perf_counter() - start
+
+    for (a, sa), (b, sb) in zip(one_by_one, batched):
+        assert np.array_equal(a, b) and np.array_equal(sa, sb)
+    print(f"{queries} queries over {index.n_docs} chunks")
+    print(f"  top_k loop   {loop_s:8.3f}s ({queries / loop_s:10.0f} q/s)")
+    print(f"  top_k_many   {batch_s:8.3f}s ({queries / batch_s:10.0f} q/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""KPI template latency: base-table SQL vs. the same template over the KPI rollups.
+
+Run from the project root (a synthetic Northwind is generated unless --db is given):
+
+    python -m benchmarks.bench_rollups --orders 1000000
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import click
+
+from agent.sql_templates import TEMPLATES
+from agent.tools.sqlite_tool import ConnectionPool, SQLiteTool
+from benchmarks.northwind import create_northwind
+
+CONSTRAINTS = {"start_date": "1997-01-01", "end_date": "1997-12-31", "category": "Beverages", "limit": 3}
+
+
+def time_query(tool: SQLiteTool, sql: str, params: tuple, repeats: int) -> float:
+    """Median latency in ms, budgets and result cache off."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = tool.execute_query(sql, params, max_rows=None, max_bytes=None, timeout=None,
+                                    max_vm_steps=None, max_plan_rows=None)
+        samples.append((time.perf_counter() - start) * 1000)
+        if result["error"]:
+            raise click.ClickException(f"{sql}: {result['error']}")
+    return statistics.median(samples)
+
+
+@click.command()
+@click.option('--db', default=None, help='Existing Northwind SQLite file (default: generate one; it is modified).')
+@click.option('--orders', default=200_000, help='Orders in the generated database.')
+@click.option('--repeats', default=5, help='Runs per query.')
+def main(db: str, orders: int, repeats: int):
+    tmp_dir = None
+    if db is None:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_rollups_")
+        db = create_northwind(os.path.join(tmp_dir, "northwind.sqlite"), n_orders=orders)
+    try:
+        tool = SQLiteTool(db, pool=ConnectionPool(db))
+        baseline = {t.name: time_query(tool, t.sql, t.bind(CONSTRAINTS), repeats) for t in TEMPLATES}
+        stats = tool.materialize_rollups(rebuild=True)
+        print(f"Built rollups in {stats['seconds']:.2f}s; no-op refresh in {tool.materialize_rollups()['seconds']:.3f}s")
+        print(f"{'template':<40} {'base ms':>10} {'rollup ms':>10} {'speedup':>9}")
+        for template in TEMPLATES:
+            rolled = time_query(tool, template.rollup_sql, template.bind(CONSTRAINTS), repeats)
+            base = baseline[template.name]
+            print(f"{template.name:<40} {base:10.2f} {rolled:10.2f} {base / rolled:8.1f}x")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
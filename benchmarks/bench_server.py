@@ -0,0 +1,109 @@
+"""Warm query server under load, on localhost.
+
+Starts serve_agent_hybrid's server in-process on a free port and has
+--clients threads post the sample questions one at a time, for each
+--batch-sizes value (1 = no batching). Reports answered questions per
+second, client-side latency percentiles, 503 rejections from the bounded
+queue and the mean batch the dispatcher formed. Run from the project root (a
+synthetic Northwind is generated unless --db is given):
+
+    python -m benchmarks.bench_server --clients 32 --queue-size 16
+"""
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import click
+
+from benchmarks.northwind import create_northwind
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_QUESTIONS = os.path.join(PROJECT_ROOT, "sample_questions_hybrid_eval.jsonl")
+
+
+def load_questions() -> list:
+    with open(SAMPLE_QUESTIONS) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def post(url: str, question: dict) -> int:
+    request = urllib.request.Request(url, data=json.dumps(question).encode("utf-8"))
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def run_clients(url: str, questions: list, clients: int, per_client: int):
+    """Returns (status codes, latencies in ms of the answered requests, wall seconds)."""
+    codes, latencies = [], []
+    lock = threading.Lock()
+
+    def client(offset):
+        for i in range(per_client):
+            start = time.perf_counter()
+            code = post(url, questions[(offset + i) % len(questions)])
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                codes.append(code)
+                if code == 200:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return codes, latencies, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--db', default=None, help='Existing Northwind SQLite file (default: generate one).')
+@click.option('--docs', default=os.path.join(PROJECT_ROOT, "docs"), help='Docs directory for retrieval.')
+@click.option('--engine', default="inline", type=click.Choice(['langgraph', 'inline']), help='Graph engine of the server.')
+@click.option('--clients', default=32, help='Concurrent client threads.')
+@click.option('--requests', 'per_client', default=20, help='Questions posted by each client.')
+@click.option('--workers', default=4, help='Server worker threads.')
+@click.option('--queue-size', default=256, help='Server queue size; smaller than --clients to see 503s.')
+@click.option('--batch-sizes', default="1,32", help='Comma-separated server --batch-size values to compare.')
+def main(db, docs, engine, clients, per_client, workers, queue_size, batch_sizes):
+    import agent.graph_hybrid as graph_hybrid
+    import serve_agent_hybrid
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_server_")
+    try:
+        if db is None:
+            db = create_northwind(os.path.join(tmp_dir, "northwind.sqlite"))
+        graph_hybrid.DB_PATH, graph_hybrid.DOCS_PATH = db, docs
+        questions = load_questions()
+        print(f"{'batch':>5} {'q/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'503s':>6} {'mean batch':>11}")
+        for batch_size in (int(size) for size in batch_sizes.split(",")):
+            server = serve_agent_hybrid.make_server(port=0, engine=engine, workers=workers,
+                                                    queue_size=queue_size, batch_size=batch_size)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                url = "http://127.0.0.1:%d/ask" % server.server_address[1]
+                codes, latencies, wall = run_clients(url, questions, clients, per_client)
+                stats = server.agent.stats()
+            finally:
+                server.shutdown()
+                server.server_close()
+                server.agent.close()
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else float("nan")
+            print(f"{batch_size:5d} {len(latencies) / wall:8.1f} {statistics.median(latencies):8.2f} "
+                  f"{p95:8.2f} {codes.count(503):6d} {stats['mean_batch_size']:11.2f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Queries per second: a fresh sqlite3 connection per query vs. the pooled SQLiteTool.
+
+Run from the project root (a synthetic Northwind is generated unless --db is given):
+
+    python -m benchmarks.bench_sqlite --workers 1,8,32
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from agent.tools.sqlite_tool import SQLiteTool, ConnectionPool
+from benchmarks.northwind import create_northwind
+
+QUERIES = [
+    "SELECT CompanyName, Country FROM Customers WHERE CustomerID = 'C00042';",
+    "SELECT ProductName, UnitPrice FROM Products WHERE ProductID = 17;",
+    "SELECT COUNT(*) FROM Orders WHERE OrderDate BETWEEN '1997-06-01' AND '1997-06-30';",
+    """SELECT CAST(SUM(T2.UnitPrice * T2.Quantity * (1 - T2.Discount)) AS REAL) / COUNT(DISTINCT T1.OrderID) AS AOV
+FROM Orders AS T1 INNER JOIN "Order Details" AS T2 ON T1.OrderID = T2.OrderID
+WHERE T1.OrderDate BETWEEN '1997-12-01' AND '1997-12-31'""",
+]
+
+
+def fresh_connection_query(db_path: str, query: str):
+    """The pre-pool behaviour: connect, execute, fetch, close."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def run(fn, workers: int, n_queries: int) -> float:
+    """Runs n_queries through fn on a thread pool and returns queries per second."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fn, (QUERIES[i % len(QUERIES)] for i in range(n_queries))))
+    return n_queries / (time.perf_counter() - start)
+
+
+@click.command()
+@click.option('--db', default=None, help='Existing Northwind SQLite file (default: generate one).')
+@click.option('--orders', default=5000, help='Orders in the generated database.')
+@click.option('--workers', default="1,8,32", help='Comma-separated worker counts.')
+@click.option('--queries', default=4000, help='Queries per measurement.')
+def main(db: str, orders: int, workers: str, queries: int):
+    tmp_dir = None
+    if db is None:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_sqlite_")
+        db = create_northwind(os.path.join(tmp_dir, "northwind.sqlite"), n_orders=orders)
+    try:
+        for n_workers in [int(w) for w in workers.split(",")]:
+            baseline = run(lambda q: fresh_connection_query(db, q), n_workers, queries)
+            tool = SQLiteTool(db, pool=ConnectionPool(db))
+            pooled = run(tool.execute_query, n_workers, queries)
+            tool.pool.close()
+            print(f"workers={n_workers:<3} fresh connection {baseline:9.0f} q/s   "
+                  f"pooled {pooled:9.0f} q/s   ({pooled / baseline:.1f}x)")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
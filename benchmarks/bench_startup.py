@@ -0,0 +1,111 @@
+"""Cold start of a short-lived run: one question per route, in a fresh interpreter.
+
+Each route's sample question is answered by `run_agent_hybrid.py` in a new
+process. The wall time of the whole process is compared with the target, and
+a `python -X importtime` run of the same command shows which imports it paid
+for. Run from the project root (a synthetic Northwind is generated unless
+--db is given):
+
+    python -m benchmarks.bench_startup --engines inline,langgraph
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks.northwind import create_northwind
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_QUESTIONS = os.path.join(PROJECT_ROOT, "sample_questions_hybrid_eval.jsonl")
+# Packages worth naming in the import breakdown.
+HEAVY_PACKAGES = ("dspy", "langgraph", "langchain_core", "numpy", "scipy", "rich", "click")
+
+RUN_CODE = """
+import sys
+import agent.graph_hybrid as graph_hybrid
+graph_hybrid.DB_PATH, graph_hybrid.DOCS_PATH = sys.argv[1], sys.argv[2]
+import run_agent_hybrid
+run_agent_hybrid.main(sys.argv[3:])
+"""
+
+
+def route_questions() -> dict:
+    """The first sample question of each route, by id prefix (rag_, sql_, hybrid_)."""
+    questions = {}
+    with open(SAMPLE_QUESTIONS) as f:
+        for line in f:
+            question = json.loads(line)
+            questions.setdefault(question["id"].split("_", 1)[0], question)
+    return questions
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Total import time, and the time spent in each heavy package's own
+    modules (their self times, so shared dependencies are not counted twice), in ms."""
+    total, packages = 0, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        if not name.startswith("  ", 1):
+            total += int(cumulative)
+        package = name.strip().split(".")[0]
+        if package in HEAVY_PACKAGES:
+            packages[package] = packages.get(package, 0) + int(self_us) / 1000
+    return {"imports_ms": total / 1000, "packages_ms": packages}
+
+
+def run(args: list, env: dict, importtime: bool = False) -> subprocess.CompletedProcess:
+    flags = ["-X", "importtime"] if importtime else []
+    return subprocess.run([sys.executable, *flags, "-c", RUN_CODE, *args], cwd=PROJECT_ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+@click.command()
+@click.option('--db', default=None, help='Existing Northwind SQLite file (default: generate one).')
+@click.option('--docs', default=os.path.join(PROJECT_ROOT, "docs"), help='Docs directory for retrieval.')
+@click.option('--engines', default="inline,langgraph", help='Comma-separated --engine values to compare.')
+@click.option('--repeats', default=5, help='Fresh processes timed per route and engine.')
+@click.option('--target-ms', default=200.0, help='Startup budget for a one-question run.')
+def main(db, docs, engines, repeats, target_ms):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        if db is None:
+            db = create_northwind(os.path.join(tmp_dir, "northwind.sqlite"))
+        env = {**os.environ, "PYTHONPATH": PROJECT_ROOT + os.pathsep + os.environ.get("PYTHONPATH", "")}
+        bare = statistics.median(_wall([sys.executable, "-c", "pass"], env) for _ in range(repeats))
+        print(f"bare interpreter: {bare:7.1f} ms")
+        print(f"{'route':<8} {'engine':<10} {'wall ms':>8} {'imports ms':>11}  {'target':<7} heavy imports (ms)")
+        for route, question in route_questions().items():
+            batch = os.path.join(tmp_dir, f"{route}.jsonl")
+            with open(batch, "w") as f:
+                f.write(json.dumps(question) + "\n")
+            for engine in engines.split(","):
+                args = [db, docs, "--batch", batch, "--out", os.path.join(tmp_dir, f"{route}.out.jsonl"),
+                        "--engine", engine]
+                wall = statistics.median(_wall([sys.executable, "-c", RUN_CODE, *args], env)
+                                         for _ in range(repeats))
+                imports = parse_importtime(run(args, env, importtime=True).stderr)
+                heavy = ", ".join(f"{name} {ms:.0f}" for name, ms in imports["packages_ms"].items())
+                verdict = "ok" if wall <= target_ms else "over"
+                print(f"{route:<8} {engine:<10} {wall:8.1f} {imports['imports_ms']:11.1f}  {verdict:<7} {heavy}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _wall(command: list, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, cwd=PROJECT_ROOT, env=env, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == '__main__':
+    main()
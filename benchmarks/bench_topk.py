@@ -0,0 +1,75 @@
+"""Top-k latency: dense scoring + argsort vs. sparse postings scoring (with and without MaxScore).
+
+Run from the project root:
+
+    python -m benchmarks.bench_topk --chunks 1000000
+"""
+import random
+import statistics
+import time
+
+import click
+import numpy as np
+
+from agent.rag.chunking import ChunkTable
+from agent.rag.index import BM25Index, tokenize
+
+
+def make_chunks(n_chunks: int, vocab_size: int = 50000, words_per_chunk: int = 30, seed: int = 0) -> list:
+    """Synthetic chunks over a Zipf-distributed vocabulary (a few common terms, a long rare tail)."""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.3, size=(n_chunks, words_per_chunk)), vocab_size) - 1
+    return ChunkTable.from_texts([" ".join(f"w{r}" for r in row) for row in ranks], "synthetic")
+
+
+def dense_top_k(index: BM25Index, tokens: list, k: int):
+    """The original retrieve(): score every chunk, then argsort the whole array."""
+    scores = index.get_scores(tokens)
+    return scores.argsort()[-k:][::-1]
+
+
+def time_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+@click.command()
+@click.option('--chunks', default=1000000, help='Number of synthetic chunks to index.')
+@click.option('--k', default=3, help='Results per query.')
+@click.option('--repeat', default=5, help='Timed repetitions per query (median reported).')
+def main(chunks: int, k: int, repeat: int):
+    start = time.perf_counter()
+    index = BM25Index.build(make_chunks(chunks))
+    print(f"built index over {index.n_docs} chunks in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(0)
+    queries = {
+        "rare terms": " ".join(f"w{rng.randint(5000, 40000)}" for _ in range(4)),
+        "mixed terms": "w3 w40 w900 w12000",
+        "rare + common terms": "w7000 w9000 w0 w1",
+        "common terms": "w0 w1 w2",
+    }
+    for label, query in queries.items():
+        tokens = tokenize(query)
+        term_ids = index.term_ids(tokens)
+        postings = int(sum(index.offsets[t + 1] - index.offsets[t] for t in term_ids if t >= 0))
+
+        exhaustive, scores = index.top_k(tokens, k)
+        pruned, _ = index.top_k(tokens, k, early_termination=True)
+        assert np.array_equal(exhaustive, pruned)
+        # argsort breaks ties arbitrarily, so compare the ranked scores.
+        dense_scores = index.get_scores(tokens)
+        assert np.array_equal(dense_scores[dense_top_k(index, tokens, k)], scores)
+
+        print(f"--- {label}: '{query}' ({postings} postings) ---")
+        print(f"  dense + argsort   {time_ms(lambda: dense_top_k(index, tokens, k), repeat):9.3f}ms")
+        print(f"  sparse top_k      {time_ms(lambda: index.top_k(tokens, k), repeat):9.3f}ms")
+        print(f"  sparse + MaxScore {time_ms(lambda: index.top_k(tokens, k, early_termination=True), repeat):9.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Synthetic Northwind database generator for benchmarks (no download needed).
+
+Produces the tables and columns the agent relies on (Categories, Products,
+Customers, Orders, "Order Details", ...) with 1996-1998 order dates, scaled by
+the number of orders. The real Northwind has 830 orders and ~2,150 order lines.
+
+    python -m benchmarks.northwind --out /tmp/northwind.sqlite --orders 830
+"""
+import datetime
+import os
+import random
+import sqlite3
+
+import click
+
+CATEGORIES = ["Beverages", "Condiments", "Confections", "Dairy Products",
+              "Grains/Cereals", "Meat/Poultry", "Produce", "Seafood"]
+COUNTRIES = ["Germany", "Mexico", "UK", "Sweden", "France", "Spain", "Canada", "Brazil", "USA", "Italy"]
+
+SCHEMA = """
+CREATE TABLE Categories (CategoryID INTEGER PRIMARY KEY, CategoryName TEXT, Description TEXT);
+CREATE TABLE Suppliers (SupplierID INTEGER PRIMARY KEY, CompanyName TEXT, Country TEXT);
+CREATE TABLE Shippers (ShipperID INTEGER PRIMARY KEY, CompanyName TEXT, Phone TEXT);
+CREATE TABLE Employees (EmployeeID INTEGER PRIMARY KEY, LastName TEXT, FirstName TEXT, Title TEXT);
+CREATE TABLE Products (
+    ProductID INTEGER PRIMARY KEY, ProductName TEXT,
+    SupplierID INTEGER REFERENCES Suppliers(SupplierID),
+    CategoryID INTEGER REFERENCES Categories(CategoryID),
+    QuantityPerUnit TEXT, UnitPrice REAL, UnitsInStock INTEGER, UnitsOnOrder INTEGER,
+    ReorderLevel INTEGER, Discontinued INTEGER);
+CREATE TABLE Customers (
+    CustomerID TEXT PRIMARY KEY, CompanyName TEXT, ContactName TEXT, ContactTitle TEXT,
+    Address TEXT, City TEXT, Region TEXT, PostalCode TEXT, Country TEXT, Phone TEXT, Fax TEXT);
+CREATE TABLE Orders (
+    OrderID INTEGER PRIMARY KEY,
+    CustomerID TEXT REFERENCES Customers(CustomerID),
+    EmployeeID INTEGER REFERENCES Employees(EmployeeID),
+    OrderDate TEXT, RequiredDate TEXT, ShippedDate TEXT,
+    ShipVia INTEGER REFERENCES Shippers(ShipperID),
+    Freight REAL, ShipName TEXT, ShipAddress TEXT, ShipCity TEXT, ShipRegion TEXT,
+    ShipPostalCode TEXT, ShipCountry TEXT);
+CREATE TABLE "Order Details" (
+    OrderID INTEGER REFERENCES Orders(OrderID),
+    ProductID INTEGER REFERENCES Products(ProductID),
+    UnitPrice REAL, Quantity INTEGER, Discount REAL,
+    PRIMARY KEY (OrderID, ProductID));
+CREATE VIEW order_items AS SELECT * FROM "Order Details";
+"""
+
+
+def create_northwind(path: str, n_orders: int = 830, n_customers: int = 91, n_products: int = 77,
+                     seed: int = 0) -> str:
+    """Writes a synthetic Northwind database to path (replacing it) and returns path."""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO Categories VALUES (?, ?, ?)",
+                     [(i + 1, name, f"{name} products") for i, name in enumerate(CATEGORIES)])
+    conn.executemany("INSERT INTO Suppliers VALUES (?, ?, ?)",
+                     [(i, f"Supplier {i}", rng.choice(COUNTRIES)) for i in range(1, 30)])
+    conn.executemany("INSERT INTO Shippers VALUES (?, ?, ?)",
+                     [(i, f"Shipper {i}", "555-0100") for i in range(1, 4)])
+    conn.executemany("INSERT INTO Employees VALUES (?, ?, ?, ?)",
+                     [(i, f"Last{i}", f"First{i}", "Sales Representative") for i in range(1, 10)])
+    prices = {}
+    products = []
+    for i in range(1, n_products + 1):
+        prices[i] = round(rng.uniform(2.5, 263.5), 2)
+        products.append((i, f"Product {i}", rng.randint(1, 29), rng.randint(1, len(CATEGORIES)),
+                          "10 boxes", prices[i], rng.randint(0, 120), 0, 10, 0))
+    conn.executemany("INSERT INTO Products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", products)
+    customers = [f"C{i:05d}" for i in range(n_customers)]
+    conn.executemany("INSERT INTO Customers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     [(c, f"Company {c}", f"Contact {c}", "Owner", "1 Main St", "City", None,
+                       "00000", rng.choice(COUNTRIES), "555-0101", None) for c in customers])
+
+    start = datetime.date(1996, 7, 4)
+    span = (datetime.date(1998, 5, 6) - start).days
+    batch_orders, batch_lines = [], []
+    for order_id in range(10248, 10248 + n_orders):
+        day = start + datetime.timedelta(days=int(span * (order_id - 10248) / max(n_orders, 1)))
+        batch_orders.append((order_id, rng.choice(customers), rng.randint(1, 9), day.isoformat(),
+                             (day + datetime.timedelta(days=28)).isoformat(),
+                             (day + datetime.timedelta(days=rng.randint(1, 30))).isoformat(),
+                             rng.randint(1, 3), round(rng.uniform(0.1, 900), 2), "Ship", "Addr", "City",
+                             None, "00000", rng.choice(COUNTRIES)))
+        for product_id in rng.sample(range(1, n_products + 1), rng.randint(1, 5)):
+            batch_lines.append((order_id, product_id, prices[product_id], rng.randint(1, 120),
+                                rng.choice([0, 0, 0, 0.05, 0.1, 0.15, 0.2, 0.25])))
+        if len(batch_lines) >= 100000:
+            conn.executemany("INSERT INTO Orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch_orders)
+            conn.executemany('INSERT INTO "Order Details" VALUES (?, ?, ?, ?, ?)', batch_lines)
+            batch_orders, batch_lines = [], []
+    conn.executemany("INSERT INTO Orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch_orders)
+    conn.executemany('INSERT INTO "Order Details" VALUES (?, ?, ?, ?, ?)', batch_lines)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@click.command()
+@click.option('--out', required=True, help='Path of the SQLite file to write.')
+@click.option('--orders', default=830, help='Number of orders to generate.')
+@click.option('--seed', default=0, help='Random seed.')
+def main(out: str, orders: int, seed: int):
+    create_northwind(out, n_orders=orders, seed=seed)
+    print(f"Wrote synthetic Northwind with {orders} orders to {out}")
+
+
+if __name__ == '__main__':
+    main()
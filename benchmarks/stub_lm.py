@@ -0,0 +1,15 @@
+"""Deterministic, offline stand-in for the agent's language model."""
+from dspy.utils.dummies import DummyLM
+
+# Answers keyed by a marker in the prompt's final message (ChatAdapter names
+# the output fields there); the first matching key wins, "" matches anything.
+STUB_ANSWERS = {
+    "[[ ## sql_query ## ]]": {"reasoning": "Stub reasoning.", "sql_query": "SELECT COUNT(*) FROM Orders;"},
+    "[[ ## retrieved_docs ## ]]": {"answer": "Stub answer."},
+    "": {"answer": "hybrid"},
+}
+
+
+def make_stub_lm() -> DummyLM:
+    """A DummyLM that answers every agent signature with a fixed value, forever."""
+    return DummyLM(STUB_ANSWERS)
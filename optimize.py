@@ -1,101 +1,187 @@
 import os
 import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import click
 import dspy
-from dspy.teleprompter import BootstrapFewShot
-from agent.dspy_signatures import NLtoSQL, NLtoSQLSignature
-from agent.tools.sqlite_tool import SQLiteTool
+from dspy.teleprompt import BootstrapFewShot
+from agent.dspy_signatures import NLtoSQL
+from agent.tools.sqlite_tool import get_sql_tool
+from agent.tools.sql_eval import ExecutionEvaluator
+from agent.graph_hybrid import DB_PATH
 
 # --- Configuration ---
-LLM_MODEL = "gpt-4.1-mini" 
-LLM_CONFIG = dspy.OpenAI(model=LLM_MODEL, api_key=os.environ.get("OPENAI_API_KEY"))
-dspy.settings.configure(lm=LLM_CONFIG)
+LLM_MODEL = "gpt-4.1-mini"
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LM_CACHE_DIR = os.path.join(PROJECT_ROOT, ".lm_cache")
+GOLD_CACHE_PATH = os.path.join(PROJECT_ROOT, ".sql_eval_cache.sqlite")
+DEFAULT_THREADS = 16
+# Extra examples prefetched per wave beyond the demos still needed, for
+# teacher runs that fail the metric.
+PREFETCH_SLACK = 2
+METRIC_NAMES = {"exact": "SQL Exact Match", "execution": "SQL Execution Accuracy"}
 
-DB_TOOL = SQLiteTool()
-DB_SCHEMA = DB_TOOL.get_schema()
+def configure_lm(model: str = LLM_MODEL, cache_dir: str = LM_CACHE_DIR):
+    """Configures DSPy to call `model`, caching every response on disk.
+
+    DSPy keys its response cache by the full request (model, messages and
+    sampling parameters), so a rerun or a max_rounds sweep replays calls it has
+    already made instead of paying for them again.
+    """
+    dspy.configure_cache(enable_disk_cache=True, enable_memory_cache=True, disk_cache_dir=cache_dir)
+    dspy.configure(lm=dspy.LM(f"openai/{model}", api_key=os.environ.get("OPENAI_API_KEY"), cache=True))
 
 # --- Metric Definition ---
 def sql_exact_match(example, prediction, trace=None):
     """Simple metric: checks if the predicted SQL query exactly matches the gold query."""
     return example.sql_query.strip().lower() == prediction.sql_query.strip().lower()
 
+# --- Parallel bootstrapping ---
+class ParallelBootstrapFewShot(BootstrapFewShot):
+    """BootstrapFewShot that runs the teacher on upcoming examples in a thread pool.
+
+    Bootstrapping walks the trainset one example at a time and stops once it has
+    enough demos. Before each wave of examples, this runs the teacher on the
+    whole wave concurrently; the unchanged sequential pass then gets those LM
+    calls from the response cache, so it picks exactly the demos plain
+    BootstrapFewShot would. A wave holds the demos still needed plus
+    PREFETCH_SLACK examples (at most `num_threads`), so few prefetched calls go
+    unused. Retry rounds (round_idx > 0) are not prefetched.
+
+    This hooks BootstrapFewShot's private `_bootstrap` and
+    `_bootstrap_one_example`, so requirements.txt pins the DSPy version.
+    """
+
+    def __init__(self, *args, num_threads: int = DEFAULT_THREADS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_threads = num_threads
+
+    def _bootstrap(self, *, max_bootstraps=None):
+        self._positions = {id(example): i for i, example in enumerate(self.trainset)}
+        self._prefetched = 0
+        self._needed = max_bootstraps or self.max_bootstrapped_demos
+        return super()._bootstrap(max_bootstraps=max_bootstraps)
+
+    def _bootstrap_one_example(self, example, round_idx=0):
+        position = self._positions.get(id(example))
+        if round_idx == 0 and position is not None and position >= self._prefetched:
+            wave = self.trainset[position:position + min(self.num_threads, self._needed + PREFETCH_SLACK)]
+            self._prefetched = position + len(wave)
+            self._prefetch(wave)
+        success = super()._bootstrap_one_example(example, round_idx)
+        if success:
+            self._needed -= 1
+        return success
+
+    def _prefetch(self, examples):
+        def run(example):
+            # Same prompt as the sequential pass: the teacher without this example among its demos.
+            teacher = self.teacher.deepcopy()
+            for predictor in teacher.predictors():
+                predictor.demos = [x for x in predictor.demos if x != example]
+            try:
+                with dspy.context(trace=[], **self.teacher_settings):
+                    teacher(**example.inputs())
+            except Exception:
+                pass  # The sequential pass reruns the example and reports the error.
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, run, example) for example in examples]
+            for future in futures:
+                future.result()
+
+# --- Evaluation ---
+def evaluate_module(module, data, num_threads: int = DEFAULT_THREADS, metric=sql_exact_match) -> float:
+    """Fraction of `data` on which `metric` accepts the predicted SQL.
+
+    Examples run on a thread pool; a failed prediction counts as a miss.
+    """
+    evaluate = dspy.Evaluate(devset=data, metric=metric, num_threads=num_threads,
+                             display_progress=True, max_errors=len(data) + 1)
+    return round(evaluate(module).score / 100, 4)
+
 # --- Optimization Logic ---
-def optimize_nl_to_sql():
+def optimize_nl_to_sql(db_path: str = DB_PATH, num_threads: int = DEFAULT_THREADS, max_rounds: int = 1,
+                       metric_name: str = "execution", query_timeout: float = 5.0):
+    """Runs the optimization with the "execution" metric (gold and predicted SQL
+    return the same rows, see ExecutionEvaluator) or "exact" string match."""
     print("--- Starting NLtoSQL Optimization ---")
-    
+    if metric_name == "execution":
+        with ExecutionEvaluator(db_path, timeout=query_timeout, cache_path=GOLD_CACHE_PATH) as evaluator:
+            _optimize(db_path, num_threads, max_rounds, evaluator.metric, metric_name)
+    else:
+        _optimize(db_path, num_threads, max_rounds, sql_exact_match, metric_name)
+
+def _optimize(db_path: str, num_threads: int, max_rounds: int, metric, metric_name: str):
     # 1. Load Training Data
-    train_data_path = os.path.join(os.path.dirname(__file__), "nl_to_sql_train.json")
+    train_data_path = os.path.join(PROJECT_ROOT, "nl_to_sql_train.json")
     with open(train_data_path, 'r') as f:
         raw_data = json.load(f)
-        
-    # Convert raw data to DSPy Examples
+
+    # Convert raw data to DSPy Examples; the schema is introspected once and cached per DB version
+    db_schema = get_sql_tool(db_path).get_schema()
     trainset = []
     for item in raw_data:
         # Inject the actual DB schema into the example for training
         trainset.append(dspy.Example(
             question=item["question"],
-            db_schema=DB_SCHEMA,
+            db_schema=db_schema,
             constraints=item["constraints"],
             sql_query=item["sql_query"]
         ).with_inputs("question", "db_schema", "constraints"))
-        
+
     print(f"Loaded {len(trainset)} training examples.")
-    
+
     # 2. Define the Module to Optimize
     unoptimized_nl_to_sql = NLtoSQL()
-    
-    # 3. Run the Optimizer (BootstrapFewShot)
+
+    # 3. Run the Optimizer (BootstrapFewShot, with the teacher's LM calls prefetched in parallel)
     # We use a small number of examples (max_bootstrapped_demos=2) to keep it fast and local
-    teleprompter = BootstrapFewShot(metric=sql_exact_match, max_bootstrapped_demos=2, max_rounds=1)
-    
+    teleprompter = ParallelBootstrapFewShot(metric=metric, max_bootstrapped_demos=2,
+                                            max_rounds=max_rounds, num_threads=num_threads)
+
     optimized_nl_to_sql = teleprompter.compile(
-        unoptimized_nl_to_sql, 
+        unoptimized_nl_to_sql,
         trainset=trainset
     )
-    
+
     # 4. Save the Optimized Module
-    optimized_nl_to_sql.save("optimized_nl_to_sql.json")
+    optimized_nl_to_sql.save(os.path.join(PROJECT_ROOT, "optimized_nl_to_sql.json"))
     print("\n--- Optimization Complete ---")
     print("Optimized NLtoSQL module saved to optimized_nl_to_sql.json")
-    
+
     # 5. Show Before/After Metric (Simple check on the trainset)
-    
-    # Helper to evaluate
-    def evaluate_module(module, data):
-        correct = 0
-        for example in data:
-            try:
-                pred = module(
-                    question=example.question, 
-                    db_schema=example.db_schema, 
-                    constraints=example.constraints
-                )
-                if sql_exact_match(example, pred):
-                    correct += 1
-            except Exception as e:
-                print(f"Error during evaluation: {e}")
-                pass
-        return correct / len(data)
-
-    unoptimized_score = evaluate_module(unoptimized_nl_to_sql, trainset)
-    optimized_score = evaluate_module(optimized_nl_to_sql, trainset)
-    
-    print(f"\n[bold yellow]Metric (SQL Exact Match on Trainset):[/bold yellow]")
+    unoptimized_score = evaluate_module(unoptimized_nl_to_sql, trainset, num_threads, metric)
+    optimized_score = evaluate_module(optimized_nl_to_sql, trainset, num_threads, metric)
+
+    print(f"\nMetric ({METRIC_NAMES[metric_name]} on Trainset):")
     print(f"  Unoptimized Score: {unoptimized_score:.2f}")
     print(f"  Optimized Score: {optimized_score:.2f}")
-    
+
     # Save the metric delta for the README
-    with open("optimization_metric.json", "w") as f:
+    with open(os.path.join(PROJECT_ROOT, "optimization_metric.json"), "w") as f:
         json.dump({
             "module": "NLtoSQL",
             "optimizer": "BootstrapFewShot",
-            "metric": "SQL Exact Match on Trainset",
+            "metric": f"{METRIC_NAMES[metric_name]} on Trainset",
             "unoptimized_score": unoptimized_score,
             "optimized_score": optimized_score
         }, f)
-    
+
     print("Metric delta saved to optimization_metric.json")
 
+@click.command()
+@click.option('--db', default=DB_PATH, show_default=True, help='Northwind SQLite database used for the schema.')
+@click.option('--threads', default=DEFAULT_THREADS, show_default=True, type=click.IntRange(min=1), help='Concurrent LM calls while bootstrapping and evaluating.')
+@click.option('--max-rounds', default=1, show_default=True, help='BootstrapFewShot attempts per training example.')
+@click.option('--model', default=LLM_MODEL, show_default=True, help='OpenAI model name.')
+@click.option('--cache-dir', default=LM_CACHE_DIR, show_default=True, help='On-disk LM response cache.')
+@click.option('--metric', 'metric_name', default='execution', show_default=True, type=click.Choice(list(METRIC_NAMES)), help='Compare SQL by execution result or by exact text.')
+@click.option('--query-timeout', default=5.0, show_default=True, help='Per-query timeout (seconds) for the execution metric.')
+def main(db: str, threads: int, max_rounds: int, model: str, cache_dir: str, metric_name: str, query_timeout: float):
+    """Optimizes the NLtoSQL module with BootstrapFewShot and reports the metric delta."""
+    configure_lm(model, cache_dir)
+    optimize_nl_to_sql(db, threads, max_rounds, metric_name, query_timeout)
+
 if __name__ == '__main__':
-    # Change directory to the project root for correct relative path resolution
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    optimize_nl_to_sql()
+    main()
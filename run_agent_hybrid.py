@@ -1,78 +1,421 @@
 import os
+import sys
 import json
+import time
+import hashlib
+import itertools
 import click
-from rich.console import Console
-from agent.graph_hybrid import build_graph
-import dspy
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import agent.graph_hybrid as graph_hybrid
+from agent.graph_hybrid import InlineGraph, build_graph, prefetch_docs
+from agent.lm_cache import get_lm_cache
+from agent.sql_templates import inline_params
+from agent.instrumentation import (start_trace, failure_record, install_dspy_callback,
+                                   LatencySummary, export_chrome_trace)
 
 
-console = Console()
+class _LazyConsole:
+    """rich's Console, imported on the first print so --help never loads rich.
 
-def load_questions(batch_file: str) -> list:
-    """Loads questions from a JSONL file."""
-    questions = []
-    try:
-        with open(batch_file, 'r') as f:
-            for line in f:
-                questions.append(json.loads(line))
-    except FileNotFoundError:
-        console.print(f"[bold red]Error:[/bold red] Batch file not found at {batch_file}")
-        exit(1)
-    return questions
-
-def run_agent(question_data: dict, app) -> dict:
-    """Runs the LangGraph agent for a single question."""
-    question_id = question_data["id"]
-    question = question_data["question"]
-    
-    console.print(f"\n[bold blue]Processing Question ID:[/bold blue] {question_id}")
-    console.print(f"[bold blue]Question:[/bold blue] {question}")
-    
+    Set `quiet` to drop all output (the server does without --verbose).
+    """
+
+    def __init__(self):
+        self.quiet = False
+        self._console = None
+
+    def print(self, *objects, **kwargs):
+        if self.quiet:
+            return
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console()
+        self._console.print(*objects, **kwargs)
+
+console = _LazyConsole()
+
+# Questions whose docs are retrieved together in one retrieve_many call.
+PREFETCH_CHUNK_SIZE = 256
+# Output lines between fsyncs; every line is flushed to the OS immediately.
+FSYNC_EVERY = 100
+# --engine auto runs batches of up to this many questions inline: importing
+# LangGraph costs about a second, which dominates a short run.
+AUTO_INLINE_MAX_QUESTIONS = 100
+
+# --- Streaming input ---
+def load_questions(batch_file: str):
+    """Streams questions from a JSONL file, skipping blank and malformed lines."""
+    with open(batch_file, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                console.print(f"[bold red]Warning:[/bold red] Skipping malformed line {line_no} of {batch_file}: {e}")
+
+def count_questions(batch_file: str, limit: int) -> int:
+    """Non-blank lines of the batch file, counting no further than `limit` + 1."""
+    count = 0
+    with open(batch_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                count += 1
+                if count > limit:
+                    break
+    return count
+
+def pick_engine(engine: str, batch_file: str) -> str:
+    """Resolves --engine auto: inline for short batches, LangGraph otherwise."""
+    if engine != "auto":
+        return engine
+    return "inline" if count_questions(batch_file, AUTO_INLINE_MAX_QUESTIONS) <= AUTO_INLINE_MAX_QUESTIONS else "langgraph"
+
+def shard_of(question_id, num_shards: int) -> int:
+    """Stable shard of a question id, identical across machines and runs."""
+    digest = hashlib.sha1(str(question_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+def truncate_partial_line(path: str) -> list:
+    """Cuts off a trailing partial line left by a crash, so that appended
+    lines start on a fresh line; returns the complete lines kept."""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb+') as f:
+        lines = []
+        complete = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            complete += len(line)
+            lines.append(line)
+        f.truncate(complete)
+    return lines
+
+def read_done_ids(out_path: str) -> set:
+    """Ids already written to out_path, for --resume (see truncate_partial_line)."""
+    done = set()
+    for line in truncate_partial_line(out_path):
+        try:
+            done.add(json.loads(line)["id"])
+        except (ValueError, KeyError, TypeError):
+            pass
+    return done
+
+def with_prefetched_docs(questions, chunk_size: int = PREFETCH_CHUNK_SIZE):
+    """Yields (question_data, retrieved_docs), retrieving docs a chunk at a time."""
+    questions = iter(questions)
+    while True:
+        chunk = list(itertools.islice(questions, chunk_size))
+        if not chunk:
+            return
+        if len(chunk) == 1:
+            # Nothing to batch: retrieve_docs fetches the docs if the route needs them.
+            yield chunk[0], None
+            continue
+        yield from zip(chunk, prefetch_docs([question_data["question"] for question_data in chunk]))
+
+def _initial_state(question_data: dict, retrieved_docs: list = None) -> dict:
     initial_state = {
-        "question": question,
+        "question": question_data["question"],
         "repair_count": 0
     }
+    if retrieved_docs is not None:
+        initial_state["retrieved_docs"] = retrieved_docs
+    return initial_state
+
+def _to_result(question_data: dict, result_state: dict) -> dict:
+    """Builds the output record for a finished graph run."""
+    # This is a placeholder for the final output structure
+    result = {
+        "id": question_data["id"],
+        "final_answer": result_state.get("final_answer", "No answer generated."),
+        # Template queries carry `?` binds; the record gets runnable SQL.
+        "sql": inline_params(result_state.get("sql_query", ""), result_state.get("sql_params")),
+        "confidence": 0.85,  # Placeholder
+        "explanation": "Answer generated by the agent.", # Placeholder
+        "citations": result_state.get("citations", [])
+    }
     
-    try:
-        # The actual graph execution logic will be more complex
-        # For now, we just invoke it and get a placeholder result
-        result_state = app.invoke(initial_state)
-        
-        # This is a placeholder for the final output structure
-        final_answer = result_state.get("final_answer", "No answer generated.")
-        sql_query = result_state.get("sql_query", "")
-        citations = result_state.get("citations", [])
-        
-        result = {
-            "id": question_id,
-            "final_answer": final_answer,
-            "sql": sql_query,
-            "confidence": 0.85,  # Placeholder
-            "explanation": "Answer generated by the agent.", # Placeholder
-            "citations": citations
-        }
-        
-        console.print(f"[bold green]Final Answer:[/bold green] {result['final_answer']}")
-        console.print(f"[bold green]SQL:[/bold green] {result['sql']}")
-        console.print(f"[bold green]Citations:[/bold green] {', '.join(result['citations'])}")
-        
-        return result
+    console.print(f"[bold green]Final Answer:[/bold green] {result['final_answer']}")
+    console.print(f"[bold green]SQL:[/bold green] {result['sql']}")
+    console.print(f"[bold green]Citations:[/bold green] {', '.join(result['citations'])}")
+    return result
+
+def error_result(question_id, message: str, explanation: str) -> dict:
+    console.print(f"[bold red]Critical Error for {question_id}:[/bold red] {message}")
+    return {
+        "id": question_id,
+        "final_answer": f"CRITICAL ERROR: {message}",
+        "sql": "",
+        "confidence": 0.0,
+        "explanation": explanation,
+        "citations": []
+    }
+
+def timeout_result(question_id, timeout: float) -> dict:
+    return error_result(question_id, f"timed out after {timeout:g}s", "Question exceeded the per-question timeout.")
 
+def run_agent(question_data: dict, app, retrieved_docs: list = None) -> dict:
+    """Runs the LangGraph agent for a single question.
+
+    `retrieved_docs` are prefetched retrieval results (see prefetch_docs).
+    """
+    question_id = question_data["id"]
+    
+    console.print(f"\n[bold blue]Processing Question ID:[/bold blue] {question_id}")
+    console.print(f"[bold blue]Question:[/bold blue] {question_data['question']}")
+    
+    try:
+        result_state = app.invoke(_initial_state(question_data, retrieved_docs))
+        return _to_result(question_data, result_state)
     except Exception as e:
-        console.print(f"[bold red]Critical Error for {question_id}:[/bold red] {e}")
-        return {
-            "id": question_id,
-            "final_answer": f"CRITICAL ERROR: {e}",
-            "sql": "",
-            "confidence": 0.0,
-            "explanation": "Critical error during graph execution.",
-            "citations": []
-        }
+        return error_result(question_id, str(e), "Critical error during graph execution.")
+
+def traced_run(question_data: dict, app, retrieved_docs: list = None):
+    """run_agent under a fresh trace; returns (result, trace record)."""
+    trace = start_trace(question_data["id"])
+    result = run_agent(question_data, app, retrieved_docs)
+    return result, trace.to_record()
+
+# --- Concurrent batch execution ---
+class OrderedWriter:
+    """Writes results to a JSONL file in input order as they finish.
+
+    Results that finish early wait in memory until every earlier one has been
+    written. Each line is flushed immediately, so a crash of the process loses
+    no result that was already written, and the file is fsynced every
+    `fsync_every` lines to survive a crash of the machine; `close` writes
+    whatever is still buffered. Trace records go to `trace_f` alongside.
+    """
+
+    def __init__(self, f, trace_f=None, fsync_every: int = FSYNC_EVERY):
+        self.f = f
+        self.trace_f = trace_f
+        self.fsync_every = fsync_every
+        self.next_index = 0
+        self.pending = {}
+        self.written = 0
+
+    def add(self, index: int, result: dict, record: dict = None):
+        self.pending[index] = (result, record)
+        while self.next_index in self.pending:
+            self._write(*self.pending.pop(self.next_index))
+            self.next_index += 1
+
+    def close(self):
+        # Only non-empty after an abort: keep the finished results, in order.
+        for index in sorted(self.pending):
+            self._write(*self.pending.pop(index))
+        self._sync()
+
+    def _write(self, result: dict, record: dict = None):
+        self.f.write(json.dumps(result) + '\n')
+        self.f.flush()
+        if self.trace_f is not None and record is not None:
+            self.trace_f.write(json.dumps(record) + '\n')
+            self.trace_f.flush()
+        self.written += 1
+        if self.written % self.fsync_every == 0:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self.f.fileno())
+        if self.trace_f is not None:
+            os.fsync(self.trace_f.fileno())
+
+_WORKER_APP = None
+
+def _init_worker(engine: str = "langgraph"):
+    global _WORKER_APP
+    _WORKER_APP = build_graph(engine=engine)
+
+def _run_in_worker(question_data: dict, retrieved_docs: list = None):
+    return traced_run(question_data, _WORKER_APP, retrieved_docs)
+
+def _run_pool(make_executor, submit, items, workers: int, timeout: float, emit):
+    """Keeps at most `workers` questions in flight and emits results as they finish.
+
+    `items` is consumed lazily, so only the questions in flight are held in
+    memory. A question running longer than `timeout` is reported as timed out
+    and abandoned together with its pool: later questions go to a fresh pool
+    from `make_executor`, and the old one is shut down without waiting. A
+    process pool also has its workers terminated once its other questions are
+    done, so a question that hangs forever never holds up the run. (A thread
+    cannot be killed: a hung thread keeps running until it returns.)
+    """
+    items = enumerate(items)
+    executor = make_executor()
+    running = {}  # future -> (index, question id, start time, executor)
+    retired = []  # (pool, its worker processes) for pools with an abandoned question
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(running) < workers:
+                entry = next(items, None)
+                if entry is None:
+                    exhausted = True
+                    break
+                index, (question_data, retrieved_docs) = entry
+                future = submit(executor, question_data, retrieved_docs)
+                running[future] = (index, question_data["id"], time.monotonic(), executor)
+            if exhausted and not running:
+                return
+            wait_for = None
+            if timeout is not None:
+                oldest = min(start for _, _, start, _ in running.values())
+                wait_for = max(0.0, oldest + timeout - time.monotonic())
+            done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(running):
+                index, question_id, start, owner = running[future]
+                if future in done:
+                    del running[future]
+                    try:
+                        emit(index, *future.result())
+                    except Exception as e:  # e.g. a worker process died
+                        emit(index, error_result(question_id, repr(e), "Worker failed while running the question."),
+                             failure_record(question_id, "error"))
+                elif timeout is not None and now - start >= timeout:
+                    del running[future]
+                    future.cancel()
+                    emit(index, timeout_result(question_id, timeout), failure_record(question_id, "timeout", timeout * 1000))
+                    if owner is executor:
+                        # shutdown() forgets the pool's processes, so keep them to terminate later.
+                        retired.append((owner, _worker_processes(owner)))
+                        owner.shutdown(wait=False, cancel_futures=True)
+                        executor = make_executor()
+            busy = {owner for _, _, _, owner in running.values()}
+            for entry in [entry for entry in retired if entry[0] not in busy]:
+                retired.remove(entry)
+                _terminate(entry[1])
+    finally:
+        for _, processes in retired:
+            _terminate(processes)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _worker_processes(executor) -> list:
+    """The worker processes of a process pool (none for a thread pool)."""
+    # ProcessPoolExecutor has no public handle on its workers before Python 3.14.
+    return list((getattr(executor, "_processes", None) or {}).values())
+
+def _terminate(processes: list):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+async def _run_async(app, items, workers: int, timeout: float, emit):
+    """Runs up to `workers` questions concurrently through the graph's async API."""
+    import asyncio
+
+    async def run_one(index, question_data, retrieved_docs):
+        console.print(f"\n[bold blue]Processing Question ID:[/bold blue] {question_data['id']}")
+        # Each task runs in its own context, and ainvoke carries it into the
+        # executor threads that run the sync nodes.
+        trace = start_trace(question_data["id"])
+        try:
+            result_state = await asyncio.wait_for(app.ainvoke(_initial_state(question_data, retrieved_docs)), timeout)
+            result = _to_result(question_data, result_state)
+        except asyncio.TimeoutError:
+            trace.status = "timeout"
+            result = timeout_result(question_data["id"], timeout)
+        except Exception as e:
+            trace.status = "error"
+            result = error_result(question_data["id"], str(e), "Critical error during graph execution.")
+        return index, result, trace.to_record()
+
+    items = enumerate(items)
+    running = set()
+    exhausted = False
+    while True:
+        while not exhausted and len(running) < workers:
+            entry = next(items, None)
+            if entry is None:
+                exhausted = True
+                break
+            index, (question_data, retrieved_docs) = entry
+            running.add(asyncio.ensure_future(run_one(index, question_data, retrieved_docs)))
+        if not running:
+            return
+        done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            emit(*task.result())
+
+def run_batch(app, items, workers: int = 1, mode: str = "thread", timeout: float = None, emit=None):
+    """Runs (question_data, retrieved_docs) items and calls
+    emit(index, result, trace_record) as each one finishes; `index` is the
+    item's position in `items`.
+
+    `mode` is "thread" (a thread pool sharing `app`), "process" (a process pool,
+    each worker building its own graph) or "async" (`app.ainvoke` on one event
+    loop). Answering is I/O-bound on LLM calls, so threads or async usually
+    suffice; processes sidestep the GIL for CPU-heavy steps.
+    """
+    if mode == "async":
+        import asyncio
+
+        asyncio.run(_run_async(app, items, workers, timeout, emit))
+    elif mode == "process":
+        def submit(executor, question_data, retrieved_docs):
+            return executor.submit(_run_in_worker, question_data, retrieved_docs)
+        from concurrent.futures import ProcessPoolExecutor
+
+        engine = "inline" if isinstance(app, InlineGraph) else "langgraph"
+        def make_executor():
+            return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine,))
+        _run_pool(make_executor, submit, items, workers, timeout, emit)
+    else:
+        def submit(executor, question_data, retrieved_docs):
+            return executor.submit(traced_run, question_data, app, retrieved_docs)
+        _run_pool(lambda: ThreadPoolExecutor(max_workers=workers), submit, items, workers, timeout, emit)
+
+def trace_path_for(out: str) -> str:
+    """outputs_hybrid.jsonl -> outputs_hybrid.trace.jsonl"""
+    return os.path.splitext(out)[0] + ".trace.jsonl"
+
+def print_latency_summary(summary: LatencySummary):
+    from rich.table import Table
+
+    table = Table(title="Per-node latency (ms)")
+    for column in ("node", "calls", "mean", "p50", "p95", "p99"):
+        table.add_column(column, justify="left" if column == "node" else "right")
+    for row in summary.rows():
+        table.add_row(row["node"], str(row["calls"]),
+                      *(f"{row[key]:.2f}" for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms")))
+    console.print(table)
+
+def print_lm_cache_stats():
+    """Hit rate of the LM cache in this process (process-mode workers keep their own)."""
+    stats = get_lm_cache(graph_hybrid.LM_CACHE_PATH).stats()
+    lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+    if lookups:
+        console.print(f"[bold green]LM cache:[/bold green] {stats['hit_rate']:.1%} hit rate over {lookups} calls "
+                      f"({stats['hits']} memory, {stats['disk_hits']} disk, {stats['misses']} misses, "
+                      f"{stats['expired']} expired, {stats['evictions']} evicted)")
+
+def _parse_shard(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise click.BadParameter("expected i/n, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise click.BadParameter("expected 0 <= i < n")
+    return index, count
 
 @click.command()
-@click.option('--batch', required=True, help='Path to the JSONL file containing batch questions.')
+@click.option('--batch', required=True, type=click.Path(exists=True, dir_okay=False), help='Path to the JSONL file containing batch questions.')
 @click.option('--out', required=True, help='Path to the output JSONL file.')
-def main(batch: str, out: str):
+@click.option('--workers', default=1, show_default=True, type=click.IntRange(min=1), help='Number of questions answered concurrently.')
+@click.option('--mode', default='thread', show_default=True, type=click.Choice(['thread', 'process', 'async']), help='Concurrency model for the workers.')
+@click.option('--timeout', default=None, type=float, help='Per-question timeout in seconds.')
+@click.option('--resume', is_flag=True, help='Append to --out, skipping question ids it already contains.')
+@click.option('--shard', default=None, callback=_parse_shard, help='Only answer shard i of n (e.g. 0/4), split by a stable hash of the question id.')
+@click.option('--chrome-trace', default=None, help='Also export the run\'s traces as Chrome trace-event JSON to this path.')
+@click.option('--engine', default='auto', show_default=True, type=click.Choice(['auto', 'langgraph', 'inline']), help='Run the graph with LangGraph, or inline in plain Python (fast startup for short-lived runs); auto runs batches of up to 100 questions inline.')
+def main(batch: str, out: str, workers: int, mode: str, timeout: float, resume: bool, shard, chrome_trace: str, engine: str):
     """
     Retail Analytics Copilot: A hybrid RAG/SQL agent built with DSPy and LangGraph.
     """
@@ -83,23 +426,45 @@ def main(batch: str, out: str):
     # console.print("[bold green]DSPy Language Model configured.[/bold green]")
     
     # 1. Build the graph
-    app = build_graph()
+    app = build_graph(engine=pick_engine(engine, batch))
+    if "dspy" in sys.modules:
+        # An LM can only be configured once DSPy is imported; without one
+        # there is no usage to record, and DSPy stays unloaded.
+        install_dspy_callback()
     
-    # 2. Load questions
+    # 2. Stream questions, keeping this shard's and skipping those already answered
     questions = load_questions(batch)
+    if shard is not None:
+        shard_index, num_shards = shard
+        questions = (q for q in questions if shard_of(q["id"], num_shards) == shard_index)
+    trace_path = trace_path_for(out)
+    if resume:
+        done_ids = read_done_ids(out)
+        truncate_partial_line(trace_path)
+        console.print(f"[bold yellow]Resuming:[/bold yellow] {len(done_ids)} questions already in {out}")
+        questions = (q for q in questions if q["id"] not in done_ids)
+    
+    # 3. Retrieve docs a chunk of questions at a time
+    items = with_prefetched_docs(questions)
     
-    # 3. Process questions
-    results = []
-    for question_data in questions:
-        result = run_agent(question_data, app)
-        results.append(result)
-        
-    # 4. Write output
-    with open(out, 'w') as f:
-        for result in results:
-            f.write(json.dumps(result) + '\n')
+    # 4. Process questions, appending each result (and its trace) in order as soon as it is ready
+    summary = LatencySummary()
+    def emit(index, result, record):
+        summary.add(record)
+        writer.add(index, result, record)
+    with open(out, 'a' if resume else 'w') as f, open(trace_path, 'a' if resume else 'w') as trace_f:
+        writer = OrderedWriter(f, trace_f)
+        try:
+            run_batch(app, items, workers=workers, mode=mode, timeout=timeout, emit=emit)
+        finally:
+            writer.close()
             
-    console.print(f"\n[bold green]Processing Complete.[/bold green] Results written to {out}")
+    console.print(f"\n[bold green]Processing Complete.[/bold green] {writer.written} results written to {out}, traces to {trace_path}")
+    print_latency_summary(summary)
+    print_lm_cache_stats()
+    if chrome_trace:
+        count = export_chrome_trace(trace_path, chrome_trace)
+        console.print(f"[bold green]Chrome trace[/bold green] for {count} questions written to {chrome_trace}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,333 @@
+"""Long-running local query server for the hybrid agent.
+
+The graph, the retriever index, the router and the pooled SQLite connections
+are built once at startup and stay warm between requests:
+
+    python serve_agent_hybrid.py --port 8765
+
+    curl -s localhost:8765/ask -d '{"id": "q1", "question": "...", "format_hint": "int"}'
+    curl -s localhost:8765/stats
+
+POST /ask takes one question in the schema of sample_questions_hybrid_eval.jsonl,
+a JSON list of them, or JSONL, and answers with the records run_agent_hybrid.py
+writes to --out (a single record for a single question, otherwise a list in
+request order). GET /stats reports request counts, queue depth, batching, the
+per-node latency percentiles and the LM cache; GET /health is a liveness check.
+"""
+import json
+import time
+import queue
+import threading
+import click
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import agent.graph_hybrid as graph_hybrid
+import run_agent_hybrid
+from agent.graph_hybrid import build_graph, prefetch_docs, warm_up
+from agent.lm_cache import get_lm_cache
+from agent.instrumentation import failure_record, LatencySummary
+from run_agent_hybrid import error_result, timeout_result
+
+DEFAULT_PORT = 8765
+# Largest request body accepted, in bytes.
+MAX_BODY_BYTES = 4 * 1024 * 1024
+# Seconds a client is told to wait before retrying a rejected request.
+RETRY_AFTER_S = 1
+
+
+# --- Batching queue ---
+class AgentServer:
+    """Answers questions with one warm graph, a batch at a time.
+
+    Admitted questions wait in a queue of at most `queue_size`. A dispatcher
+    thread takes up to `batch_size` of them (waiting at most `batch_wait`
+    seconds for a batch to fill once the first one arrives), retrieves their
+    docs in one pass and hands them to `workers` threads that run the graph.
+    The dispatcher only starts a batch when a worker is free and hands its
+    questions out as workers free up, so when the workers fall behind the
+    queue fills up and `submit` refuses new questions instead of buffering
+    them without bound.
+    """
+
+    def __init__(self, app, workers: int = 4, queue_size: int = 256, batch_size: int = 32,
+                 batch_wait: float = 0.005, timeout: float = None):
+        self.app = app
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.started = time.time()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._submit_lock = threading.Lock()
+        self._free_workers = threading.Semaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-worker")
+        self._dispatcher = threading.Thread(target=self._dispatch, name="agent-dispatcher", daemon=True)
+        self._stats_lock = threading.Lock()
+        self._summary = LatencySummary()
+        self._counts = {"requests": 0, "rejected": 0, "questions": 0, "errors": 0, "timeouts": 0,
+                        "batches": 0, "batched_questions": 0, "running": 0}
+
+    def start(self) -> "AgentServer":
+        self._dispatcher.start()
+        return self
+
+    def close(self):
+        """Answers the questions already admitted, then stops the workers."""
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def submit(self, questions: list):
+        """Queues the questions; returns one Future per question, or None if the
+        queue has no room for all of them (nothing is queued then)."""
+        futures = [Future() for _ in questions]
+        with self._submit_lock:
+            # Only submitters add to the queue, so the room can only grow
+            # between this check and the puts.
+            if self._queue.qsize() + len(questions) > self.queue_size:
+                with self._stats_lock:
+                    self._counts["rejected"] += 1
+                return None
+            for question_data, future in zip(questions, futures):
+                self._queue.put_nowait((question_data, future))
+        with self._stats_lock:
+            self._counts["requests"] += 1
+        return futures
+
+    def results(self, questions: list, futures: list, admitted: float) -> list:
+        """The questions' output records, in order. The request shares one
+        deadline, `timeout` seconds after it was `admitted` (time.monotonic()
+        before `submit`), queueing included; questions still unanswered then
+        get timeout records (they keep their workers until the graph returns)."""
+        deadline = None if self.timeout is None else admitted + self.timeout
+        records = []
+        for question_data, future in zip(questions, futures):
+            try:
+                records.append(future.result(
+                    timeout=None if deadline is None else max(0.0, deadline - time.monotonic())))
+            except FutureTimeout:
+                with self._stats_lock:
+                    self._counts["timeouts"] += 1
+                records.append(timeout_result(question_data["id"], self.timeout))
+        return records
+
+    def _dispatch(self):
+        stopping = False
+        while not stopping:
+            self._free_workers.acquire()
+            entry = self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    # Finish this batch, then stop.
+                    stopping = True
+                    break
+                batch.append(entry)
+            with self._stats_lock:
+                self._counts["batches"] += 1
+                self._counts["batched_questions"] += len(batch)
+            if len(batch) == 1:
+                # Nothing to batch: retrieve_docs fetches the docs if the route needs them.
+                docs = [None]
+            else:
+                docs = prefetch_docs([question_data["question"] for question_data, _ in batch])
+            for i, ((question_data, future), retrieved_docs) in enumerate(zip(batch, docs)):
+                if i:
+                    self._free_workers.acquire()
+                self._executor.submit(self._run, question_data, future, retrieved_docs)
+
+    def _run(self, question_data: dict, future: Future, retrieved_docs: list = None):
+        with self._stats_lock:
+            self._counts["running"] += 1
+        try:
+            result, record = run_agent_hybrid.traced_run(question_data, self.app, retrieved_docs)
+        except Exception as e:
+            result = error_result(question_data["id"], repr(e), "Server failed while running the question.")
+            record = failure_record(question_data["id"], "error")
+        finally:
+            self._free_workers.release()
+        with self._stats_lock:
+            self._counts["running"] -= 1
+            self._counts["questions"] += 1
+            if record["status"] != "ok":
+                self._counts["errors"] += 1
+            self._summary.add(record)
+        future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            counts = dict(self._counts)
+            nodes = self._summary.rows()
+        batches = counts.pop("batches")
+        batched = counts.pop("batched_questions")
+        return {
+            "uptime_s": round(time.time() - self.started, 3),
+            **counts,
+            "queued": self._queue.qsize(),
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "batches": batches,
+            "mean_batch_size": round(batched / batches, 2) if batches else 0.0,
+            "nodes": nodes,
+            "lm_cache": get_lm_cache(graph_hybrid.LM_CACHE_PATH).stats(),
+        }
+
+
+# --- HTTP front end ---
+def parse_questions(body: bytes):
+    """Questions in a request body: a JSON object, a JSON list or JSONL.
+
+    Returns (questions, single) or raises ValueError with a message for the client.
+    """
+    text = body.decode("utf-8")
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        # JSONL: one question per non-blank line.
+        parsed = [json.loads(line) for line in text.splitlines() if line.strip()]
+    single = isinstance(parsed, dict)
+    questions = [parsed] if single else parsed
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("expected a question object, a non-empty list of them, or JSONL")
+    for question_data in questions:
+        if not isinstance(question_data, dict) or "id" not in question_data \
+                or not isinstance(question_data.get("question"), str):
+            raise ValueError("each question needs an 'id' and a 'question' string")
+    return questions, single
+
+
+def parse_content_length(value) -> int:
+    """The Content-Length header as a byte count (0 if absent); raises ValueError
+    with a message for the client if it is not a non-negative integer."""
+    if value is None:
+        return 0
+    value = value.strip()
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError(f"invalid Content-Length {value!r}")
+    return int(value)
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    server_version = "HybridAgent/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.server.agent.stats())
+        elif self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/ask":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = parse_content_length(self.headers.get("Content-Length"))
+        except ValueError as e:
+            # The body was not read, so the connection cannot be reused.
+            self.close_connection = True
+            self._send(400, {"error": str(e)})
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": f"request body over {MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            questions, single = parse_questions(self.rfile.read(length))
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        agent = self.server.agent
+        if len(questions) > agent.queue_size:
+            # Would be refused however long the client waited: not a 503.
+            self._send(413, {"error": f"{len(questions)} questions in one request; the queue holds "
+                                      f"{agent.queue_size}, send them in smaller requests"})
+            return
+        admitted = time.monotonic()
+        futures = agent.submit(questions)
+        if futures is None:
+            self._send(503, {"error": "queue full, retry later"}, {"Retry-After": str(RETRY_AFTER_S)})
+            return
+        results = agent.results(questions, futures, admitted)
+        self._send(200, results[0] if single else results)
+
+    def _send(self, status: int, payload, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class AgentHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Listen backlog; socketserver's default of 5 resets bursts of clients
+    # before the queue can answer them with a 503.
+    request_queue_size = 128
+
+    def __init__(self, address, agent: AgentServer, verbose: bool = False):
+        super().__init__(address, AgentRequestHandler)
+        self.agent = agent
+        self.verbose = verbose
+
+
+def make_server(host: str = "127.0.0.1", port: int = DEFAULT_PORT, engine: str = "langgraph",
+                verbose: bool = False, **options) -> AgentHTTPServer:
+    """Builds and warms the graph and binds the server (port 0 picks a free port).
+
+    `options` are passed to AgentServer. Call `serve_forever()` on the result,
+    then `shutdown()`, `server_close()` and `agent.close()` to stop it.
+    """
+    # Per-question answers go to the console only with --verbose.
+    run_agent_hybrid.console.quiet = not verbose
+    app = build_graph(engine=engine)
+    warm_up()
+    return AgentHTTPServer((host, port), AgentServer(app, **options).start(), verbose=verbose)
+
+
+@click.command()
+@click.option('--host', default="127.0.0.1", show_default=True, help='Address to listen on.')
+@click.option('--port', default=DEFAULT_PORT, show_default=True, type=click.IntRange(min=0), help='Port to listen on (0 picks a free one).')
+@click.option('--workers', default=4, show_default=True, type=click.IntRange(min=1), help='Questions answered concurrently.')
+@click.option('--queue-size', default=256, show_default=True, type=click.IntRange(min=1), help='Questions that may wait for a worker; requests beyond it get 503.')
+@click.option('--batch-size', default=32, show_default=True, type=click.IntRange(min=1), help='Most questions whose docs are retrieved in one pass.')
+@click.option('--batch-wait-ms', default=5.0, show_default=True, type=click.FloatRange(min=0), help='How long a batch waits to fill once its first question arrives.')
+@click.option('--timeout', default=None, type=float, help='Seconds a request may take from admission, queueing included; questions unanswered by then get timeout records.')
+@click.option('--engine', default='langgraph', show_default=True, type=click.Choice(['langgraph', 'inline']), help='Run the graph with LangGraph, or inline in plain Python.')
+@click.option('--verbose', is_flag=True, help='Log each request and print each answer.')
+def main(host: str, port: int, workers: int, queue_size: int, batch_size: int, batch_wait_ms: float,
+         timeout: float, engine: str, verbose: bool):
+    """Serves the hybrid agent over HTTP on a local address."""
+    start = time.perf_counter()
+    server = make_server(host, port, engine=engine, verbose=verbose, workers=workers, queue_size=queue_size,
+                         batch_size=batch_size, batch_wait=batch_wait_ms / 1000, timeout=timeout)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} (warm in {time.perf_counter() - start:.2f}s); Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.agent.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import json
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# `agent` is a namespace package and the runner scripts live at the root.
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.northwind import create_northwind  # noqa: E402
+
+DOCS_DIR = os.path.join(PROJECT_ROOT, "docs")
+SAMPLE_QUESTIONS = os.path.join(PROJECT_ROOT, "sample_questions_hybrid_eval.jsonl")
+
+
+@pytest.fixture(scope="session")
+def docs_dir() -> str:
+    return DOCS_DIR
+
+
+@pytest.fixture(scope="session")
+def sample_questions() -> list:
+    """The records of sample_questions_hybrid_eval.jsonl."""
+    with open(SAMPLE_QUESTIONS) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.fixture(scope="session")
+def northwind_db(tmp_path_factory) -> str:
+    """A synthetic Northwind database shared by the session; tests must not write to it."""
+    return create_northwind(str(tmp_path_factory.mktemp("northwind") / "northwind.sqlite"))
+
+
+@pytest.fixture
+def stub_lm():
+    """The benchmarks' offline DummyLM, configured for the test."""
+    dspy = pytest.importorskip("dspy")
+    from benchmarks.stub_lm import make_stub_lm
+
+    lm = make_stub_lm()
+    with dspy.context(lm=lm):
+        yield lm
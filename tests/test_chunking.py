@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from agent.rag.chunking import chunk_corpus
+
+
+@pytest.fixture
+def docs(tmp_path) -> str:
+    (tmp_path / "policy.md").write_text("## Returns\nUnopened beverages: 14 days.\n")
+    return str(tmp_path)
+
+
+def test_same_size_edit_is_detected(docs):
+    chunks = chunk_corpus(docs)
+    path = os.path.join(docs, "policy.md")
+    with open(path, "r+") as f:
+        f.write(f.read().replace("14", "30"))
+    # Force a different mtime even on filesystems with coarse timestamps.
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    with pytest.raises(ValueError, match="changed since it was chunked"):
+        chunks.text(0)
+
+
+def test_touched_file_is_still_served(docs):
+    chunks = chunk_corpus(docs)
+    path = os.path.join(docs, "policy.md")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert "14 days" in chunks.text(0)
@@ -0,0 +1,61 @@
+import pytest
+
+from agent.constraints import ConstraintIndex
+from agent.sql_templates import select_template
+
+CATEGORIES = ["Beverages", "Condiments", "Confections", "Dairy Products", "Grains/Cereals", "Meat/Poultry",
+              "Produce", "Seafood"]
+SUMMER = ("1997-06-01", "1997-06-30")
+WINTER = ("1997-12-01", "1997-12-31")
+
+
+@pytest.fixture(scope="module")
+def index(docs_dir) -> ConstraintIndex:
+    return ConstraintIndex.from_docs(docs_dir)
+
+
+def dates(constraints: dict) -> tuple:
+    return constraints.get("start_date"), constraints.get("end_date")
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What was the AOV during Summer Beverages 1997?", SUMMER),
+    ("What was the AOV during 'Sumer Beverages 1997'?", SUMMER),
+    ("What was the AOV during Sumer Beverages 1997?", SUMMER),
+    ("What was the AOV during summer beverages?", SUMMER),
+    ("What was the AOV during Winter Classics?", WINTER),
+    ("What was the AOV during winter clasics 1997?", WINTER),
+])
+def test_event_dates(index, question, expected):
+    constraints = index.constraints(question, CATEGORIES)
+    assert dates(constraints) == expected
+    assert "unresolved_event" not in constraints
+
+
+def test_misspelt_event_is_not_a_category(index):
+    assert index.constraints("What was the AOV during Sumer Beverages 1997?", CATEGORIES)["category"] is None
+    assert index.constraints("Beverages revenue during Summer Beverages 1997", CATEGORIES)["category"] == "Beverages"
+
+
+@pytest.mark.parametrize("question, phrase", [
+    ("What was the revenue in summer 1997?", "summer"),
+    ("What was the AOV during Winter Classics 1998?", "winter classics"),
+])
+def test_partial_event_gets_no_dates(index, question, phrase):
+    constraints = index.constraints(question, CATEGORIES)
+    assert dates(constraints) == (None, None)
+    assert constraints["unresolved_event"] == phrase
+    assert select_template(question, constraints) is None
+
+
+def test_category_and_year_is_not_an_event(index):
+    constraints = index.constraints("Total revenue from Beverages in 1997?", CATEGORIES)
+    assert dates(constraints) == ("1997-01-01", "1997-12-31")
+    assert constraints["category"] == "Beverages"
+    assert "unresolved_event" not in constraints
+
+
+def test_find_event(index):
+    assert index.find_event("AOV during Winter Classics?").name == "Winter Classics 1997"
+    assert index.find_event("AOV during Winter 1997?") is None
+    assert index.find_event("Top 3 products by revenue all-time") is None
@@ -0,0 +1,97 @@
+import time
+
+from agent.lm_cache import CachedModule, LMCache, get_lm_cache, normalize_inputs
+
+
+def key(**inputs) -> str:
+    return LMCache.make_key("fingerprint", "lm", inputs)
+
+
+# --- Keys ---
+def test_key_ignores_whitespace_and_case_outside_quotes():
+    assert key(question="Revenue  in\n1997?") == key(question="revenue in 1997?")
+    assert key(question="Total for 'Beverages'") == key(question="TOTAL FOR 'Beverages'")
+
+
+def test_key_keeps_case_of_quoted_literals():
+    assert key(question="Total for 'Beverages'") != key(question="Total for 'beverages'")
+    assert key(question='Total for "Beverages"') != key(question='Total for "beverages"')
+
+
+def test_apostrophe_does_not_open_a_literal():
+    assert normalize_inputs({"question": "The CUSTOMER'S top order"}) == (("question", "the customer's top order"),)
+
+
+def test_key_keeps_case_of_schema_and_constraints():
+    assert key(question="q", db_schema="Orders(OrderID)") != key(question="q", db_schema="orders(orderid)")
+    assert key(question="q", constraints="{'category': 'Beverages'}") != \
+        key(question="q", constraints="{'category': 'beverages'}")
+    assert key(question="q", db_schema="Orders(OrderID,\n  CustomerID)") == \
+        key(question="q", db_schema="Orders(OrderID, CustomerID)")
+
+
+def test_key_depends_on_fingerprint_and_lm():
+    inputs = {"question": "q"}
+    assert LMCache.make_key("a", "lm", inputs) != LMCache.make_key("b", "lm", inputs)
+    assert LMCache.make_key("a", "lm", inputs) != LMCache.make_key("a", "other", inputs)
+
+
+# --- TTL and tiers ---
+def test_entries_expire_after_ttl(tmp_path):
+    cache = LMCache(ttl=0.05, disk_path=str(tmp_path / "lm.sqlite"))
+    cache.put("k", {"answer": "x"})
+    assert cache.get("k") == {"answer": "x"}
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1
+    # Expired entries are not served from the disk tier either.
+    assert LMCache(ttl=0.05, disk_path=str(tmp_path / "lm.sqlite")).get("k") is None
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "lm.sqlite")
+    LMCache(disk_path=path).put("k", {"answer": "x"})
+    other = LMCache(disk_path=path)
+    assert other.get("k") == {"answer": "x"}
+    assert other.stats()["disk_hits"] == 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LMCache(max_entries=2, ttl=None)
+    cache.put("a", {"answer": "1"})
+    cache.put("b", {"answer": "2"})
+    cache.get("a")
+    cache.put("c", {"answer": "3"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"answer": "1"}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_registry_is_keyed_on_ttl():
+    assert get_lm_cache(None, ttl=60) is get_lm_cache(None, ttl=60)
+    assert get_lm_cache(None, ttl=60) is not get_lm_cache(None, ttl=120)
+    assert get_lm_cache(None, ttl=120).ttl == 120
+
+
+# --- CachedModule ---
+def test_cached_module_calls_the_lm_once(stub_lm):
+    import dspy
+
+    class Counting(dspy.Module):
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+            self.predict = dspy.Predict("question -> answer")
+
+        def forward(self, question):
+            self.calls += 1
+            return self.predict(question=question)
+
+    module = Counting()
+    cached = CachedModule(module, LMCache(ttl=None))
+    first = cached(question="Which route?")
+    second = cached(question="which  ROUTE?")
+    assert first.answer == second.answer == "hybrid"
+    assert module.calls == 1
+    cached(question="Which route for 'Beverages'?")
+    assert module.calls == 2
@@ -0,0 +1,74 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from agent.tools.result_cache import ResultCache, db_version, normalize_sql
+from agent.tools.sqlite_tool import ConnectionPool, SQLiteTool
+
+QUERY = "SELECT COUNT(*) FROM Orders WHERE ShipCountry = 'Germany'"
+
+
+def key(sql: str) -> str:
+    return ResultCache.make_key(sql, (1, 2, 3))
+
+
+@pytest.mark.parametrize("variant", [
+    "select count(*) from orders where shipcountry = 'Germany'",
+    "SELECT COUNT(*)\n  FROM Orders\n WHERE ShipCountry='Germany';",
+    "SELECT COUNT(*) -- German orders\nFROM Orders /* all */ WHERE ShipCountry = 'Germany' ;;",
+])
+def test_formatting_variants_share_a_key(variant):
+    assert key(variant) == key(QUERY)
+
+
+@pytest.mark.parametrize("other", [
+    "SELECT COUNT(*) FROM Orders WHERE ShipCountry = 'germany'",
+    "SELECT COUNT(*) FROM Orders WHERE ShipCountry = 'Germany '",
+    "SELECT COUNT(*) FROM Orders WHERE ShipCountry = 'select count(*)'",
+    "SELECT COUNT(*) FROM Orders WHERE ShipCountry = 'France'",
+])
+def test_different_literals_do_not_collide(other):
+    assert key(other) != key(QUERY)
+
+
+def test_normalize_sql():
+    assert normalize_sql("select a, 'It''s -- not a comment', 1.5e3 from t where b = .5;") == (
+        "SELECT A , ? , ? FROM T WHERE B = ?", ("'It''s -- not a comment'", "1.5e3", ".5"))
+    assert normalize_sql('SELECT "Unit Price" FROM "Order Details"')[0] == 'SELECT "Unit Price" FROM "Order Details"'
+
+
+def test_key_depends_on_version_and_options():
+    assert ResultCache.make_key(QUERY, (1,)) != ResultCache.make_key(QUERY, (2,))
+    assert ResultCache.make_key(QUERY, (1,), (10,)) != ResultCache.make_key(QUERY, (1,), (20,))
+
+
+@pytest.fixture(params=["delete", "wal"])
+def db(request, northwind_db, tmp_path) -> str:
+    """A writable copy of the session database, in rollback-journal or WAL mode."""
+    path = str(tmp_path / "northwind.sqlite")
+    shutil.copy(northwind_db, path)
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode = {request.param};")
+    conn.close()
+    return path
+
+
+def test_write_changes_version_and_misses(db):
+    tool = SQLiteTool(db, pool=ConnectionPool(db), cache=ResultCache())
+    first = tool.execute_query(QUERY)
+    assert "cached" not in first
+    assert tool.execute_query(QUERY)["cached"] is True
+
+    before = db_version(db)
+    writer = sqlite3.connect(db)
+    try:
+        with writer:
+            writer.execute("UPDATE Orders SET ShipCountry = 'Germany' WHERE OrderID = "
+                           "(SELECT MIN(OrderID) FROM Orders WHERE ShipCountry <> 'Germany')")
+        assert db_version(db) != before
+        after = tool.execute_query(QUERY)
+    finally:
+        writer.close()
+    assert "cached" not in after
+    assert after["rows"][0][0] == first["rows"][0][0] + 1
@@ -0,0 +1,79 @@
+import os
+import shutil
+
+import pytest
+
+from agent.rag.retrieval import DocumentRetriever, clear_retriever_cache, get_retriever
+
+EXTRA_QUERIES = ["return policy", "unknownword", "", "Beverages Beverages Beverages returns"]
+
+
+def ranked(results) -> list:
+    return [(r["id"], pytest.approx(r["score"])) for r in results]
+
+
+@pytest.fixture(scope="module")
+def queries(sample_questions) -> list:
+    return [q["question"] for q in sample_questions] + EXTRA_QUERIES
+
+
+@pytest.fixture(scope="module")
+def retriever(docs_dir) -> DocumentRetriever:
+    return DocumentRetriever(docs_dir)
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_retrieve_many_matches_retrieve(retriever, queries, k):
+    batched = retriever.retrieve_many(queries, k=k)
+    assert [ranked(results) for results in batched] == [ranked(retriever.retrieve(q, k=k)) for q in queries]
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_early_termination_matches_exhaustive(retriever, queries, k):
+    for question in queries:
+        assert ranked(retriever.retrieve(question, k=k, early_termination=True)) == \
+            ranked(retriever.retrieve(question, k=k))
+
+
+def test_on_disk_index_matches_in_memory(retriever, queries, docs_dir, tmp_path):
+    on_disk = DocumentRetriever(docs_dir, index_dir=str(tmp_path / "index"))
+    for question in queries:
+        expected = retriever.retrieve(question, k=3)
+        found = on_disk.retrieve(question, k=3)
+        assert ranked(found) == ranked(expected)
+        assert [r["content"] for r in found] == [r["content"] for r in expected]
+
+
+def test_registry_rebuilds_on_content_change(docs_dir, tmp_path):
+    docs = str(tmp_path / "docs")
+    shutil.copytree(docs_dir, docs)
+    clear_retriever_cache()
+    try:
+        first = get_retriever(docs)
+        assert get_retriever(docs) is first
+        with open(os.path.join(docs, "extra.md"), "w") as f:
+            f.write("## Zanzibar\nZanzibar shipments are final sale.\n")
+        second = get_retriever(docs)
+        assert second is not first
+        assert second.retrieve("zanzibar", k=1)[0]["id"].startswith("extra")
+    finally:
+        clear_retriever_cache()
+
+
+@pytest.mark.parametrize("k", [1, 5, 400])
+def test_small_index_matches_numpy_index(k):
+    import random
+
+    from agent.rag.bm25 import SmallBM25Index
+    from agent.rag.chunking import ChunkTable
+    from agent.rag.index import BM25Index
+
+    rng = random.Random(0)
+    # Few distinct words, so there are ties, common terms and chunks no query matches.
+    texts = [" ".join(f"w{rng.randint(0, 40)}" for _ in range(rng.randint(0, 30))) for _ in range(300)]
+    small = SmallBM25Index.build(ChunkTable.from_texts(texts))
+    dense = BM25Index.build(ChunkTable.from_texts(texts))
+    queries = [[f"w{rng.randint(0, 45)}" for _ in range(rng.randint(0, 4))] for _ in range(200)]
+    for tokens in queries:
+        docs, scores = dense.top_k(tokens, k)
+        assert small.top_k(tokens, k) == ([int(d) for d in docs], [float(s) for s in scores])
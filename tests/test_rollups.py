@@ -0,0 +1,106 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from agent.sql_templates import TEMPLATES
+from agent.tools.rollups import refresh_rollups, rollups_fresh
+from agent.tools.sql_eval import canonical_rows, rows_match
+from agent.tools.sqlite_tool import ConnectionPool, SQLiteTool
+
+CONSTRAINTS = [
+    {"start_date": "1997-01-01", "end_date": "1997-12-31", "category": "Beverages", "limit": 3},
+    {"start_date": "1997-06-01", "end_date": "1997-06-30", "category": "Condiments", "limit": 1},
+    {"start_date": "1996-07-04", "end_date": "1998-05-06", "category": "Seafood", "limit": 10, "cost_ratio": 0.6},
+    # No orders in range.
+    {"start_date": "2001-01-01", "end_date": "2001-12-31", "category": "Beverages", "limit": 1},
+]
+
+
+@pytest.fixture
+def db(northwind_db, tmp_path) -> str:
+    """A writable copy of the session database."""
+    path = str(tmp_path / "northwind.sqlite")
+    shutil.copy(northwind_db, path)
+    return path
+
+
+def run(tool: SQLiteTool, sql: str, params: tuple) -> list:
+    result = tool.execute_query(sql, params, max_rows=None, max_bytes=None, timeout=None,
+                                max_vm_steps=None, max_plan_rows=None)
+    assert result["error"] is None, result["error"]
+    return canonical_rows(result["rows"])
+
+
+def assert_templates_match(tool: SQLiteTool):
+    for template in TEMPLATES:
+        if template.rollup_sql is None:
+            continue
+        for constraints in CONSTRAINTS:
+            params = template.bind(constraints)
+            assert rows_match(run(tool, template.rollup_sql, params), run(tool, template.sql, params)), \
+                (template.name, constraints)
+
+
+def test_rollup_templates_match_base_tables(db):
+    tool = SQLiteTool(db, pool=ConnectionPool(db))
+    tool.materialize_rollups(rebuild=True)
+    assert_templates_match(tool)
+
+
+def test_incremental_refresh_matches_rebuild(db):
+    conn = sqlite3.connect(db)
+    try:
+        refresh_rollups(conn)
+        # Append copies of the last 50 orders, dated in 1997, with new OrderIDs.
+        with conn:
+            last = conn.execute("SELECT MAX(OrderID) FROM Orders").fetchone()[0]
+            conn.execute("INSERT INTO Orders SELECT OrderID + 1000, CustomerID, EmployeeID, '1997-03-15', "
+                         "RequiredDate, ShippedDate, ShipVia, Freight, ShipName, ShipAddress, ShipCity, "
+                         "ShipRegion, ShipPostalCode, ShipCountry FROM Orders WHERE OrderID > ?", (last - 50,))
+            conn.execute('INSERT INTO "Order Details" SELECT OrderID + 1000, ProductID, UnitPrice, Quantity, '
+                         'Discount FROM "Order Details" WHERE OrderID > ?', (last - 50,))
+        assert not rollups_fresh(conn)
+        stats = refresh_rollups(conn)
+        assert (stats["orders_from"], stats["orders_to"]) == (last, last + 1000)
+        assert rollups_fresh(conn)
+    finally:
+        conn.close()
+    assert_templates_match(SQLiteTool(db, pool=ConnectionPool(db)))
+
+
+@pytest.mark.parametrize("edit", [
+    'UPDATE "Order Details" SET Quantity = Quantity + 1 WHERE OrderID = (SELECT MIN(OrderID) FROM Orders)',
+    'DELETE FROM "Order Details" WHERE OrderID = (SELECT MIN(OrderID) FROM Orders)',
+    "UPDATE Orders SET OrderDate = '1997-03-15' WHERE OrderID = (SELECT MIN(OrderID) FROM Orders)",
+])
+def test_edit_of_loaded_lines_makes_rollups_stale(db, edit):
+    tool = SQLiteTool(db, pool=ConnectionPool(db))
+    tool.materialize_rollups(rebuild=True)
+    assert tool.rollups_ready()
+    conn = sqlite3.connect(db)
+    try:
+        with conn:
+            conn.execute(edit)
+        assert not rollups_fresh(conn)
+        # Rebuilt, since the edit cannot be folded in incrementally.
+        assert refresh_rollups(conn)["orders_from"] == 0
+        assert rollups_fresh(conn)
+    finally:
+        conn.close()
+    assert tool.rollups_ready()
+    assert_templates_match(tool)
+
+
+def test_tool_stops_using_edited_rollups(db):
+    tool = SQLiteTool(db, pool=ConnectionPool(db))
+    tool.materialize_rollups(rebuild=True)
+    assert tool.rollups_ready()
+    conn = sqlite3.connect(db)
+    try:
+        with conn:
+            conn.execute('UPDATE "Order Details" SET UnitPrice = UnitPrice * 2 WHERE OrderID = '
+                         '(SELECT MAX(OrderID) FROM Orders)')
+    finally:
+        conn.close()
+    assert not tool.rollups_ready()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from agent.router import MIN_CONFIDENCE, Router, clear_router_cache, get_router
+from agent.tools.sqlite_tool import ConnectionPool, SQLiteTool
+
+
+@pytest.fixture(scope="module")
+def router(docs_dir, northwind_db) -> Router:
+    return Router.from_sources(docs_dir, SQLiteTool(northwind_db).get_schema_info())
+
+
+@pytest.fixture
+def registry():
+    clear_router_cache()
+    yield
+    clear_router_cache()
+
+
+@pytest.mark.parametrize("question, route", [
+    ("According to the product policy, what is the return window (days) for unopened Beverages?", "rag"),
+    ("Top 3 products by total revenue all-time.", "sql"),
+    ("Using the AOV definition from the KPI docs, what was the Average Order Value during "
+     "'Winter Classics 1997'?", "hybrid"),
+    ("Total revenue from the Beverages category during Summer Beverages 1997 dates.", "hybrid"),
+])
+def test_rule_routes(router, question, route):
+    scored = router.score(question)
+    assert scored.route == route
+    assert scored.confidence >= MIN_CONFIDENCE
+
+
+def test_scores(router):
+    scored = router.score("According to the policy, what was the revenue in 1997?")
+    assert (scored.route, scored.confidence) == ("hybrid", 1.0)
+    assert scored.doc >= 1.0 and scored.data >= 1.5
+    assert {"according to", "policy", "revenue"} <= set(scored.matches)
+
+    weak = router.score("Which products?")
+    assert weak.route == "sql" and weak.confidence < MIN_CONFIDENCE
+    assert router.score("Tell me something.").confidence == 0.0
+
+
+def test_lm_fallback_only_below_threshold(router, stub_lm):
+    # The stub LM answers "hybrid".
+    sure = router.route("Top 3 products by total revenue all-time.")
+    assert (sure.route, sure.source) == ("sql", "rules")
+    unsure = router.route("Which products?")
+    assert (unsure.route, unsure.source) == ("hybrid", "lm")
+    assert Router(router.vocabulary, min_confidence=0.0).route("Which products?").source == "rules"
+
+
+def test_rules_without_lm(router):
+    scored = router.route("Which products?")
+    assert (scored.route, scored.source) == ("sql", "rules")
+
+
+def test_registry_rebuilds_when_docs_change(registry, docs_dir, tmp_path):
+    docs = str(tmp_path / "docs")
+    shutil.copytree(docs_dir, docs)
+    router = get_router(docs)
+    assert get_router(docs) is router
+    assert "spring savers" not in router.vocabulary
+
+    with open(os.path.join(docs, "marketing_calendar.md"), "a", encoding="utf-8") as f:
+        f.write("\n## Spring Savers 1997\n- Dates: 1997-03-01 to 1997-03-31\n")
+    rebuilt = get_router(docs)
+    assert rebuilt is not router
+    assert rebuilt.vocabulary["spring savers"][0] == "doc"
+
+
+def test_registry_ignores_rollup_tables(registry, northwind_db, tmp_path):
+    db = str(tmp_path / "northwind.sqlite")
+    shutil.copy(northwind_db, db)
+    tool = SQLiteTool(db, pool=ConnectionPool(db))
+
+    def router():
+        return get_router(None, tool.get_schema_info, key=db, schema_version=tool.schema_version)
+
+    before = router()
+    assert router() is before
+    tool.materialize_rollups(rebuild=True)
+    after = router()
+    assert after is not before
+    assert after.vocabulary == before.vocabulary
+    assert not any(term.startswith(("kpi_", "kpi daily")) for term in after.vocabulary)
+
+    conn = sqlite3.connect(db)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE Shippers2 (ShipperID INTEGER PRIMARY KEY, CompanyName TEXT)")
+    finally:
+        conn.close()
+    assert "shippers2" in router().vocabulary
@@ -0,0 +1,152 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import run_agent_hybrid
+from run_agent_hybrid import OrderedWriter, read_done_ids, run_batch, shard_of, truncate_partial_line
+
+
+class ScriptedApp:
+    """Stands in for the graph: answers each question with its id, after
+    waiting for the question's `delays` entry in seconds, or until `release`
+    is set for the ids in `hang`."""
+
+    def __init__(self, delays=None, hang=()):
+        self.delays = delays or {}
+        self.hang = set(hang)
+        self.release = threading.Event()
+
+    def invoke(self, state):
+        question_id = state["question"]
+        if question_id in self.hang:
+            self.release.wait(timeout=10)
+        time.sleep(self.delays.get(question_id, 0))
+        return {"final_answer": f"answer {question_id}", "citations": []}
+
+
+def items(ids):
+    return [({"id": question_id, "question": question_id}, None) for question_id in ids]
+
+
+def read_ids(path) -> list:
+    with open(path) as f:
+        return [json.loads(line)["id"] for line in f]
+
+
+@pytest.fixture
+def quiet(monkeypatch):
+    monkeypatch.setattr(run_agent_hybrid.console, "quiet", True)
+
+
+@pytest.fixture
+def runner(monkeypatch, quiet, northwind_db, docs_dir):
+    """Runs run_agent_hybrid's CLI on the session database."""
+    import agent.graph_hybrid as graph_hybrid
+
+    monkeypatch.setattr(graph_hybrid, "DB_PATH", northwind_db)
+    monkeypatch.setattr(graph_hybrid, "DOCS_PATH", docs_dir)
+
+    def run(*args):
+        run_agent_hybrid.main(["--engine", "inline", *args], standalone_mode=False)
+    return run
+
+
+def test_ordered_writer_writes_in_input_order():
+    out, traces = io.StringIO(), io.StringIO()
+    writer = OrderedWriter(out, traces, fsync_every=10 ** 6)
+    writer.add(2, {"id": "c"}, {"id": "c"})
+    writer.add(0, {"id": "a"}, {"id": "a"})
+    assert [json.loads(line)["id"] for line in out.getvalue().splitlines()] == ["a"]
+    writer.add(3, {"id": "d"}, {"id": "d"})
+    writer.add(1, {"id": "b"}, {"id": "b"})
+    assert [json.loads(line)["id"] for line in out.getvalue().splitlines()] == ["a", "b", "c", "d"]
+    assert traces.getvalue() == out.getvalue()
+    assert writer.written == 4
+
+
+def test_ordered_writer_keeps_finished_results_on_abort(tmp_path):
+    with open(tmp_path / "out.jsonl", "w") as f:
+        writer = OrderedWriter(f)
+        writer.add(1, {"id": "b"})
+        writer.add(3, {"id": "d"})
+        writer.close()
+    assert read_ids(tmp_path / "out.jsonl") == ["b", "d"]
+
+
+def test_out_of_order_completions_are_written_in_order(quiet):
+    app = ScriptedApp(delays={"q0": 0.2, "q1": 0.1})
+    finished = []
+    writer_out = io.StringIO()
+    writer = OrderedWriter(writer_out, fsync_every=10 ** 6)
+
+    def emit(index, result, record):
+        finished.append(result["id"])
+        writer.add(index, result, record)
+
+    run_batch(app, items(["q0", "q1", "q2", "q3"]), workers=4, emit=emit)
+    assert finished[-1] == "q0"
+    assert [json.loads(line)["id"] for line in writer_out.getvalue().splitlines()] == ["q0", "q1", "q2", "q3"]
+
+
+def test_truncate_partial_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "a"}\n{"id": "b"}\n{"id": "c", "final_ans')
+    assert read_done_ids(str(path)) == {"a", "b"}
+    assert path.read_text() == '{"id": "a"}\n{"id": "b"}\n'
+    assert read_done_ids(str(tmp_path / "missing.jsonl")) == set()
+    assert truncate_partial_line(str(path)) == [b'{"id": "a"}\n', b'{"id": "b"}\n']
+
+
+def test_resume_after_partial_line(runner, tmp_path, sample_questions):
+    batch = "sample_questions_hybrid_eval.jsonl"
+    full, out = tmp_path / "full.jsonl", tmp_path / "out.jsonl"
+    runner("--batch", batch, "--out", str(full))
+    lines = full.read_text().splitlines(keepends=True)
+    # A crash after two results, halfway through writing the third.
+    out.write_text("".join(lines[:2]) + lines[2][:20])
+
+    runner("--batch", batch, "--out", str(out), "--resume")
+    assert out.read_text() == full.read_text()
+    assert len(read_ids(tmp_path / "out.trace.jsonl")) == len(sample_questions) - 2
+
+
+def test_shards_are_disjoint_and_cover_every_question(runner, tmp_path, sample_questions):
+    shards = []
+    for shard in range(3):
+        out = tmp_path / f"shard{shard}.jsonl"
+        runner("--batch", "sample_questions_hybrid_eval.jsonl", "--out", str(out), "--shard", f"{shard}/3")
+        shards.append(read_ids(out))
+    ids = [q["id"] for q in sample_questions]
+    assert sorted(sum(shards, [])) == sorted(ids)
+    assert all(shard == [i for i in ids if i in shard] for shard in shards)
+
+
+def test_shard_of_is_stable():
+    ids = [f"q{i}" for i in range(1000)]
+    assignment = [shard_of(question_id, 4) for question_id in ids]
+    assert set(assignment) == {0, 1, 2, 3}
+    # sha1-based, not hash(): the same on every machine and run.
+    assert assignment[:3] == [3, 2, 3]
+    assert shard_of("hybrid_aov_winter_1997", 4) == 3
+
+
+def test_hung_question_times_out_and_the_rest_finish(quiet):
+    app = ScriptedApp(hang={"q1"})
+    results = {}
+
+    def emit(index, result, record):
+        results[index] = (result, record)
+
+    start = time.monotonic()
+    try:
+        # One worker: the questions after q1 only run because its pool is replaced.
+        run_batch(app, items(["q0", "q1", "q2", "q3"]), workers=1, timeout=0.3, emit=emit)
+    finally:
+        app.release.set()
+    assert time.monotonic() - start < 5
+    assert sorted(results) == [0, 1, 2, 3]
+    assert "timed out" in results[1][0]["final_answer"] and results[1][1]["status"] == "timeout"
+    assert [results[i][0]["final_answer"] for i in (0, 2, 3)] == ["answer q0", "answer q2", "answer q3"]
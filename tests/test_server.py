@@ -0,0 +1,183 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+import run_agent_hybrid
+import serve_agent_hybrid
+from serve_agent_hybrid import AgentHTTPServer, AgentServer
+
+RECORD_KEYS = {"id", "final_answer", "sql", "confidence", "explanation", "citations"}
+
+
+class BlockingApp:
+    """Stands in for the graph: each invoke waits until `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def invoke(self, state):
+        self.release.wait(timeout=10)
+        return {"final_answer": "ok", "citations": []}
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def stop(server):
+    server.shutdown()
+    server.server_close()
+    server.agent.close()
+
+
+def request(port, method, path, body=None, headers=None):
+    """(status, parsed JSON body, response headers); `headers` are sent verbatim."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.putrequest(method, path)
+        for name, value in (headers or {}).items():
+            conn.putheader(name, value)
+        if body is not None and "Content-Length" not in (headers or {}):
+            conn.putheader("Content-Length", str(len(body)))
+        conn.endheaders(body)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read()), response.headers
+    finally:
+        conn.close()
+
+
+def post(port, payload):
+    return request(port, "POST", "/ask", json.dumps(payload).encode("utf-8"))
+
+
+def wait_for(agent, **expected):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        stats = agent.stats()
+        if all(stats[key] == value for key, value in expected.items()):
+            return
+        time.sleep(0.01)
+    pytest.fail(f"server never reached {expected}: {agent.stats()}")
+
+
+@pytest.fixture
+def agent_server(monkeypatch, northwind_db, docs_dir):
+    import agent.graph_hybrid as graph_hybrid
+
+    monkeypatch.setattr(graph_hybrid, "DB_PATH", northwind_db)
+    monkeypatch.setattr(graph_hybrid, "DOCS_PATH", docs_dir)
+    monkeypatch.setattr(run_agent_hybrid.console, "quiet", True)
+    server = serve_agent_hybrid.make_server(port=0, engine="inline", workers=2, queue_size=4, batch_size=4)
+    port = serve(server)
+    yield server, port
+    stop(server)
+
+
+@pytest.fixture
+def blocked_server(monkeypatch, request):
+    """One worker and a queue of one (unless parametrized with other AgentServer
+    options), running an app that blocks until released."""
+    monkeypatch.setattr(run_agent_hybrid.console, "quiet", True)
+    options = {"workers": 1, "queue_size": 1, "batch_size": 1, **getattr(request, "param", {})}
+    app = BlockingApp()
+    server = AgentHTTPServer(("127.0.0.1", 0), AgentServer(app, **options).start())
+    port = serve(server)
+    yield server, port, app
+    app.release.set()
+    stop(server)
+
+
+def test_ask_single_and_list(agent_server, sample_questions):
+    _, port = agent_server
+    status, record, _ = post(port, sample_questions[0])
+    assert status == 200
+    assert set(record) == RECORD_KEYS and record["id"] == sample_questions[0]["id"]
+
+    status, records, _ = post(port, sample_questions[:3])
+    assert status == 200
+    assert [r["id"] for r in records] == [q["id"] for q in sample_questions[:3]]
+    assert all(set(r) == RECORD_KEYS for r in records)
+
+
+def test_stats_counts_requests(agent_server, sample_questions):
+    _, port = agent_server
+    post(port, sample_questions[:2])
+    status, stats, _ = request(port, "GET", "/stats")
+    assert status == 200
+    assert stats["requests"] == 1 and stats["questions"] == 2
+    assert stats["queued"] == 0 and stats["running"] == 0
+    assert stats["queue_size"] == 4 and stats["workers"] == 2
+    assert {"batches", "mean_batch_size", "nodes", "lm_cache", "rejected"} <= set(stats)
+
+
+def test_full_queue_gets_503(blocked_server):
+    server, port, app = blocked_server
+    answers = []
+
+    def ask(question_id):
+        answers.append(post(port, {"id": question_id, "question": "?"})[0])
+
+    clients = [threading.Thread(target=ask, args=(f"q{i}",)) for i in range(2)]
+    clients[0].start()
+    wait_for(server.agent, running=1)
+    clients[1].start()
+    wait_for(server.agent, queued=1)
+
+    status, body, headers = post(port, {"id": "q2", "question": "?"})
+    assert status == 503
+    assert headers["Retry-After"] == str(serve_agent_hybrid.RETRY_AFTER_S)
+    assert server.agent.stats()["rejected"] == 1
+
+    app.release.set()
+    for client in clients:
+        client.join(timeout=10)
+    assert answers == [200, 200]
+
+
+@pytest.mark.parametrize("blocked_server", [{"queue_size": 4, "timeout": 0.3}], indirect=True)
+def test_request_shares_one_deadline(blocked_server):
+    server, port, app = blocked_server
+    questions = [{"id": f"q{i}", "question": "?"} for i in range(4)]
+    start = time.monotonic()
+    status, records, _ = post(port, questions)
+    elapsed = time.monotonic() - start
+    assert status == 200
+    # One timeout for the request, not one per question.
+    assert elapsed < 4 * 0.3
+    assert [r["id"] for r in records] == [q["id"] for q in questions]
+    assert all("timed out" in r["final_answer"] for r in records)
+    assert server.agent.stats()["timeouts"] == 4
+
+
+def test_more_questions_than_queue_gets_413(blocked_server):
+    server, port, app = blocked_server
+    status, body, headers = post(port, [{"id": "a", "question": "?"}, {"id": "b", "question": "?"}])
+    assert status == 413
+    assert "Retry-After" not in headers
+    assert server.agent.stats()["requests"] == 0
+
+
+@pytest.mark.parametrize("body, headers", [
+    (b"{not json", None),
+    (b'{"id": 1}', None),
+    (b"[]", None),
+    (b"", {"Content-Length": "abc"}),
+    (b"", {"Content-Length": "-5"}),
+])
+def test_bad_request_gets_400(blocked_server, body, headers):
+    _, port, _ = blocked_server
+    status, response, _ = request(port, "POST", "/ask", body, headers)
+    assert status == 400
+    assert "error" in response
+
+
+def test_parse_content_length():
+    assert serve_agent_hybrid.parse_content_length(None) == 0
+    assert serve_agent_hybrid.parse_content_length(" 12 ") == 12
+    for value in ("", "abc", "-5", "1.5", "²"):
+        with pytest.raises(ValueError):
+            serve_agent_hybrid.parse_content_length(value)
@@ -0,0 +1,112 @@
+import sqlite3
+
+import pytest
+
+import run_agent_hybrid
+from agent.constraints import ConstraintIndex
+from agent.sql_templates import PARAM_DEFAULTS, get_template, inline_params, select_template, sql_literal
+from agent.tools.sqlite_tool import SQLiteTool
+
+
+@pytest.fixture(scope="module")
+def index(docs_dir) -> ConstraintIndex:
+    return ConstraintIndex.from_docs(docs_dir)
+
+
+@pytest.fixture(scope="module")
+def categories(northwind_db) -> list:
+    return [row[0] for row in SQLiteTool(northwind_db).execute_query("SELECT CategoryName FROM Categories")["rows"]]
+
+
+@pytest.fixture
+def select(index, categories):
+    """question -> (template name, bound params), or None."""
+    def select(question):
+        selected = select_template(question, index.constraints(question, categories))
+        return selected and (selected[0].name, selected[1])
+    return select
+
+
+@pytest.mark.parametrize("question, name", [
+    ("Top 3 products by total revenue all-time.", "top_products_by_revenue"),
+    ("Top 5 products by revenue in 1997.", "top_products_by_revenue_in_range"),
+    ("Total revenue during 'Summer Beverages 1997'.", "revenue_in_range"),
+    ("Total revenue from the 'Beverages' category during 'Summer Beverages 1997' dates.",
+     "revenue_by_category_in_range"),
+    ("During 'Summer Beverages 1997', which product category had the highest total quantity sold?",
+     "top_category_by_quantity_in_range"),
+    ("What was the Average Order Value during 'Winter Classics 1997'?", "average_order_value_in_range"),
+    ("Who was the top customer by gross margin in 1997?", "top_customer_by_gross_margin_in_range"),
+])
+def test_template_by_phrasing(select, question, name):
+    assert select(question)[0] == name
+
+
+@pytest.mark.parametrize("question", [
+    # No KPI, or a filter no template binds.
+    "Which customers are in Berlin?",
+    "Total revenue from the 'Beverages' category all-time.",
+])
+def test_no_template(select, question):
+    assert select(question) is None
+
+
+def test_param_defaults(select):
+    name, params = select("Who was the top customer by gross margin in 1997?")
+    assert params == (PARAM_DEFAULTS["cost_ratio"], "1997-01-01", "1998-01-01", PARAM_DEFAULTS["limit"])
+    assert PARAM_DEFAULTS == {"limit": 1, "cost_ratio": 0.7}
+    assert select("Top 3 products by total revenue all-time.")[1] == (3,)
+    assert select("Which products earned the most revenue all-time?")[1] == (1,)
+
+
+@pytest.mark.parametrize("assumption, ratio", [
+    ("Assume CostOfGoods is approximated by 70% of UnitPrice.", 0.7),
+    ("Assume CostOfGoods is 65 percent of UnitPrice.", 0.65),
+    ("Assume CostOfGoods is 62.5% of UnitPrice.", 0.625),
+    ("Use a cost ratio of 0.6.", 0.6),
+    ("Use a cost ratio of .55.", 0.55),
+])
+def test_stated_cost_ratio_is_bound(index, select, assumption, ratio):
+    question = f"Who was the top customer by gross margin in 1997? {assumption}"
+    assert index.constraints(question)["cost_ratio"] == ratio
+    assert select(question)[1][0] == ratio
+
+
+@pytest.mark.parametrize("assumption", [
+    "Use the category average cost.",
+    "Assume CostOfGoods is 1.5 times UnitPrice.",
+    "Assume CostOfGoods is 150% of UnitPrice.",
+])
+def test_unreadable_cost_assumption_skips_the_template(index, select, assumption):
+    question = f"Who was the top customer by gross margin in 1997? {assumption}"
+    assert "cost_ratio" not in index.constraints(question)
+    assert select(question) is None
+
+
+def test_inline_params():
+    sql = "SELECT '?', \"a?\" FROM t -- ?\nWHERE x = ? AND y = ? /* ? */ AND z = ? AND w = ?"
+    assert inline_params(sql, ("O'Brien", 1.5, None, 3)) == (
+        "SELECT '?', \"a?\" FROM t -- ?\nWHERE x = 'O''Brien' AND y = 1.5 /* ? */ AND z = NULL AND w = 3")
+    assert inline_params(sql, ()) == sql
+    assert sql_literal(True) == "1"
+
+
+def test_output_record_has_runnable_sql(monkeypatch, northwind_db, docs_dir, sample_questions):
+    import agent.graph_hybrid as graph_hybrid
+
+    monkeypatch.setattr(graph_hybrid, "DB_PATH", northwind_db)
+    monkeypatch.setattr(graph_hybrid, "DOCS_PATH", docs_dir)
+    monkeypatch.setattr(run_agent_hybrid.console, "quiet", True)
+    question = next(q for q in sample_questions if q["id"] == "hybrid_revenue_beverages_summer_1997")
+    planned = graph_hybrid.plan_constraints({"question": question["question"]})
+    record = run_agent_hybrid.run_agent(question, graph_hybrid.build_graph(engine="inline"))
+
+    assert "sql_params" not in record and "?" not in record["sql"]
+    template = get_template(planned["template"])
+    assert record["sql"] == inline_params(template.sql, planned["sql_params"])
+    expected = SQLiteTool(northwind_db).execute_query(template.sql, planned["sql_params"])["rows"]
+    conn = sqlite3.connect(northwind_db)
+    try:
+        assert conn.execute(record["sql"]).fetchall() == expected
+    finally:
+        conn.close()
@@ -0,0 +1,63 @@
+import pytest
+
+from agent.tools.sqlite_tool import SQLiteTool, _plan_cost, _table_aliases
+
+CROSS_JOIN = 'SELECT COUNT(*) FROM Orders AS o, "Order Details" AS od'
+# Runs for a long time and many VM steps without touching a table.
+LONG_QUERY = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) "
+              "SELECT COUNT(*) FROM n")
+
+
+@pytest.fixture(scope="module")
+def tool(northwind_db) -> SQLiteTool:
+    return SQLiteTool(northwind_db)
+
+
+def row_estimate(tool: SQLiteTool, table: str) -> int:
+    return tool.get_schema_info().tables[table].row_estimate
+
+
+def test_cross_join_is_rejected_by_cost(tool):
+    orders, lines = row_estimate(tool, "Orders"), row_estimate(tool, "Order Details")
+    estimated, scanned = tool.estimate_cost(CROSS_JOIN)
+    assert estimated == orders * lines
+    assert sorted(name for name, _ in scanned) == ["Order Details", "Orders"]
+
+    result = tool.execute_query(CROSS_JOIN, max_plan_rows=estimated - 1)
+    assert result["error_type"] == "cost"
+    assert "Query rejected" in result["error"] and result["rows"] == []
+    assert tool.execute_query(CROSS_JOIN, max_plan_rows=estimated)["error"] is None
+
+
+@pytest.mark.parametrize("detail", [
+    "SCAN o",
+    "SCAN TABLE Orders AS o",
+    "SCAN TABLE Orders AS o USING COVERING INDEX idx_orders_date",
+    "SCAN TABLE Orders",
+    "SCAN Orders USING INDEX idx_orders_date",
+])
+def test_plan_cost_reads_old_and_new_scan_formats(tool, detail):
+    query = "SELECT * FROM Orders AS o"
+    estimated, scanned = _plan_cost([(2, 0, detail)], tool.get_schema_info(), _table_aliases(query))
+    assert estimated == row_estimate(tool, "Orders")
+    assert scanned == [("Orders", estimated)]
+
+
+def test_unmapped_scan_is_reported(tool, capsys):
+    estimated, _ = _plan_cost([(2, 0, "SCAN MYSTERY FORMAT")], tool.get_schema_info(), {})
+    assert estimated == 0
+    assert "could not map plan step" in capsys.readouterr().out
+
+
+def test_time_budget_interrupts(tool):
+    result = tool.execute_query(LONG_QUERY, timeout=0.05, max_vm_steps=None)
+    assert result["error_type"] == "timeout"
+    assert "time budget" in result["error"]
+
+
+def test_vm_step_budget_interrupts(tool):
+    result = tool.execute_query(LONG_QUERY, timeout=None, max_vm_steps=100_000)
+    assert result["error_type"] == "vm_steps"
+    assert "VM steps" in result["error"]
+    # The connection is usable again afterwards.
+    assert tool.execute_query("SELECT 1")["rows"] == [(1,)]